@@ -34,4 +34,13 @@ class SDEventHandler {
    */
   onNewStreamDeckConnection = () => { }
 
+  /**
+   * This method will be called when the Stream Deck plugin asks for the state
+   * of every device at once. Add your current state update message to `states`,
+   * keyed by its event name.
+   *
+   * Implement this in your subclass if you report state to the Stream Deck.
+   */
+  collectState = (states) => { }
+
 }
\ No newline at end of file
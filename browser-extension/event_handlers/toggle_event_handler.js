@@ -7,6 +7,13 @@
  */
 class ToggleEventHandler extends SDEventHandler {
 
+  constructor(connectionManager) {
+    super(connectionManager);
+
+    // While collecting states for the plugin, our state updates are added here instead of being sent.
+    this._collectedStates = null;
+  }
+
   /**
    * This method should return a clickable button used to toggle your device.
    * We also assume that the current mute state can be read from this element,
@@ -40,7 +47,25 @@ class ToggleEventHandler extends SDEventHandler {
       event: eventName,
       muted: Boolean(isMuted)
     };
-    this._connectionManager.sendMessage(message);
+    if (this._collectedStates) {
+      this._collectedStates[eventName] = message;
+    } else {
+      this._connectionManager.sendMessage(message);
+    }
+  }
+
+  collectState = (states) => {
+    this._collectedStates = states;
+    try {
+      this._sendMuteState();
+    } catch (e) {
+      // If our control isn't in the Meet UI, we leave our state out and the plugin shows us as disconnected.
+      if (!(e instanceof ControlsNotFoundError)) {
+        throw e;
+      }
+    } finally {
+      this._collectedStates = null;
+    }
   }
 
   initialize = () => {
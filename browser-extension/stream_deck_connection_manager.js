@@ -3,6 +3,21 @@ const STREAM_DECK_PORT = 2394;
 
 const RECONNECTION_INTERVAL_SECS = 2;
 
+// How often we check whether this tab has joined or left a call.
+const CALL_STATUS_POLL_INTERVAL_SECS = 2;
+
+// Meet's Leave Call button, which is only present while we're in a call.
+const LEAVE_CALL_BUTTON_SELECTOR = '[jsname="CQylAd"]';
+
+// Our reply to the plugin's heartbeats, which tells it this tab is still alive.
+const HEARTBEAT_MESSAGE = { event: "heartbeat" };
+
+// The wire protocol versions we can read. See the plugin's browser_protocol.py.
+const SUPPORTED_PROTOCOL_VERSIONS = [1, 2];
+
+// The compression we can read on protocol version 2, as a DecompressionStream format.
+const COMPRESSION_FORMAT = "deflate-raw";
+
 /**
  * Manages our websocket that connects this browser extension to the Stream Deck plugin.
  */
@@ -13,6 +28,16 @@ class StreamDeckConnectionMananger {
 
     // Any SDEventHandlers registered to receive inbound events from the Stream Deck.
     this._eventHandlers = [];
+
+    // Identifies this tab to the Stream Deck plugin, which may be connected to several Meet tabs.
+    this._tabId = crypto.randomUUID();
+    this._inCall = false;
+
+    // The plugin's event type for each event code, once it's agreed to protocol version 2.
+    this._eventTypesByCode = {};
+
+    // Inbound frames are decoded one after another, since compressed ones are decoded asynchronously.
+    this._inboundFrames = Promise.resolve();
   }
 
   registerEventHandler = (eventHandler) => {
@@ -21,6 +46,7 @@ class StreamDeckConnectionMananger {
 
   initialize = () => {
     this._createWebsocket();
+    this._monitorTabStatus();
   }
 
   sendMessage = (message) => {
@@ -50,6 +76,105 @@ class StreamDeckConnectionMananger {
     });
   }
 
+  /**
+   * Answers the plugin's request for every device's state in one message.
+   */
+  _sendAllStates = (requestId) => {
+    const states = {};
+    this._eventHandlers.forEach((handler) => handler.collectState(states));
+    this.sendMessage({
+      event: "allStates",
+      replyTo: requestId,
+      states: states,
+    });
+  }
+
+  /**
+   * Tells the Stream Deck plugin whether this tab is in a call, and whether
+   * the user is looking at it, so the plugin can send commands to the meeting
+   * the user expects. We send a "hello" when we connect, then "tabStatus"
+   * messages whenever that changes.
+   */
+  _sendTabStatus = (eventName, active) => {
+    const message = {
+      event: eventName,
+      tabId: this._tabId,
+      inCall: this._inCall,
+      active: active,
+    };
+    if (eventName === "hello") {
+      // Tell the plugin we answer its heartbeats, so it can drop us promptly if we stop.
+      message.heartbeats = true;
+      message.supportedRequests = ["getAllStates"];
+      message.protocols = SUPPORTED_PROTOCOL_VERSIONS;
+      if (typeof DecompressionStream !== "undefined") {
+        message.compression = [COMPRESSION_FORMAT];
+      }
+    }
+    this.sendMessage(message);
+  }
+
+  /**
+   * Returns the messages in one frame from the plugin. On protocol version 1,
+   * every frame is one JSON message. On version 2, frames are JSON arrays of
+   * messages, which may be compressed into binary frames, and messages carry
+   * short codes ("e") in place of their event types.
+   */
+  _decodeFrame = async (data) => {
+    if (data instanceof Blob) {
+      const stream = data.stream().pipeThrough(new DecompressionStream(COMPRESSION_FORMAT));
+      data = await new Response(stream).text();
+    }
+    const parsed = JSON.parse(data);
+    const messages = Array.isArray(parsed) ? parsed : [parsed];
+    messages.forEach((message) => {
+      if (message.e !== undefined) {
+        message.event = this._eventTypesByCode[message.e];
+        delete message.e;
+      }
+    });
+    return messages;
+  }
+
+  _handleMessage = (jsonMessage) => {
+    if (jsonMessage.event === "welcome") {
+      this._eventTypesByCode = {};
+      Object.entries(jsonMessage.eventCodes || {}).forEach(([eventType, code]) => {
+        this._eventTypesByCode[code] = eventType;
+      });
+      return;
+    }
+    if (jsonMessage.event === "heartbeat") {
+      this.sendMessage(HEARTBEAT_MESSAGE);
+      return;
+    }
+    if (jsonMessage.event === "getAllStates") {
+      this._sendAllStates(jsonMessage.requestId);
+      return;
+    }
+    this._eventHandlers.forEach((handler) => handler.handleStreamDeckEvent(jsonMessage))
+  }
+
+  _isTabActive = () => {
+    return document.visibilityState === "visible";
+  }
+
+  _monitorTabStatus = () => {
+    document.addEventListener("visibilitychange", () => {
+      this._sendTabStatus("tabStatus", this._isTabActive());
+    });
+    window.addEventListener("focus", () => {
+      this._sendTabStatus("tabStatus", true);
+    });
+    setInterval(() => {
+      const inCall = Boolean(document.querySelector(LEAVE_CALL_BUTTON_SELECTOR));
+      if (inCall !== this._inCall) {
+        this._inCall = inCall;
+        this._sendTabStatus("tabStatus", this._isTabActive());
+      }
+    }, CALL_STATUS_POLL_INTERVAL_SECS * 1000);
+  }
+
   /**
    * Connect to our Stream Deck websocket and infinitely attempt to reconnect
    * if we're unsuccessful or the connection drops.
@@ -73,12 +198,18 @@ class StreamDeckConnectionMananger {
     };
 
     this._socket.onopen = () => {
+      // Every connection starts out on protocol version 1.
+      this._eventTypesByCode = {};
+      this._inCall = Boolean(document.querySelector(LEAVE_CALL_BUTTON_SELECTOR));
+      this._sendTabStatus("hello", this._isTabActive());
       this._attemptStateTransmission();
     };
 
     this._socket.onmessage = (event) => {
-      const jsonMessage = JSON.parse(event.data);
-      this._eventHandlers.forEach((handler) => handler.handleStreamDeckEvent(jsonMessage))
+      this._inboundFrames = this._inboundFrames
+        .then(() => this._decodeFrame(event.data))
+        .then((messages) => messages.forEach(this._handleMessage))
+        .catch((e) => console.error("Failed to handle a message from the Stream Deck plugin: ", e));
     };
   }
 
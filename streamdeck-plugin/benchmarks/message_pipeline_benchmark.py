@@ -0,0 +1,212 @@
+"""
+Measures the latency and throughput of our plugin's message pipeline.
+
+We run the real BrowserWebsocketServer and StreamDeckWebsocketClient, wired up
+with the real `register_handlers` from main.py, against in-process stand-ins for
+the Stream Deck desktop app and any number of Google Meet tabs. Everything talks
+over real localhost websockets.
+
+We report:
+  * Key press -> browser delivery latency: from the Stream Deck app sending a
+    keyUp until each Meet tab receives the resulting toggle command.
+  * Browser update -> setState latency: from a Meet tab sending a state update
+    until the Stream Deck app receives the resulting setState for every key.
+  * Throughput: key presses per second delivered to every tab, when the Stream
+    Deck app sends presses as fast as it can (with a cap on presses in flight).
+
+Run from the streamdeck-plugin directory, e.g.:
+    python benchmarks/message_pipeline_benchmark.py --tabs 3 --keys 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import websockets
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "src"))
+
+import json_codec  # noqa: E402
+from main import create_connections, register_handlers  # noqa: E402
+
+MIC_TOGGLE_ACTION = "com.chrisregado.googlemeet.togglemic"
+
+
+class FakeStreamDeckApp:
+    """
+    Stands in for the Stream Deck desktop app: accepts our plugin's connection,
+    sends it button events, and records the setState messages it receives.
+    """
+
+    def __init__(self) -> None:
+        self.registered = asyncio.Event()
+        self.set_state_arrivals: Dict[str, List[float]] = {}
+        self._websocket: websockets.ServerConnection | None = None
+        self._server: websockets.Server | None = None
+
+    async def start(self) -> int:
+        self._server = await websockets.serve(self._handle_plugin, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def send(self, event: dict) -> None:
+        await self._websocket.send(json_codec.dumps(event))
+
+    def close(self) -> None:
+        self._server.close()
+
+    async def _handle_plugin(self, websocket: websockets.ServerConnection) -> None:
+        self._websocket = websocket
+        async for message in websocket:
+            event = json_codec.loads(message)
+            if event.get("event") == "registerPlugin":
+                self.registered.set()
+            elif event.get("event") == "setState":
+                self.set_state_arrivals.setdefault(event["context"], []).append(time.perf_counter())
+
+
+class FakeMeetTab:
+    """
+    Stands in for a Google Meet tab running our browser extension: records when
+    each toggle command arrives, and can send mic state updates to the plugin.
+    """
+
+    def __init__(self) -> None:
+        self.toggle_arrivals: List[float] = []
+        self._websocket: websockets.ClientConnection | None = None
+        self._receive_task: asyncio.Task | None = None
+
+    async def connect(self, port: int) -> None:
+        self._websocket = await websockets.connect(f"ws://127.0.0.1:{port}")
+        self._receive_task = asyncio.create_task(self._receive_loop())
+
+    async def send_mic_state(self, muted: bool) -> None:
+        await self._websocket.send(json_codec.dumps({"event": "micMutedState", "muted": muted}))
+
+    async def close(self) -> None:
+        self._receive_task.cancel()
+        await self._websocket.close()
+
+    async def _receive_loop(self) -> None:
+        async for message in self._websocket:
+            if json_codec.loads(message).get("event") == "toggleMic":
+                self.toggle_arrivals.append(time.perf_counter())
+
+
+async def wait_for_condition(condition, timeout_secs: float = 10.0) -> None:
+    deadline = time.perf_counter() + timeout_secs
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Timed out waiting for the plugin to deliver our messages.")
+        await asyncio.sleep(0.0005)
+
+
+def format_latencies(name: str, latencies_secs: List[float]) -> str:
+    latencies_ms = sorted(latency * 1000 for latency in latencies_secs)
+    p99_index = min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.99))
+    return (f"{name}: n={len(latencies_ms)} p50={statistics.median(latencies_ms):.3f}ms"
+            f" p99={latencies_ms[p99_index]:.3f}ms max={latencies_ms[-1]:.3f}ms")
+
+
+async def measure_key_press_latency(stream_deck: FakeStreamDeckApp, tabs: List[FakeMeetTab],
+                                    presses: int) -> List[float]:
+    latencies = []
+    for press in range(presses):
+        sent_at = time.perf_counter()
+        await stream_deck.send({"event": "keyUp", "action": MIC_TOGGLE_ACTION, "context": "key_0"})
+        await wait_for_condition(lambda: all(len(tab.toggle_arrivals) > press for tab in tabs))
+        latencies.extend(tab.toggle_arrivals[press] - sent_at for tab in tabs)
+    return latencies
+
+
+async def measure_state_update_latency(stream_deck: FakeStreamDeckApp, tab: FakeMeetTab,
+                                       contexts: List[str], updates: int,
+                                       pace_secs: float) -> List[float]:
+    latencies = []
+    for update in range(updates):
+        arrivals_before = {context: len(stream_deck.set_state_arrivals.get(context, []))
+                           for context in contexts}
+        sent_at = time.perf_counter()
+        await tab.send_mic_state(muted=update % 2 == 0)
+        await wait_for_condition(lambda: all(
+            len(stream_deck.set_state_arrivals.get(context, [])) > arrivals_before[context]
+            for context in contexts))
+        latencies.extend(stream_deck.set_state_arrivals[context][-1] - sent_at for context in contexts)
+        # Leave a gap between updates so we measure latency rather than our coalescing window.
+        await asyncio.sleep(pace_secs)
+    return latencies
+
+
+async def measure_key_press_throughput(stream_deck: FakeStreamDeckApp, tabs: List[FakeMeetTab],
+                                       presses: int, max_outstanding: int = 32) -> float:
+    arrivals_before = [len(tab.toggle_arrivals) for tab in tabs]
+
+    def slowest_tab_deliveries() -> int:
+        return min(len(tab.toggle_arrivals) - before for tab, before in zip(tabs, arrivals_before))
+
+    started_at = time.perf_counter()
+    for press in range(presses):
+        # Cap the presses in flight, so we don't overflow the plugin's bounded outbound queues.
+        await wait_for_condition(lambda: press - slowest_tab_deliveries() < max_outstanding)
+        await stream_deck.send({"event": "keyUp", "action": MIC_TOGGLE_ACTION, "context": "key_0"})
+    await wait_for_condition(lambda: slowest_tab_deliveries() >= presses)
+    return presses / (time.perf_counter() - started_at)
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    stream_deck = FakeStreamDeckApp()
+    stream_deck_port = await stream_deck.start()
+
+    stream_deck_client, browser_manager = create_connections()
+    register_handlers(stream_deck_client, browser_manager)
+
+    browser_server = await browser_manager.start(hostname="127.0.0.1", port=0)
+    browser_port = browser_server.sockets[0].getsockname()[1]
+    stream_deck_task = asyncio.create_task(stream_deck_client.start(
+        port=stream_deck_port, register_event="registerPlugin", plugin_uuid="benchmark"))
+    await asyncio.wait_for(stream_deck.registered.wait(), timeout=10)
+
+    tabs = [FakeMeetTab() for _ in range(args.tabs)]
+    for tab in tabs:
+        await tab.connect(browser_port)
+    await wait_for_condition(lambda: browser_manager.num_connected_clients() == args.tabs)
+
+    contexts = [f"key_{index}" for index in range(args.keys)]
+    for context in contexts:
+        await stream_deck.send({"event": "willAppear", "action": MIC_TOGGLE_ACTION, "context": context})
+    await wait_for_condition(lambda: all(context in stream_deck.set_state_arrivals for context in contexts))
+
+    print(f"Benchmarking with {args.tabs} Meet tab(s), {args.keys} mic key(s),"
+          f" and JSON codec '{json_codec.CODEC_NAME}'.")
+    print(format_latencies("Key press -> browser delivery",
+                           await measure_key_press_latency(stream_deck, tabs, args.presses)))
+    print(format_latencies("Browser update -> setState",
+                           await measure_state_update_latency(stream_deck, tabs[0], contexts,
+                                                              args.updates, args.pace_ms / 1000)))
+    throughput = await measure_key_press_throughput(stream_deck, tabs, args.presses)
+    print(f"Key press throughput: {throughput:.0f} presses/sec"
+          f" ({throughput * args.tabs:.0f} browser messages/sec)")
+
+    for tab in tabs:
+        await tab.close()
+    stream_deck.close()
+    browser_server.close()
+    stream_deck_task.cancel()
+
+
+def parse_cli_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Stream Deck Google Meet plugin benchmarks")
+    parser.add_argument("--tabs", type=int, default=1, help="Number of fake Meet tabs")
+    parser.add_argument("--keys", type=int, default=1, help="Number of mic toggle keys on the Stream Deck")
+    parser.add_argument("--presses", type=int, default=500, help="Key presses per measurement")
+    parser.add_argument("--updates", type=int, default=200, help="Browser state updates to measure")
+    parser.add_argument("--pace-ms", type=float, default=25.0,
+                        help="Delay between browser state updates, in milliseconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_cli_args()))
@@ -0,0 +1,229 @@
+"""
+Replays a traffic log recorded with MEETPLUGIN_TRAFFIC_LOG (see
+src/traffic_recorder.py) through our plugin, to reproduce problems seen in a
+real session, or as a load test built from real traffic.
+
+We run the real BrowserWebsocketServer and StreamDeckWebsocketClient, wired up
+with the real `register_handlers` from main.py, as in our message pipeline
+benchmark. A stand-in Stream Deck app and one stand-in browser tab per recorded
+browser connection then send the recorded inbound frames, at the recorded times
+(scaled by --speed), or as fast as possible with --speed 0. When replaying as
+fast as possible, recorded disconnections are held back until the end, so the
+plugin has a chance to answer every connection.
+
+Replies to the plugin's requests (e.g. getAllStates) are sent with the request
+IDs of this run, so they're correlated as they were when recorded.
+
+We report how many frames we replayed, and how many frames the plugin sent back
+compared to the recording.
+
+Run from the streamdeck-plugin directory, e.g.:
+    python benchmarks/traffic_replay.py meetplugin-traffic.ndjson --speed 0
+"""
+
+import argparse
+import asyncio
+from collections import deque
+import os
+import sys
+import time
+from typing import Deque, Dict, List
+
+import websockets
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "src"))
+
+import json_codec  # noqa: E402
+from main import create_connections, register_handlers  # noqa: E402
+import metrics  # noqa: E402
+from traffic_recorder import (  # noqa: E402
+    BROWSER_LINK, CLOSED, INBOUND, OUTBOUND, SESSION, STREAM_DECK_LINK, TrafficRecord, read_records)
+
+
+class ReplayStreamDeckApp:
+    """
+    Stands in for the Stream Deck desktop app: accepts our plugin's connection,
+    sends it recorded frames, and counts the frames it sends back.
+    """
+
+    def __init__(self) -> None:
+        self.registered = asyncio.Event()
+        self.frames_received = 0
+        self._websocket: websockets.ServerConnection | None = None
+        self._server: websockets.Server | None = None
+
+    async def start(self) -> int:
+        self._server = await websockets.serve(self._handle_plugin, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def send(self, message: str) -> None:
+        await self._websocket.send(message)
+
+    def close(self) -> None:
+        self._server.close()
+
+    async def _handle_plugin(self, websocket: websockets.ServerConnection) -> None:
+        self._websocket = websocket
+        async for _ in websocket:
+            self.frames_received += 1
+            self.registered.set()
+
+
+class ReplayBrowserTab:
+    """
+    Stands in for one recorded browser extension connection: sends its recorded
+    frames, and counts the frames the plugin sends it.
+    """
+
+    def __init__(self) -> None:
+        self.frames_received = 0
+        self._websocket: websockets.ClientConnection | None = None
+        self._receive_task: asyncio.Task | None = None
+
+        # The IDs of the plugin's requests we haven't replayed a reply to yet, oldest first.
+        self._unanswered_request_ids: Deque[str] = deque()
+
+    async def connect(self, port: int) -> None:
+        self._websocket = await websockets.connect(f"ws://127.0.0.1:{port}")
+        self._receive_task = asyncio.create_task(self._receive_loop())
+
+    async def send(self, message: str | bytes) -> None:
+        if isinstance(message, str) and '"replyTo"' in message and self._unanswered_request_ids:
+            reply = json_codec.loads(message)
+            reply["replyTo"] = self._unanswered_request_ids.popleft()
+            message = json_codec.dumps(reply)
+        await self._websocket.send(message)
+
+    async def close(self) -> None:
+        self._receive_task.cancel()
+        await self._websocket.close()
+
+    async def _receive_loop(self) -> None:
+        async for message in self._websocket:
+            self.frames_received += 1
+            if '"requestId"' in message:
+                request_id = json_codec.loads(message).get("requestId")
+                if request_id is not None:
+                    self._unanswered_request_ids.append(request_id)
+
+
+def get_session(records: List[TrafficRecord], session: int) -> List[TrafficRecord]:
+    """
+    Returns the records of one of the log's sessions, by index (negative indices
+    count back from the latest).
+    """
+    sessions: List[List[TrafficRecord]] = [[]]
+    for record in records:
+        if record.kind == SESSION:
+            if sessions[-1]:
+                sessions.append([])
+        else:
+            sessions[-1].append(record)
+    return sessions[session]
+
+
+async def close_tab(tabs: Dict[int, ReplayBrowserTab], closed_tabs: List[ReplayBrowserTab], connection: int) -> None:
+    tab = tabs.pop(connection, None)
+    if tab:
+        await tab.close()
+        closed_tabs.append(tab)
+
+
+async def replay(records: List[TrafficRecord], speed: float, metrics_registry: metrics.MetricsRegistry) -> None:
+    stream_deck = ReplayStreamDeckApp()
+    stream_deck_port = await stream_deck.start()
+
+    stream_deck_client, browser_manager = create_connections(metrics_registry)
+    register_handlers(stream_deck_client, browser_manager)
+
+    browser_server = await browser_manager.start(hostname="127.0.0.1", port=0)
+    browser_port = browser_server.sockets[0].getsockname()[1]
+    stream_deck_task = asyncio.create_task(stream_deck_client.start(
+        port=stream_deck_port, register_event="registerPlugin", plugin_uuid="replay"))
+    await asyncio.wait_for(stream_deck.registered.wait(), timeout=10)
+
+    tabs: Dict[int, ReplayBrowserTab] = {}
+    closed_tabs: List[ReplayBrowserTab] = []
+    deferred_closes: List[int] = []
+    replayed_frames = {STREAM_DECK_LINK: 0, BROWSER_LINK: 0}
+    recorded_outbound_frames = {STREAM_DECK_LINK: 0, BROWSER_LINK: 0}
+
+    first_record_secs = records[0].secs if records else 0.0
+    started_at = time.perf_counter()
+    for record in records:
+        if record.kind == OUTBOUND:
+            recorded_outbound_frames[record.link] += 1
+            continue
+
+        if speed > 0:
+            delay = (record.secs - first_record_secs) / speed - (time.perf_counter() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if record.link == STREAM_DECK_LINK:
+            # We only have the one connection to the Stream Deck app, even if the recording reconnected.
+            if record.kind == INBOUND:
+                await stream_deck.send(record.message)
+                replayed_frames[STREAM_DECK_LINK] += 1
+        elif record.kind == CLOSED:
+            if speed > 0:
+                await close_tab(tabs, closed_tabs, record.connection)
+            else:
+                deferred_closes.append(record.connection)
+        else:
+            tab = tabs.get(record.connection)
+            if tab is None:
+                tab = ReplayBrowserTab()
+                await tab.connect(browser_port)
+                tabs[record.connection] = tab
+            if record.kind == INBOUND:
+                await tab.send(record.message)
+                replayed_frames[BROWSER_LINK] += 1
+    replay_secs = time.perf_counter() - started_at
+
+    # Give the plugin a moment to finish responding.
+    await asyncio.sleep(0.5)
+    for connection in deferred_closes:
+        await close_tab(tabs, closed_tabs, connection)
+
+    total_replayed = sum(replayed_frames.values())
+    print(f"Replayed {total_replayed} frames in {replay_secs:.3f}s"
+          f" ({total_replayed / replay_secs if replay_secs else 0:.0f} frames/sec),"
+          f" with JSON codec '{json_codec.CODEC_NAME}'.")
+    print(f"Stream Deck: replayed {replayed_frames[STREAM_DECK_LINK]} inbound frames;"
+          f" the plugin sent {stream_deck.frames_received} frames"
+          f" (recorded: {recorded_outbound_frames[STREAM_DECK_LINK]}).")
+    browser_frames_received = sum(tab.frames_received for tab in list(tabs.values()) + closed_tabs)
+    print(f"Browser: replayed {replayed_frames[BROWSER_LINK]} inbound frames over"
+          f" {len(tabs) + len(closed_tabs)} connection(s); the plugin sent {browser_frames_received} frames"
+          f" (recorded: {recorded_outbound_frames[BROWSER_LINK]}).")
+
+    for tab in tabs.values():
+        await tab.close()
+    stream_deck.close()
+    browser_server.close()
+    stream_deck_task.cancel()
+
+
+def parse_cli_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replays a Stream Deck Google Meet plugin traffic log")
+    parser.add_argument("log_path", help="The traffic log to replay (rotated files are read too)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed, relative to the recording. 0 replays as fast as possible")
+    parser.add_argument("--session", type=int, default=-1,
+                        help="Which of the log's sessions to replay, by index. Defaults to the latest")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Print the plugin's metrics after replaying")
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace) -> None:
+    records = get_session(list(read_records(args.log_path)), args.session)
+    metrics_registry = metrics.MetricsRegistry()
+    await replay(records, args.speed, metrics_registry)
+    if args.metrics:
+        print(metrics_registry.render_text())
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_cli_args()))
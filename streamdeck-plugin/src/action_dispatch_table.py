@@ -0,0 +1,87 @@
+from typing import Dict, Generic, List, TypeVar
+
+HandlerT = TypeVar("HandlerT")
+
+
+class _PrefixTrieNode(Generic[HandlerT]):
+    __slots__ = ("children", "handlers")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_PrefixTrieNode[HandlerT]"] = {}
+        self.handlers: List[HandlerT] = []
+
+
+class ActionDispatchTable(Generic[HandlerT]):
+    """
+    An index from Stream Deck action UUIDs to the EventHandlers interested in
+    them, so an inbound event only needs to reach the handlers that will actually
+    act on it.
+
+    Handlers can be indexed by an exact action UUID, by an action prefix (e.g. our
+    family of emoji reaction actions), or as a catch-all that receives every event.
+    Lookups return handlers in the order they were added, and a handler that is
+    indexed more than once is only returned once.
+    """
+
+    def __init__(self) -> None:
+        self._exact_handlers: Dict[str, List[HandlerT]] = {}
+        self._prefix_root: _PrefixTrieNode[HandlerT] = _PrefixTrieNode()
+        self._catch_all_handlers: List[HandlerT] = []
+
+        """
+        Every handler we've indexed, mapped to the order it was added in. Used to
+        merge our exact, prefix, and catch-all matches back into registration order.
+        """
+        self._registration_order: Dict[int, int] = {}
+
+    def add_exact(self, action: str, handler: HandlerT) -> None:
+        self._remember(handler)
+        self._exact_handlers.setdefault(action, []).append(handler)
+
+    def add_prefix(self, prefix: str, handler: HandlerT) -> None:
+        self._remember(handler)
+        node = self._prefix_root
+        for char in prefix:
+            node = node.children.setdefault(char, _PrefixTrieNode())
+        node.handlers.append(handler)
+
+    def add_catch_all(self, handler: HandlerT) -> None:
+        self._remember(handler)
+        self._catch_all_handlers.append(handler)
+
+    def lookup(self, action: str | None) -> List[HandlerT]:
+        """
+        Returns every handler that should receive an event for the given action.
+        Events without an action only go to our catch-all handlers.
+        """
+        if action is None:
+            return list(self._catch_all_handlers)
+
+        matches: List[HandlerT] = []
+        matches.extend(self._exact_handlers.get(action, ()))
+
+        node = self._prefix_root
+        matches.extend(node.handlers)
+        for char in action:
+            next_node = node.children.get(char)
+            if next_node is None:
+                break
+            node = next_node
+            matches.extend(node.handlers)
+
+        if not matches:
+            # The common case: skip the merge work when only catch-alls apply.
+            return list(self._catch_all_handlers)
+
+        matches.extend(self._catch_all_handlers)
+        return self._dedupe_in_registration_order(matches)
+
+    def _remember(self, handler: HandlerT) -> None:
+        self._registration_order.setdefault(
+            id(handler), len(self._registration_order))
+
+    def _dedupe_in_registration_order(self, handlers: List[HandlerT]) -> List[HandlerT]:
+        unique = {id(handler): handler for handler in handlers}
+        if len(unique) == 1:
+            return list(unique.values())
+        return sorted(unique.values(), key=lambda handler: self._registration_order[id(handler)])
@@ -0,0 +1,166 @@
+import asyncio
+from enum import Enum
+import logging
+import time
+from typing import Awaitable, Callable, FrozenSet, List
+import websockets
+
+import browser_protocol
+
+
+class RoutingPolicy(str, Enum):
+    """
+    Which of our connected browser clients a message should be sent to.
+
+    Clients that haven't told us their tab status (e.g. older versions of our
+    browser extension) are always included, since we can't tell whether they're
+    the tab the user wants.
+
+    Policies compare equal by value, so compare them with ==. This module can be
+    loaded under more than one name (e.g. as src.browser_client in our tests),
+    and each copy has its own members.
+    """
+
+    # Every connected client.
+    BROADCAST = "broadcast"
+
+    # Only clients whose tab is in a Meet call.
+    ACTIVE_CALL_ONLY = "active_call_only"
+
+    # Only the most recently active client, preferring tabs that are in a Meet call.
+    MOST_RECENT = "most_recent"
+
+
+class BrowserClient:
+    """
+    Our bookkeeping for one connected browser extension websocket.
+
+    Each client can own a bounded outbound message queue, drained by its own
+    writer task, so that broadcasting to a slow or frozen browser tab never
+    holds up the sender or any of our other tabs.
+    """
+
+    # The most queued messages our writer task packs into one frame, for clients that speak protocol version 2.
+    MAX_MESSAGES_PER_FRAME = 32
+
+    def __init__(
+            self,
+            websocket: websockets.ServerConnection,
+            send: Callable[[websockets.ServerConnection, str | List[str]], Awaitable[None]],
+            max_queue_size: int,
+            connection_id: int = 0,
+            origin: str | None = None) -> None:
+        """
+        `send` is called by our writer task to deliver each queued message, or a
+        list of them to send in one frame. It's responsible for enforcing
+        deadlines and handling send failures.
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self.websocket = websocket
+
+        # Numbers this client's connection, e.g. in our traffic recordings.
+        self.connection_id = connection_id
+
+        # The web origin that opened this connection, per its handshake's Origin header, if it sent one.
+        self.origin = origin
+        self._send = send
+        self._outbound_queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue_size)
+        self._writer_task: asyncio.Task | None = None
+
+        """
+        What our browser extension has told us about its tab, via its tabStatus
+        messages. Until we get one, we don't know anything about it.
+        """
+        self.reports_tab_status = False
+        self.tab_id: str | None = None
+        self.in_call = False
+
+        """
+        When (per time.monotonic) this client's tab was last focused or visible,
+        or when it connected if it has never told us.
+        """
+        self.last_active_at = time.monotonic()
+
+        """
+        Whether this client answers our heartbeats, and when (per time.monotonic)
+        we last received anything from it.
+        """
+        self.sends_heartbeats = False
+        self.last_heard_at = time.monotonic()
+
+        # The requests (by event type) this client answers, as announced in its hello message.
+        self.supported_requests: FrozenSet[str] = frozenset()
+
+        """
+        The wire protocol version we've agreed on with this client (see
+        browser_protocol), and whether it takes compressed frames.
+        """
+        self.protocol_version = browser_protocol.PROTOCOL_V1
+        self.compress_frames = False
+
+    def update_tab_status(self, status: dict) -> None:
+        """
+        Record a tabStatus message from our browser extension, e.g.
+        `{"event": "tabStatus", "tabId": "...", "inCall": true, "active": true}`.
+        """
+        if not self.reports_tab_status and not status.get("active"):
+            # A tab that connected in the background hasn't really been active yet.
+            self.last_active_at = 0.0
+        self.reports_tab_status = True
+        tab_id = status.get("tabId")
+        if isinstance(tab_id, str):
+            self.tab_id = tab_id
+        self.in_call = bool(status.get("inCall"))
+        if status.get("active"):
+            self.last_active_at = time.monotonic()
+
+    def enqueue(self, message: str) -> bool:
+        """
+        Queue a message for delivery to this client without waiting for it to
+        be sent. Returns False if the message was dropped because the client's
+        queue is full, i.e. the client has stopped keeping up with us.
+        """
+        if self._writer_task is None:
+            # Writer tasks are started lazily, so clients we never queue for don't need one.
+            self._writer_task = asyncio.create_task(self._drain_outbound_queue())
+
+        try:
+            self._outbound_queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self) -> None:
+        """
+        Stop our writer task, discarding any messages that haven't been sent yet.
+        """
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+
+    def outbound_queue_depth(self) -> int:
+        return self._outbound_queue.qsize()
+
+    def encode_frame(self, messages: List[str]) -> str | bytes:
+        """
+        Returns the frame that carries the given messages to this client, in
+        our agreed protocol version. Version 1 frames only carry one message.
+        """
+        if self.protocol_version < browser_protocol.PROTOCOL_V2:
+            return messages[0]
+        return browser_protocol.encode_frame(messages, self.compress_frames)
+
+    async def _drain_outbound_queue(self) -> None:
+        while True:
+            message: str | List[str] = await self._outbound_queue.get()
+            if self.protocol_version >= browser_protocol.PROTOCOL_V2:
+                # Everything else that's waiting rides along in the same frame.
+                message = [message]
+                while len(message) < self.MAX_MESSAGES_PER_FRAME and not self._outbound_queue.empty():
+                    message.append(self._outbound_queue.get_nowait())
+            try:
+                await self._send(self.websocket, message)
+            except Exception:
+                self._logger.exception(
+                    "Exception while sending queued message to browser websocket.")
@@ -0,0 +1,136 @@
+"""
+The wire protocols we speak with our browser extension.
+
+Version 1 is the original protocol: every message is its own text frame,
+holding one JSON object, e.g. `{"event": "toggleMic"}`.
+
+Version 2 is optional, and only used with extensions that offer it in their
+hello message, e.g. `{"event": "hello", "protocols": [1, 2], ...}`. We answer
+with a "welcome" message (itself sent as version 1) naming the version we chose
+and the short integer codes we'll use for our event types. From then on, each
+frame we send that client is a JSON array of one or more messages, and messages
+with a coded event type carry it as "e" instead of "event", e.g.
+`[{"e":3},{"e":11}]` for toggleMic then toggleHand. Our writer tasks put every
+message that's waiting in a client's queue into one frame, so a burst of button
+presses costs a throttled background tab one wake-up instead of many.
+
+Extensions that also offer "deflate-raw" compression, on a connection that
+didn't negotiate permessage-deflate, are sent frames of at least
+COMPRESSION_THRESHOLD_BYTES as binary frames, compressed with raw DEFLATE, and
+smaller frames uncompressed. Messages from the extension to us are the same in
+both versions.
+"""
+
+import functools
+from typing import Any, Mapping, Sequence
+import zlib
+
+import json_codec
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+SUPPORTED_PROTOCOL_VERSIONS = (PROTOCOL_V1, PROTOCOL_V2)
+
+"""
+The message we send to tell a client which protocol version it's getting.
+"""
+WELCOME_EVENT_TYPE = "welcome"
+
+"""
+The event types we send under short codes in version 2, numbered from 1 in this
+order. Only ever append to this list, so the codes stay stable between
+releases. Event types that aren't listed are sent by name.
+"""
+CODED_EVENT_TYPES = (
+    "heartbeat",
+    "getAllStates",
+    "toggleMic",
+    "muteMic",
+    "unmuteMic",
+    "getMicState",
+    "toggleCamera",
+    "enableCamera",
+    "disableCamera",
+    "getCameraState",
+    "toggleHand",
+    "getHandState",
+    "emojiReact",
+    "toggleCaptions",
+    "getCaptionsState",
+    "togglePinPresentation",
+    "getPinPresentationState",
+    "toggleChat",
+    "toggleParticipants",
+    "toggleZenMode",
+    "leaveCall",
+)
+
+EVENT_CODES: Mapping[str, int] = {event_type: code for code, event_type in enumerate(CODED_EVENT_TYPES, start=1)}
+
+"""
+The compression we offer version 2 clients, under the name of the browser's
+DecompressionStream format that reads it.
+"""
+COMPRESSION_FORMAT = "deflate-raw"
+
+"""
+Frames smaller than this aren't worth the CPU of compressing, on either end.
+"""
+COMPRESSION_THRESHOLD_BYTES = 1024
+
+
+def negotiate_version(hello: Mapping[str, Any]) -> int:
+    """
+    Returns the newest protocol version offered in a client's hello message that
+    we support. Clients that don't offer any get version 1.
+    """
+    offered = hello.get("protocols")
+    if not isinstance(offered, list):
+        return PROTOCOL_V1
+    common = [version for version in SUPPORTED_PROTOCOL_VERSIONS if version in offered]
+    return max(common, default=PROTOCOL_V1)
+
+
+def supports_compression(hello: Mapping[str, Any]) -> bool:
+    formats = hello.get("compression")
+    return isinstance(formats, list) and COMPRESSION_FORMAT in formats
+
+
+def make_welcome(version: int, compress: bool) -> str:
+    welcome: dict = {"event": WELCOME_EVENT_TYPE, "protocol": version}
+    if version >= PROTOCOL_V2:
+        welcome["eventCodes"] = EVENT_CODES
+        if compress:
+            welcome["compressionThreshold"] = COMPRESSION_THRESHOLD_BYTES
+    return json_codec.dumps(welcome)
+
+
+@functools.lru_cache(maxsize=256)
+def encode_message(message: str) -> str:
+    """
+    Returns a serialized message with its event type replaced by its code, if it
+    has one. Most of our messages are one of a handful of cached ones, so this
+    rarely has to parse anything.
+    """
+    try:
+        parsed = json_codec.loads(message)
+    except Exception:
+        return message
+    event_type = parsed.get("event") if isinstance(parsed, dict) else None
+    code = EVENT_CODES.get(event_type) if isinstance(event_type, str) else None
+    if code is None:
+        return message
+    del parsed["event"]
+    return json_codec.dumps({"e": code, **parsed})
+
+
+def encode_frame(messages: Sequence[str], compress: bool) -> str | bytes:
+    """
+    Packs serialized messages into one version 2 frame, compressing it if
+    `compress` is set and it's large enough to be worth it.
+    """
+    frame = "[" + ",".join(map(encode_message, messages)) + "]"
+    if compress and len(frame) >= COMPRESSION_THRESHOLD_BYTES:
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return compressor.compress(frame.encode()) + compressor.flush()
+    return frame
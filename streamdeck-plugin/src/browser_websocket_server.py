@@ -1,13 +1,61 @@
 import asyncio
-import json
+import itertools
 import logging
-from typing import List, TYPE_CHECKING, Set
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, TYPE_CHECKING, Set
 import websockets
 
+from browser_client import BrowserClient, RoutingPolicy
+import browser_protocol
+import json_codec
+from key_press_policy import TokenBucket
+from keyed_task_dispatcher import KeyedTaskDispatcher
+from meet_state_store import MeetStateStore
+from message_logging import MessageLogger
+import metrics
+from traffic_recorder import BROWSER_LINK, CLOSED, INBOUND, OPENED, OUTBOUND, TrafficRecorder
+
 if TYPE_CHECKING:
     from event_handlers.base_event_handler import EventHandler
 
 
+"""
+The browser extension messages that tell us about a client's tab: "hello" when
+it connects, then "tabStatus" whenever something changes.
+"""
+TAB_STATUS_EVENT_TYPES = ("hello", "tabStatus")
+
+"""
+The message we send to check that a client is alive. Clients that support
+heartbeats reply with the same message.
+"""
+HEARTBEAT_MESSAGE = json_codec.dumps({"event": "heartbeat"})
+
+"""
+The request that asks our browser extension for every device's current state at
+once. Its reply's "states" maps each state update event type (e.g. micMutedState)
+to the state update message the extension would normally send for it.
+"""
+ALL_STATES_REQUEST_EVENT_TYPE = "getAllStates"
+
+
+class ConnectionCaps(NamedTuple):
+    """
+    Our limits on browser connections, past which we shed load (see
+    BrowserWebsocketServer). Caps and limits of 0 are unlimited.
+    """
+    max_clients: int = 0
+    max_clients_per_origin: int = 0
+    max_clients_per_tab: int = 0
+    connection_burst_limit: int = 0
+    connections_per_sec: float = 1.0
+
+
+def _uses_permessage_deflate(ws: websockets.ServerConnection) -> bool:
+    extensions = getattr(getattr(ws, "protocol", None), "extensions", None) or ()
+    return any(getattr(extension, "name", None) == "permessage-deflate" for extension in extensions)
+
+
 class BrowserWebsocketServer:
     """
     The BrowserWebsocketServer manages our connection to our browser extension,
@@ -22,12 +70,66 @@ class BrowserWebsocketServer:
     websockets hanging around, or if we have multiple Meet tabs.
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            queue_broadcasts: bool = False,
+            send_timeout_secs: float = 2.0,
+            max_outbound_queue_size: int = 64,
+            max_consecutive_send_timeouts: int = 3,
+            heartbeat_interval_secs: float = 5.0,
+            heartbeat_timeout_secs: float = 15.0,
+            request_timeout_secs: float = 1.0,
+            connection_caps: ConnectionCaps = ConnectionCaps(),
+            dispatcher: KeyedTaskDispatcher | None = None,
+            metrics_registry: metrics.MetricsRegistry | None = None,
+            state_store: MeetStateStore | None = None,
+            traffic_recorder: TrafficRecorder | None = None):
         """
         Remember to call start() before attempting to use your new instance!
+
+        If `queue_broadcasts` is set, send_to_clients hands each message to a
+        per-client outbound queue and returns right away, instead of waiting for
+        every client to receive it. Either way, each individual send must finish
+        within `send_timeout_secs`, and clients that miss that deadline
+        `max_consecutive_send_timeouts` times in a row get disconnected. Messages
+        that don't fit in a client's queue of `max_outbound_queue_size` messages
+        are dropped for that client.
+
+        Clients that support heartbeats (as announced in their hello message) are
+        sent one every `heartbeat_interval_secs`, and get disconnected if we don't
+        hear anything from them for `heartbeat_timeout_secs`. That catches dead
+        connections, e.g. from a sleeping laptop or a discarded tab, long before
+        the OS would. Set `heartbeat_interval_secs` to 0 to disable heartbeats.
+
+        Requests sent with request() are given up on after `request_timeout_secs`.
+
+        A misbehaving extension stuck in a reconnection loop, or lots of Meet
+        tabs, can leave us with dozens of connections that every broadcast fans
+        out to. So we can shed load, per our `connection_caps`: once we have more
+        than `max_clients` connections, more than `max_clients_per_origin` from
+        one web origin, or more than `max_clients_per_tab` from one tab (as
+        identified in its hello message), we disconnect the ones we've gone
+        longest without hearing from. With `connection_burst_limit` set, new
+        connections beyond a burst of that many are only accepted at
+        `connections_per_sec`, and the rest are turned away.
+
+        By default, we finish handling each inbound event before reading the next
+        one. If a `dispatcher` is given, events are instead handled concurrently,
+        while events of the same type are still handled in order.
+
+        Pass a `metrics_registry` to record our send and dispatch times, dropped
+        messages, etc., and a `traffic_recorder` to record every frame we send
+        and receive.
+
+        The state updates our browser extension sends are recorded in
+        `state_store` (or a store of our own), where handlers subscribe to them.
+        With several Meet tabs, the store follows the one our MOST_RECENT routing
+        sends commands to (see _get_state_source), so our buttons show the state
+        of the call they control.
         """
 
         self._logger = logging.getLogger(__name__)
+        self._message_logger = MessageLogger(self._logger)
 
         """
         Store all of the connected sockets we have open to the browser extension,
@@ -36,45 +138,352 @@ class BrowserWebsocketServer:
         """
         self._ws_clients: Set[websockets.ServerConnection] = set()
 
+        """
+        Our per-connection bookkeeping, for each of our registered websockets.
+        """
+        self._clients: Dict[websockets.ServerConnection, BrowserClient] = {}
+        self._connection_ids = itertools.count(1)
+        self._traffic_recorder = traffic_recorder
+
+        self._queue_broadcasts = queue_broadcasts
+        self._send_timeout_secs = send_timeout_secs
+        self._max_outbound_queue_size = max_outbound_queue_size
+        self._max_consecutive_send_timeouts = max_consecutive_send_timeouts
+        self._heartbeat_interval_secs = heartbeat_interval_secs
+        self._heartbeat_timeout_secs = heartbeat_timeout_secs
+        self._heartbeat_task: asyncio.Task | None = None
+
+        self._caps = connection_caps
+        self._connection_bucket = TokenBucket(
+            connection_caps.connection_burst_limit, connection_caps.connections_per_sec) \
+            if connection_caps.connection_burst_limit > 0 else None
+
+        """
+        Our requests that are waiting for a reply, by request ID.
+        """
+        self._request_timeout_secs = request_timeout_secs
+        self._request_ids = itertools.count(1)
+        self._pending_requests: Dict[str, asyncio.Future] = {}
+
+        """
+        Meet's current state, as reported by our state source: the client whose
+        state updates we take, as of its last change. Once a getAllStates reply
+        has filled the store in, we keep it up to date from the source's state
+        updates, and answer further getAllStates requests from it until the
+        source changes or our last browser disconnects.
+        """
+        self.state_store = state_store if state_store is not None else MeetStateStore()
+        self._state_store_synced = False
+        self._state_source: BrowserClient | None = None
+
+        # Our in-flight getAllStates requests, by the state source they ask, shared by everyone who asks meanwhile.
+        self._all_states_requests: Dict[BrowserClient | None, asyncio.Future] = {}
+
+        """
+        Whether we've told our handlers that all browsers are disconnected since
+        our last client disconnected, so we only tell them once.
+        """
+        self._notified_all_disconnected = True
+
+        """
+        How many sends in a row have missed their deadline, for each websocket
+        that is currently misbehaving.
+        """
+        self._consecutive_send_timeouts: Dict[websockets.ServerConnection, int] = {}
+
+        # Strong references to fire-and-forget tasks, so they aren't garbage collected mid-flight.
+        self._background_tasks: Set[asyncio.Task] = set()
+
         """
         Any EventHandlers registered to receive inbound events from the browser extension.
         """
         self._handlers: List["EventHandler"] = []
 
+        """
+        Our registered EventHandlers indexed by the browser event types they
+        consume, plus the handlers that want every event, so each inbound event
+        only reaches interested handlers.
+        """
+        self._handlers_by_event_type: Dict[str, List["EventHandler"]] = {}
+        self._catch_all_handlers: List["EventHandler"] = []
+
+        self._dispatcher = dispatcher
+
+        self._metrics = metrics_registry or metrics.DISABLED
+        self._dispatch_seconds = self._metrics.histogram(
+            "browser_dispatch_seconds", "Time spent handling each browser event, by event type.", "event")
+        self._handler_exceptions = self._metrics.counter(
+            "browser_handler_exceptions_total", "Exceptions raised by handlers of browser events, by handler.",
+            "handler")
+        self._broadcast_seconds = self._metrics.histogram(
+            "browser_broadcast_seconds", "Time spent in send_to_clients, per broadcast.")
+        self._client_send_seconds = self._metrics.histogram(
+            "browser_client_send_seconds", "Time spent sending each message to each browser client.")
+        self._send_timeouts = self._metrics.counter(
+            "browser_send_timeouts_total", "Sends to browser clients that missed their deadline.")
+        self._send_errors = self._metrics.counter(
+            "browser_send_errors_total", "Sends to browser clients that failed.")
+        self._dropped_messages = self._metrics.counter(
+            "browser_dropped_messages_total", "Messages dropped because a client's outbound queue was full.")
+        self._evictions = self._metrics.counter(
+            "browser_evictions_total", "Browser clients we disconnected for being unresponsive, by reason.",
+            "reason")
+        self._shed_connections = self._metrics.counter(
+            "browser_shed_connections_total",
+            "Browser connections we turned away or disconnected to stay within our connection caps, by reason.",
+            "reason")
+        self._metrics.gauge(
+            "browser_connected_clients", "Connected browser extension clients.", self.num_connected_clients)
+        self._metrics.gauge(
+            "browser_outbound_queue_depth", "Messages waiting in all browser clients' outbound queues.",
+            lambda: sum(client.outbound_queue_depth() for client in self._clients.values()))
+        if dispatcher:
+            self._metrics.gauge(
+                "browser_dispatcher_in_flight", "Browser events queued or being handled.",
+                dispatcher.num_in_flight)
+
     async def start(self, hostname: str, port: int) -> websockets.Server:
+        if self._heartbeat_interval_secs and self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        # We keep websockets' default permessage-deflate, which every extension version can negotiate.
+        # Protocol version 2 clients that don't get it can have their larger frames compressed instead.
         return await websockets.serve(self._message_receive_loop, hostname, port)
 
-    async def send_to_clients(self, message: str) -> None:
+    async def send_to_clients(self, message: str, policy: RoutingPolicy = RoutingPolicy.BROADCAST) -> None:
         """
-        Send a message from our plugin to the Chrome extension. We broadcast to
-        any connections we have, in case the user has multiple Meet windows/tabs
-        open.
+        Send a message from our plugin to the Chrome extension. By default, we
+        broadcast to any connections we have, in case the user has multiple Meet
+        windows/tabs open. Use a different `policy` for commands that should only
+        act on the meeting the user is looking at.
+
+        Sends are best effort: a client that fails to receive the message is
+        logged and skipped without affecting delivery to our other clients.
         """
         if self._ws_clients:
-            self._logger.info(
-                f"Broadcasting message to connected browser clients: {message}")
-            await asyncio.gather(*[client.send(message) for client in self._ws_clients])
+            self._message_logger.log_message(
+                "Broadcasting message to connected browser clients.", message)
+            started_at = time.perf_counter() if self._metrics.enabled else 0.0
+            targets = self._select_clients(policy)
+            if self._queue_broadcasts:
+                for ws in targets:
+                    self._enqueue_for_client(ws, message)
+            else:
+                await asyncio.gather(*[
+                    self._send_with_deadline(ws, message) for ws in targets
+                ])
+            if self._metrics.enabled:
+                self._broadcast_seconds.observe(time.perf_counter() - started_at)
         else:
-            self._logger.warn(
+            self._logger.warning(
                 ("There were no active browser extension clients to send our"
-                 f" message to! Message: {message}"))
+                 " message to! Message: %s"), message)
 
     def register_event_handler(self, handler: "EventHandler") -> None:
         """
         Register your EventHandler to have it receive callbacks whenever we
         get an event over the wire from the browser extension.
+
+        Handlers only receive the event types listed in their BROWSER_EVENT_TYPES.
+        Handlers that set it to None (or don't declare it) receive every event.
+        Handlers are also subscribed to changes of the states listed in their
+        BROWSER_STATE_KEYS.
         """
         self._handlers.append(handler)
 
+        state_keys = getattr(handler, "BROWSER_STATE_KEYS", None)
+        if isinstance(state_keys, (tuple, list, set, frozenset)) and state_keys:
+            if any(not self.state_store.tracks(key) for key in state_keys):
+                # Updates for these weren't being kept, so our store can't answer for them yet.
+                self._state_store_synced = False
+            self.state_store.subscribe(state_keys, handler.on_state_changed)
+
+        event_types = getattr(handler, "BROWSER_EVENT_TYPES", None)
+        if isinstance(event_types, (tuple, list, set, frozenset)):
+            for event_type in event_types:
+                self._handlers_by_event_type.setdefault(event_type, []).append(handler)
+        else:
+            self._catch_all_handlers.append(handler)
+
     def num_connected_clients(self) -> int:
         return len(self._ws_clients)
 
-    def _register_client(self, ws: websockets.ServerConnection) -> None:
+    async def request(self, event_type: str) -> dict | None:
+        """
+        Sends a request to our most recently active browser client that supports
+        it, and returns that client's reply. Returns None if none of our clients
+        support the request (e.g. none are connected, or they run an older
+        extension). Raises asyncio.TimeoutError if we don't get a reply in time,
+        since a slow browser is still there.
+        """
+        candidates = [client for ws, client in self._clients.items()
+                      if event_type in client.supported_requests and ws in self._ws_clients]
+        client = self._get_most_recent_client(candidates)
+        if client is None:
+            return None
+        return await self._request_from(client, event_type)
+
+    async def _request_from(self, client: BrowserClient, event_type: str) -> dict:
+        request_id = str(next(self._request_ids))
+        reply = asyncio.get_running_loop().create_future()
+        self._pending_requests[request_id] = reply
+        try:
+            await self._send_with_deadline(
+                client.websocket, json_codec.dumps({"event": event_type, "requestId": request_id}))
+            return await asyncio.wait_for(reply, timeout=self._request_timeout_secs)
+        except asyncio.TimeoutError:
+            self._logger.warning(
+                "%s didn't answer our %s request in time.", client.websocket.remote_address, event_type)
+            raise
+        finally:
+            self._pending_requests.pop(request_id, None)
+
+    async def request_all_states(self) -> Mapping[str, Any] | None:
+        """
+        Returns the current state of every device, from our state store if it's
+        up to date, or else by asking our browser extension for all of them at
+        once, so any number of buttons appearing together costs at most a single
+        round trip. Returns None if our state source can't answer, and raises
+        asyncio.TimeoutError if it didn't answer in time. See
+        ALL_STATES_REQUEST_EVENT_TYPE.
+        """
+        self._check_state_source()
+        if self._state_store_synced:
+            return self.state_store.snapshot().states
+
+        source = self._state_source
+        request = self._all_states_requests.get(source)
+        if request is None:
+            request = asyncio.ensure_future(self._fetch_all_states(source))
+            self._all_states_requests[source] = request
+            request.add_done_callback(lambda _: self._all_states_requests.pop(source, None))
+        # Shielded, so one caller being cancelled doesn't cancel the request for everyone else.
+        return await asyncio.shield(request)
+
+    async def _fetch_all_states(self, source: BrowserClient | None) -> Mapping[str, Any] | None:
+        if source is None:
+            reply = await self.request(ALL_STATES_REQUEST_EVENT_TYPE)
+        elif ALL_STATES_REQUEST_EVENT_TYPE in source.supported_requests:
+            reply = await self._request_from(source, ALL_STATES_REQUEST_EVENT_TYPE)
+        else:
+            reply = None
+
+        states = reply.get("states") if reply else None
+        if not isinstance(states, dict) or source is not self._state_source:
+            # If another tab took over while we waited, this tab's states aren't the ones we show anymore.
+            return None
+        await self.state_store.sync(states)
+        self._state_store_synced = True
+        return self.state_store.snapshot().states
+
+    def _get_state_source(self) -> BrowserClient | None:
+        """
+        Returns the client whose state we show: the one our MOST_RECENT routing
+        picks, so our buttons reflect the call they control. If none of our
+        clients report their tab status (i.e. they run an older extension), we
+        can't tell them apart, so we return None and take updates from all of them.
+        """
+        return self._get_most_recent_client([
+            client for ws, client in self._clients.items() if client.reports_tab_status and ws in self._ws_clients])
+
+    def _check_state_source(self) -> None:
+        """
+        Switches our state store to a new state source, if ours has changed since
+        we last checked, e.g. because it disconnected or another tab was focused.
+        The states we have are the old source's, so we replace them with the new one's.
+        """
+        source = self._get_state_source()
+        if source is self._state_source:
+            return
+        self._state_source = source
+        self._state_store_synced = False
+        if self._ws_clients:
+            self._run_in_background(self._resync_state_store())
+
+    async def _resync_state_store(self) -> None:
+        try:
+            states = await self.request_all_states()
+        except asyncio.TimeoutError:
+            states = None
+        if states is None and not self._state_store_synced:
+            # We can't get the new source's states right now. It'll report them as they change.
+            await self.state_store.reset()
+
+    def _get_most_recent_client(self, clients: List[BrowserClient]) -> BrowserClient | None:
+        """
+        Returns the most recently active of the given clients, preferring those in a call.
+        """
+        candidates = [client for client in clients if client.in_call] or clients
+        if not candidates:
+            return None
+        return max(candidates, key=lambda client: client.last_active_at)
+
+    def _select_clients(self, policy: RoutingPolicy) -> List[websockets.ServerConnection]:
+        """
+        Returns the connected websockets a message with the given routing policy
+        should go to.
+        """
+        if policy == RoutingPolicy.BROADCAST:
+            return list(self._ws_clients)
+
+        # Clients that haven't reported their tab status always get our messages.
+        targets = []
+        reporting_clients = []
+        for ws in self._ws_clients:
+            client = self._clients.get(ws)
+            if client is None or not client.reports_tab_status:
+                targets.append(ws)
+            else:
+                reporting_clients.append(client)
+
+        if policy == RoutingPolicy.ACTIVE_CALL_ONLY:
+            targets.extend(client.websocket for client in reporting_clients if client.in_call)
+        elif policy == RoutingPolicy.MOST_RECENT:
+            client = self._get_most_recent_client(reporting_clients)
+            if client:
+                targets.append(client.websocket)
+        return targets
+
+    def _register_client(self, ws: websockets.ServerConnection) -> BrowserClient:
         self._ws_clients.add(ws)
+        self._notified_all_disconnected = False
+        request = getattr(ws, "request", None)
+        client = BrowserClient(
+            ws, self._send_with_deadline, self._max_outbound_queue_size, next(self._connection_ids),
+            request.headers.get("Origin") if request is not None else None)
+        self._clients[ws] = client
+        if self._traffic_recorder:
+            self._traffic_recorder.record(BROWSER_LINK, OPENED, client.connection_id)
         self._logger.info(
             (f"{ws.remote_address} has connected to our browser websocket."
              f" We now have {len(self._ws_clients)} active connection(s)."))
 
+        if self._caps.max_clients_per_origin and client.origin is not None:
+            self._shed_idle_clients(
+                [other for other in self._clients.values() if other.origin == client.origin],
+                self._caps.max_clients_per_origin, client, "max_clients_per_origin")
+        if self._caps.max_clients:
+            self._shed_idle_clients(list(self._clients.values()), self._caps.max_clients, client, "max_clients")
+        return client
+
+    def _shed_idle_clients(
+            self, clients: List[BrowserClient], cap: int, keep: BrowserClient, reason: str) -> None:
+        """
+        Disconnects however many of `clients` are over our `cap`, starting with the
+        ones we've gone longest without hearing from. `keep` is never disconnected.
+        """
+        excess = len(clients) - cap
+        if excess <= 0:
+            return
+
+        idle_clients = sorted((client for client in clients if client is not keep),
+                              key=lambda client: client.last_heard_at)
+        for client in idle_clients[:excess]:
+            self._logger.warning(
+                "Over our %s cap of %d browser connections. Disconnecting %s, which has been idle for %.1f seconds.",
+                reason, cap, client.websocket.remote_address, time.monotonic() - client.last_heard_at)
+            self._shed_connections.inc(label=reason)
+            self._evict_client(client.websocket)
+
     async def _unregister_client(self, ws: websockets.ServerConnection) -> None:
         try:
             await ws.close()
@@ -83,49 +492,280 @@ class BrowserWebsocketServer:
                 "Exception while closing browser webocket connection.")
         if ws in self._ws_clients:
             self._ws_clients.remove(ws)
+        client = self._clients.pop(ws, None)
+        if client:
+            client.close()
+            if self._traffic_recorder:
+                self._traffic_recorder.record(BROWSER_LINK, CLOSED, client.connection_id)
+        self._consecutive_send_timeouts.pop(ws, None)
+        self._check_state_source()
         self._logger.info(
             (f"{ws.remote_address} has disconnected from our browser websocket."
              f" We now have {len(self._ws_clients)} active connection(s) remaining."))
 
+    def _enqueue_for_client(self, ws: websockets.ServerConnection, message: str) -> None:
+        client = self._clients.get(ws)
+        if client is None:
+            return
+
+        if not client.enqueue(message):
+            # A client that's truly stuck will also start missing send deadlines, and be evicted for that.
+            self._logger.warning(
+                "Outbound queue for %s is full. Dropping message: %s", ws.remote_address, message)
+            self._dropped_messages.inc()
+
+    async def _send_with_deadline(self, ws: websockets.ServerConnection, message: str | List[str]) -> None:
+        """
+        Send a message to one client, giving up if it takes longer than our
+        per-send deadline. A list of messages is sent in one frame, which only
+        clients on protocol version 2 support.
+        """
+        started_at = time.perf_counter() if self._metrics.enabled else 0.0
+        messages = [message] if isinstance(message, str) else message
+        client = self._clients.get(ws)
+        try:
+            frame = client.encode_frame(messages) if client else messages[0]
+            await asyncio.wait_for(ws.send(frame), timeout=self._send_timeout_secs)
+            if self._traffic_recorder:
+                for sent_message in messages:
+                    self._traffic_recorder.record(
+                        BROWSER_LINK, OUTBOUND, client.connection_id if client else 0, sent_message)
+        except asyncio.TimeoutError:
+            self._logger.warning(
+                "Timed out sending message to %s. Message: %s", ws.remote_address, message)
+            self._send_timeouts.inc()
+            self._record_send_timeout(ws)
+        except Exception:
+            self._logger.exception(
+                f"Exception while sending message to {ws.remote_address}.")
+            self._send_errors.inc()
+        else:
+            self._consecutive_send_timeouts.pop(ws, None)
+        if self._metrics.enabled:
+            self._client_send_seconds.observe(time.perf_counter() - started_at)
+
+    def _record_send_timeout(self, ws: websockets.ServerConnection) -> None:
+        """
+        Track a missed send deadline, and evict the client if it keeps missing them.
+        A stuck client would otherwise cost us a full timeout on every message.
+        """
+        timeouts = self._consecutive_send_timeouts.get(ws, 0) + 1
+        self._consecutive_send_timeouts[ws] = timeouts
+        if timeouts < self._max_consecutive_send_timeouts:
+            return
+
+        self._logger.warning(
+            (f"{ws.remote_address} missed {timeouts} send deadlines in a row."
+             " Disconnecting it."))
+        self._evictions.inc(label="send_timeout")
+        self._evict_client(ws)
+
+    def _evict_client(self, ws: websockets.ServerConnection) -> None:
+        """
+        Disconnect an unresponsive client. We stop sending to it right away, since
+        closing its socket may take a while.
+        """
+        self._ws_clients.discard(ws)
+        client = self._clients.pop(ws, None)
+        if client:
+            client.close()
+            if self._traffic_recorder:
+                self._traffic_recorder.record(BROWSER_LINK, CLOSED, client.connection_id)
+        self._consecutive_send_timeouts.pop(ws, None)
+        self._check_state_source()
+        self._run_in_background(self._unregister_client(ws))
+        self._run_in_background(self._notify_if_all_disconnected())
+
+    async def _heartbeat_loop(self) -> None:
+        """
+        Evicts heartbeat-capable clients we haven't heard from in too long, and
+        sends a heartbeat to the rest.
+        """
+        last_checked_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self._heartbeat_interval_secs)
+            now = time.monotonic()
+            # If we ourselves were suspended (e.g. the computer slept), nobody could have reached us.
+            was_suspended = now - last_checked_at > 2 * self._heartbeat_interval_secs
+            last_checked_at = now
+
+            for client in list(self._clients.values()):
+                if not client.sends_heartbeats:
+                    continue
+                if was_suspended:
+                    client.last_heard_at = now
+                elif now - client.last_heard_at > self._heartbeat_timeout_secs:
+                    self._logger.warning(
+                        "%s hasn't answered our heartbeats in %.1f seconds. Disconnecting it.",
+                        client.websocket.remote_address, now - client.last_heard_at)
+                    self._evictions.inc(label="heartbeat")
+                    self._evict_client(client.websocket)
+                    continue
+                self._run_in_background(self._send_with_deadline(client.websocket, HEARTBEAT_MESSAGE))
+
+    async def _notify_if_all_disconnected(self) -> None:
+        """
+        Tells our handlers once our last client is gone.
+        """
+        if self._ws_clients or self._notified_all_disconnected:
+            return
+        self._notified_all_disconnected = True
+
+        if self._dispatcher:
+            # Let our browsers' queued events finish first, so they can't repaint in-call state after our reset.
+            await self._dispatcher.join()
+            if self._ws_clients:
+                # A browser connected while we waited, so we aren't disconnected after all.
+                return
+
+        # Whatever our browsers last told us no longer applies.
+        self._state_store_synced = False
+        await self.state_store.reset()
+
+        for handler in self._handlers:
+            try:
+                await handler.on_all_browsers_disconnected()
+            except Exception:
+                self._logger.exception(
+                    "Connection mananger received an exception from EventHandler!")
+
+    def _run_in_background(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
     async def _message_receive_loop(self, ws: websockets.ServerConnection) -> None:
         """
         Loop of waiting for and processing inbound websocket messages, until the
         connection dies. Each connection will create one of these coroutines.
         """
-        self._register_client(ws)
+        if self._connection_bucket and not self._connection_bucket.try_acquire():
+            self._logger.warning(
+                "Too many new browser connections. Turning away %s.", ws.remote_address)
+            self._shed_connections.inc(label="throttled")
+            # 1013 is "Try Again Later".
+            await ws.close(code=1013, reason="Too many connections")
+            return
+
+        client = self._register_client(ws)
         try:
             async for message in ws:
-                self._logger.info(
-                    f"Received inbound message from browser extension. Message: {str(message)}")
-                await self._process_inbound_message(message)
+                client.last_heard_at = time.monotonic()
+                if self._traffic_recorder:
+                    self._traffic_recorder.record(BROWSER_LINK, INBOUND, client.connection_id, message)
+                self._message_logger.log_message(
+                    "Received inbound message from browser extension.", message)
+                await self._process_inbound_message(message, ws)
         except Exception:
             self._logger.exception(
                 "BrowserWebsocketServer encountered an exception while waiting for inbound messages.")
         finally:
             await self._unregister_client(ws)
 
-        if not self._ws_clients:
-            for handler in self._handlers:
-                try:
-                    await handler.on_all_browsers_disconnected()
-                except Exception:
-                    self._logger.exception(
-                        "Connection mananger received an exception from EventHandler!")
+        await self._notify_if_all_disconnected()
 
-    async def _process_inbound_message(self, message: str | bytes) -> None:
+    async def _process_inbound_message(
+            self, message: str | bytes, ws: websockets.ServerConnection | None = None) -> None:
         """
-        Process one individual inbound websocket message.
+        Process one individual inbound websocket message, received from `ws`.
         """
         try:
-            parsed_event = json.loads(message)
+            parsed_event = json_codec.loads(message)
         except Exception:
             self._logger.exception(
                 f"Failed to parse browser websocket message as JSON. Message: {str(message)}")
             return
 
-        for handler in self._handlers:
+        event_type = parsed_event.get("event") if isinstance(parsed_event, dict) else None
+        if event_type is not None:
+            reply_to = parsed_event.get("replyTo")
+            if reply_to is not None:
+                self._resolve_request(reply_to, parsed_event)
+                return
+
+        client = self._clients.get(ws)
+        if event_type in TAB_STATUS_EVENT_TYPES:
+            if client:
+                client.update_tab_status(parsed_event)
+                self._check_state_source()
+                if self._caps.max_clients_per_tab and client.tab_id is not None:
+                    self._shed_idle_clients(
+                        [other for other in self._clients.values() if other.tab_id == client.tab_id],
+                        self._caps.max_clients_per_tab, client, "max_clients_per_tab")
+                if event_type == "hello":
+                    client.sends_heartbeats = bool(parsed_event.get("heartbeats"))
+                    supported_requests = parsed_event.get("supportedRequests")
+                    if isinstance(supported_requests, list):
+                        client.supported_requests = frozenset(supported_requests)
+                    await self._negotiate_protocol(client, parsed_event)
+
+        # Other tabs' states aren't the ones our buttons show.
+        updates_state = isinstance(event_type, str) and self.state_store.tracks(event_type) \
+            and (client is None or self._state_source is None or client is self._state_source)
+
+        handlers = self._get_handlers_for_event(parsed_event)
+        if not handlers and not updates_state:
+            return
+
+        if self._dispatcher:
+            await self._dispatcher.submit(
+                event_type, lambda: self._dispatch_to_handlers(handlers, parsed_event, event_type, updates_state))
+        else:
+            await self._dispatch_to_handlers(handlers, parsed_event, event_type, updates_state)
+
+    async def _negotiate_protocol(self, client: BrowserClient, hello: dict) -> None:
+        """
+        Agrees on a wire protocol version with a client that offers any in its
+        hello message. Older extensions don't, and stay on version 1.
+        """
+        if "protocols" not in hello:
+            return
+        version = browser_protocol.negotiate_version(hello)
+        # Frames on a permessage-deflate connection are already compressed, so we don't compress them twice.
+        compress = version >= browser_protocol.PROTOCOL_V2 and browser_protocol.supports_compression(hello) \
+            and not _uses_permessage_deflate(client.websocket)
+        # Sent in the client's current version, so it knows how to read everything after it.
+        await self._send_with_deadline(client.websocket, browser_protocol.make_welcome(version, compress))
+        client.protocol_version = version
+        client.compress_frames = compress
+        self._logger.info("%s is using protocol version %d.", client.websocket.remote_address, version)
+
+    def _resolve_request(self, request_id, reply: dict) -> None:
+        request = self._pending_requests.pop(str(request_id), None)
+        if request is None:
+            self._logger.info("Ignoring reply to unknown or expired request %s.", request_id)
+        elif not request.done():
+            request.set_result(reply)
+
+    async def _dispatch_to_handlers(
+            self, handlers: List["EventHandler"], event: dict, event_type: str | None, updates_state: bool) -> None:
+        started_at = time.perf_counter() if self._metrics.enabled else 0.0
+        if updates_state:
+            await self.state_store.update(event_type, event)
+        for handler in handlers:
             try:
-                await handler.on_browser_event(parsed_event)
+                await handler.on_browser_event(event)
             except Exception:
                 self._logger.exception(
                     "Connection mananger received an exception from EventHandler!")
+                self._handler_exceptions.inc(label=type(handler).__name__)
+        if self._metrics.enabled:
+            self._dispatch_seconds.observe(time.perf_counter() - started_at, event_type)
+
+    def _get_handlers_for_event(self, event) -> List["EventHandler"]:
+        """
+        Returns the registered EventHandlers interested in the given event, in
+        registration order.
+        """
+        event_type = event.get("event") if isinstance(event, dict) else None
+        typed_handlers = self._handlers_by_event_type.get(event_type) \
+            if isinstance(event_type, str) else None
+
+        if not typed_handlers:
+            return self._catch_all_handlers
+        if not self._catch_all_handlers:
+            return typed_handlers
+
+        interested = set(typed_handlers)
+        interested.update(self._catch_all_handlers)
+        return [handler for handler in self._handlers if handler in interested]
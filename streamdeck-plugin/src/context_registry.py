@@ -0,0 +1,122 @@
+import sys
+from typing import Any, Collection, Dict, Tuple
+
+
+class ActionContext:
+    """
+    What we know about one "action instance", i.e. one of our buttons on a
+    Stream Deck, identified by the opaque context value the Stream Deck SDK
+    gives it.
+    """
+
+    __slots__ = ("context", "action", "device", "column", "row", "state")
+
+    def __init__(self, context: str, action: str, device: str | None = None,
+                 column: int | None = None, row: int | None = None) -> None:
+        self.context = context
+        self.action = action
+        self.device = device
+
+        # The button's position on its device. Buttons inside multi-actions don't have one.
+        self.column = column
+        self.row = row
+
+        """
+        The state we last told the Stream Deck to show on this button, if any.
+        Handlers use this to skip writes that wouldn't change anything, so it
+        must be reset to None whenever the button may not be showing it.
+        """
+        self.state: Any = None
+
+    def __repr__(self) -> str:
+        return (f"ActionContext(context={self.context!r}, action={self.action!r}, device={self.device!r}, "
+                f"column={self.column!r}, row={self.row!r}, state={self.state!r})")
+
+
+class ContextRegistry:
+    """
+    Tracks every one of our buttons that's currently on a Stream Deck, shared
+    by all of our EventHandlers. Buttons are added and removed in constant time,
+    and the Stream Deck replaying willAppear for a button we already know about
+    doesn't add it twice.
+
+    Users with several devices, pages and multi-action folders can have dozens of
+    buttons per action, and we look up the same few context and action strings
+    for every event, so they're interned.
+    """
+
+    def __init__(self) -> None:
+        self._contexts: Dict[str, ActionContext] = {}
+
+        # The same records, grouped by action, so each handler can find its own buttons.
+        self._contexts_by_action: Dict[str, Dict[str, ActionContext]] = {}
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+    def __contains__(self, context: object) -> bool:
+        return context in self._contexts
+
+    def get(self, context: str) -> ActionContext | None:
+        return self._contexts.get(context)
+
+    def appear(self, context: str, action: str, device: str | None = None,
+               coordinates: dict | None = None) -> ActionContext:
+        """
+        Records a button that's appeared on the Stream Deck, e.g. from a
+        willAppear event. If we already know about the button, its existing
+        record is updated and returned.
+        """
+        column, row = _get_coordinates(coordinates)
+        record = self._contexts.get(context)
+        if record is None:
+            record = ActionContext(
+                sys.intern(context), sys.intern(action), sys.intern(device) if device else None, column, row)
+            self._contexts[record.context] = record
+            self._contexts_by_action.setdefault(record.action, {})[record.context] = record
+            return record
+
+        if record.action != action:
+            # Context values should be unique to one button, but don't let a stray one corrupt our index.
+            self._remove_from_action(record)
+            record.action = sys.intern(action)
+            record.state = None
+            self._contexts_by_action.setdefault(record.action, {})[record.context] = record
+        if device:
+            record.device = sys.intern(device)
+        if coordinates is not None:
+            record.column, record.row = column, row
+        return record
+
+    def disappear(self, context: str) -> ActionContext | None:
+        """
+        Forgets a button that's left the Stream Deck, e.g. after a willDisappear
+        event. Returns its record, or None if we didn't know about it.
+        """
+        record = self._contexts.pop(context, None)
+        if record is not None:
+            self._remove_from_action(record)
+        return record
+
+    def contexts_for_action(self, action: str) -> Collection[ActionContext]:
+        """
+        Returns a live view of the buttons for one action, in the order they appeared.
+        """
+        contexts = self._contexts_by_action.get(action)
+        return contexts.values() if contexts is not None else ()
+
+    def _remove_from_action(self, record: ActionContext) -> None:
+        contexts = self._contexts_by_action.get(record.action)
+        if contexts is not None:
+            contexts.pop(record.context, None)
+            if not contexts:
+                del self._contexts_by_action[record.action]
+
+
+def _get_coordinates(coordinates: dict | None) -> Tuple[int | None, int | None]:
+    if not isinstance(coordinates, dict):
+        return None, None
+    column = coordinates.get("column")
+    row = coordinates.get("row")
+    return (column if isinstance(column, int) else None,
+            row if isinstance(row, int) else None)
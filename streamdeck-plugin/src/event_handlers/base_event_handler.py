@@ -1,6 +1,10 @@
-import json
 import logging
-from typing import TYPE_CHECKING
+from typing import Any, Dict, Tuple, TYPE_CHECKING
+
+from context_registry import ContextRegistry
+from key_press_policy import KeyPressCoalescer, TokenBucket
+from outbound_messages import make_simple_event
+from outbound_queue import outbound_priority, OutboundPriority
 
 if TYPE_CHECKING:
     from browser_websocket_server import BrowserWebsocketServer
@@ -27,11 +31,60 @@ class EventHandler:
     # If set to an action prefix string, allows matching a family of actions sharing a prefix.
     STREAM_DECK_ACTION_PREFIX: str | None = None
 
-    def __init__(self, stream_deck: "StreamDeckWebsocketClient", browser_manager: "BrowserWebsocketServer") -> None:
+    """
+    The browser extension event types this EventHandler's `on_browser_event`
+    consumes. The BrowserWebsocketServer only routes events of these types to
+    us. Set this to None to receive every browser event.
+    """
+    BROWSER_EVENT_TYPES: Tuple[str, ...] | None = ()
+
+    """
+    The states (keyed by the browser extension's state update event types) whose
+    changes this EventHandler's `on_state_changed` should be told about. See
+    MeetStateStore.
+    """
+    BROWSER_STATE_KEYS: Tuple[str, ...] = ()
+
+    """
+    If above 0, key presses of each of our actions are rate limited: a burst of
+    up to this many presses is allowed, and after that only
+    KEY_PRESSES_PER_SEC. Presses over the limit are dropped, so mashing a button
+    doesn't flood our browser extension and the Meet page with redundant work.
+    """
+    KEY_PRESS_BURST_LIMIT = 0
+    KEY_PRESSES_PER_SEC = 1.0
+
+    """
+    If above 0, presses of the same button within this many seconds of the first
+    are merged into one, and we don't act on the first press until the window
+    closes. With KEY_PRESSES_CANCEL_IN_PAIRS, merged presses cancel each other
+    out in pairs instead. See KeyPressCoalescer.
+    """
+    KEY_PRESS_COALESCE_SECS = 0.0
+    KEY_PRESSES_CANCEL_IN_PAIRS = False
+
+    def __init__(
+            self,
+            stream_deck: "StreamDeckWebsocketClient",
+            browser_manager: "BrowserWebsocketServer",
+            context_registry: ContextRegistry | None = None) -> None:
+        """
+        Our handlers normally share one `context_registry`, so there's a single
+        record of every button on the Stream Deck. Handlers that aren't given one
+        keep their own.
+        """
         self._logger = logging.getLogger(__name__)
 
         self._stream_deck: "StreamDeckWebsocketClient" = stream_deck
         self._browser_manager: "BrowserWebsocketServer" = browser_manager
+        self._contexts = context_registry if context_registry is not None else ContextRegistry()
+
+        # Our key press rate limits, for each action.
+        self._key_press_buckets: Dict[str, TokenBucket] = {}
+
+        self._key_press_coalescer = KeyPressCoalescer(
+            self.KEY_PRESS_COALESCE_SECS, self.KEY_PRESSES_CANCEL_IN_PAIRS, self._act_on_key_press) \
+            if self.KEY_PRESS_COALESCE_SECS > 0 else None
 
     async def on_browser_event(self, event: dict) -> None:
         """
@@ -40,6 +93,14 @@ class EventHandler:
         """
         pass
 
+    async def on_state_changed(self, key: str, value: Any) -> None:
+        """
+        Called when one of the states in our BROWSER_STATE_KEYS changes. `value`
+        is the browser extension's latest update message for it, or None if we no
+        longer know the state.
+        """
+        pass
+
     async def on_all_browsers_disconnected(self) -> None:
         """
         Called when there are no longer any connections to our browser extension
@@ -47,6 +108,14 @@ class EventHandler:
         """
         pass
 
+    async def on_stream_deck_reconnected(self) -> None:
+        """
+        Called when our connection to the Stream Deck app has been re-established
+        after dropping. The Stream Deck app will send willAppear events for our
+        visible buttons again, but may have lost track of their states.
+        """
+        pass
+
     async def on_stream_deck_event(self, event: dict) -> None:
         """
         Called by the StreamDeckWebsocketClient whenever a new event comes in from
@@ -64,15 +133,45 @@ class EventHandler:
             return
 
         if event_type == "keyUp":
-            await self._key_up_handler(event)
+            if self._key_press_coalescer:
+                self._key_press_coalescer.submit(event.get("context"), event)
+            else:
+                await self._act_on_key_press(event)
         elif event_type == "willAppear":
+            context = event.get("context")
+            if context:
+                payload = event.get("payload")
+                self._contexts.appear(
+                    context, target_action, event.get("device"),
+                    payload.get("coordinates") if isinstance(payload, dict) else None)
             await self._will_appear_handler(event)
         elif event_type == "willDisappear":
+            if self._key_press_coalescer:
+                # Presses of a button that's gone shouldn't act once it's somewhere else, or on another page.
+                self._key_press_coalescer.cancel(event.get("context"))
+            self._contexts.disappear(event.get("context"))
             await self._will_disappear_handler(event)
         else:
             # There are several different Stream Deck events we don't care about.
             pass
 
+    async def _act_on_key_press(self, event: dict) -> None:
+        """
+        Calls our `_key_up_handler`, unless the press is over our rate limit.
+        Whatever it sends the Stream Deck is written ahead of other updates.
+        """
+        if self.KEY_PRESS_BURST_LIMIT > 0:
+            action = event.get("action")
+            bucket = self._key_press_buckets.get(action)
+            if bucket is None:
+                bucket = TokenBucket(self.KEY_PRESS_BURST_LIMIT, self.KEY_PRESSES_PER_SEC)
+                self._key_press_buckets[action] = bucket
+            if not bucket.try_acquire():
+                self._logger.info("Dropping a press of %s, which is over our rate limit.", action)
+                return
+        with outbound_priority(OutboundPriority.KEY_PRESS):
+            await self._key_up_handler(event)
+
     async def _key_up_handler(self, event: dict) -> None:
         """
         The "keyUp" event happens when a Stream Deck button is released after
@@ -101,4 +200,4 @@ class EventHandler:
         pass
 
     def _make_simple_sd_event(self, event_type: str) -> str:
-        return json.dumps({"event": event_type})
+        return make_simple_event(event_type)
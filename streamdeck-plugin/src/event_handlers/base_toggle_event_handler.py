@@ -1,14 +1,28 @@
 import asyncio
 from enum import Enum
-import json
-from typing import List, TYPE_CHECKING
+import os
+import time
+from typing import Any, Collection, Mapping, TYPE_CHECKING
 
+from browser_client import RoutingPolicy
+from context_registry import ActionContext, ContextRegistry
 from event_handlers.base_event_handler import EventHandler
+from outbound_messages import SetStateMessageCache
+from outbound_queue import OutboundPriority
+import startup_timing
+from update_coalescer import UpdateCoalescer
 
 if TYPE_CHECKING:
     from browser_websocket_server import BrowserWebsocketServer
     from stream_deck_client import StreamDeckWebsocketClient
 
+"""
+Set this environment variable to make our toggle buttons show the result of a
+press right away, without waiting for Meet to confirm it. See
+BaseToggleEventHandler.OPTIMISTIC_TOGGLE_TIMEOUT_SECS.
+"""
+OPTIMISTIC_TOGGLES_ENVIRONMENT_VARIABLE = "MEETPLUGIN_OPTIMISTIC_TOGGLES"
+
 
 class SDToggleState(Enum):
     """
@@ -42,98 +56,282 @@ class BaseToggleEventHandler(EventHandler):
     # Human readable name of the device this handler operates on.
     FRIENDLY_DEVICE_NAME = "(invalid)"
 
-    def __init__(self, stream_deck: "StreamDeckWebsocketClient", browser_manager: "BrowserWebsocketServer") -> None:
-        super().__init__(stream_deck, browser_manager)
+    """
+    Meet often sends us bursts of state updates, e.g. when joining a call. After
+    showing an update on the button, we hold back any further updates for this
+    many seconds and then only show the latest one, to reduce Stream Deck writes
+    and button flicker. Set to 0 to show every update right away.
+    """
+    STATE_UPDATE_COALESCE_SECS = 0.02
+
+    """
+    After a button press, state updates skip coalescing for this many seconds,
+    and are written to the Stream Deck ahead of other updates, so the user's
+    feedback for their press is never delayed.
+    """
+    KEY_UP_EXPEDITE_SECS = 2.0
+
+    # If we coalesce key presses, a double tap on one of our toggles changes nothing.
+    KEY_PRESSES_CANCEL_IN_PAIRS = True
+
+    """
+    If above 0, a button press immediately flips the button to the state we
+    expect it to cause, instead of waiting for the browser extension to report
+    the new state. If Meet doesn't confirm that state within this many seconds,
+    the button is rolled back to the last state Meet reported. Off unless the
+    MEETPLUGIN_OPTIMISTIC_TOGGLES environment variable is set.
+    """
+    OPTIMISTIC_TOGGLE_TIMEOUT_SECS = 3.0 if os.environ.get(OPTIMISTIC_TOGGLES_ENVIRONMENT_VARIABLE) else 0.0
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # Subscribe to our device's state, unless the subclass asks for something else.
+        if "BROWSER_STATE_KEYS" not in cls.__dict__:
+            cls.BROWSER_STATE_KEYS = (cls.BROWSER_STATE_UPDATED_EVENT_TYPE,)
+
+    def __init__(
+            self,
+            stream_deck: "StreamDeckWebsocketClient",
+            browser_manager: "BrowserWebsocketServer",
+            context_registry: ContextRegistry | None = None) -> None:
+        super().__init__(stream_deck, browser_manager, context_registry)
 
         """
-        These are the opaque "context" values that the Stream Deck SDK uses to
-        identify each "action instance", i.e. a particular instantiation of one
-        of our Stream Deck buttons. We need to pass these back to the Stream
-        Deck later to identify which button we're operating on.
+        Our buttons' records in the context registry hold the state we last told
+        the Stream Deck to show on them. Meet sends us lots of redundant state
+        updates, so we use those to skip setState writes that wouldn't change
+        anything on the button.
         """
-        self._toggle_contexts: List[str] = []
+        self._set_state_messages = SetStateMessageCache()
+
+        self._state_update_coalescer: UpdateCoalescer[SDToggleState] = UpdateCoalescer(
+            self.STATE_UPDATE_COALESCE_SECS, self._set_stream_deck_mute_state)
+
+        # Counts the state updates we've received, so we can tell if one arrives while we're busy.
+        self._num_state_updates = 0
 
-    async def on_browser_event(self, event: dict) -> None:
-        event_type = event.get("event")
+        # The last state the browser extension reported, if any.
+        self._reported_state: SDToggleState | None = None
+
+        """
+        While we're optimistically showing the result of a press, the state we
+        expect Meet to report, when we started expecting it (per time.perf_counter),
+        and the task that rolls the button back if Meet never confirms it.
+        """
+        self._expected_state: SDToggleState | None = None
+        self._expected_since = 0.0
+        self._expectation_timeout_task: asyncio.Task | None = None
 
-        if event_type == self.BROWSER_STATE_UPDATED_EVENT_TYPE:
-            if event.get("disconnected"):
-                desired_sd_state = SDToggleState.DISCONNECTED
-            elif event.get("muted"):
-                desired_sd_state = SDToggleState.MUTED
-            else:
-                desired_sd_state = SDToggleState.UNMUTED
-            await self._set_stream_deck_mute_state(desired_sd_state)
+    async def on_state_changed(self, key: str, value: Any) -> None:
+        if key == self.BROWSER_STATE_UPDATED_EVENT_TYPE:
+            self._num_state_updates += 1
+            state = self._get_sd_state(value)
+            self._reported_state = state
+            self._reconcile_expected_state(state)
+            await self._state_update_coalescer.submit(state)
 
     async def on_all_browsers_disconnected(self) -> None:
-        await self._set_stream_deck_mute_state(state=SDToggleState.DISCONNECTED)
+        self._reported_state = SDToggleState.DISCONNECTED
+        self._reconcile_expected_state(SDToggleState.DISCONNECTED)
+        await self._state_update_coalescer.submit_now(SDToggleState.DISCONNECTED)
+
+    async def on_stream_deck_reconnected(self) -> None:
+        self.invalidate_sent_states()
 
     async def _key_up_handler(self, event: dict) -> None:
+        # Make sure the button is up to date, and show the result of this press without delay.
+        await self._state_update_coalescer.flush()
+        self._state_update_coalescer.expedite(self.KEY_UP_EXPEDITE_SECS)
+
         if self._browser_manager.num_connected_clients():
             """
             We have connected browser extensions to send a change request to.
             Note that we don't update the button state here. The plugin will
             send us an update event if it successfully toggles the mute status,
-            and our `on_browser_event` will (asynchronously) update the button.
+            and our `on_state_changed` will (asynchronously) update the button.
             """
             toggle_event = self._make_simple_sd_event(
                 self.BROWSER_TOGGLE_EVENT_TYPE)
-            await self._browser_manager.send_to_clients(toggle_event)
+            await self._browser_manager.send_to_clients(toggle_event, policy=RoutingPolicy.MOST_RECENT)
+            if self.OPTIMISTIC_TOGGLE_TIMEOUT_SECS > 0:
+                await self._show_expected_state()
         else:
             # No connected browser extensions, so there is no true state to show.
-            await self._set_stream_deck_mute_state(state=SDToggleState.DISCONNECTED)
+            await self._state_update_coalescer.submit_now(SDToggleState.DISCONNECTED)
+
+    async def _show_expected_state(self) -> None:
+        """
+        Flips our buttons to the state we expect our toggle request to cause, and
+        starts waiting for Meet to confirm it. If we don't know the current state,
+        we can't guess the next one, so we wait for Meet as usual.
+        """
+        current_state = self._expected_state or self._reported_state
+        if current_state is SDToggleState.MUTED:
+            expected_state = SDToggleState.UNMUTED
+        elif current_state is SDToggleState.UNMUTED:
+            expected_state = SDToggleState.MUTED
+        else:
+            return
+
+        if self._expectation_timeout_task is not None:
+            self._expectation_timeout_task.cancel()
+        self._expected_state = expected_state
+        self._expected_since = time.perf_counter()
+        self._expectation_timeout_task = asyncio.create_task(self._roll_back_unconfirmed_state())
+        await self._state_update_coalescer.submit_now(expected_state)
+
+    def _reconcile_expected_state(self, reported_state: SDToggleState) -> None:
+        """
+        Settles our pending expectation, if any, now that the browser extension has
+        told us the real state. The caller then shows the reported state, which
+        either matches what we're already showing or corrects it.
+        """
+        if self._expected_state is None:
+            return
+
+        confirmation_ms = (time.perf_counter() - self._expected_since) * 1000
+        if reported_state is self._expected_state:
+            self._logger.info(
+                "Meet confirmed our %s toggle after %.1f ms.", self.FRIENDLY_DEVICE_NAME, confirmation_ms)
+        else:
+            self._logger.info(
+                "Meet reported %s %s after %.1f ms, instead of the %s we expected.",
+                self.FRIENDLY_DEVICE_NAME, reported_state.name, confirmation_ms, self._expected_state.name)
+        self._expected_state = None
+        if self._expectation_timeout_task is not None:
+            self._expectation_timeout_task.cancel()
+            self._expectation_timeout_task = None
+
+    async def _roll_back_unconfirmed_state(self) -> None:
+        await asyncio.sleep(self.OPTIMISTIC_TOGGLE_TIMEOUT_SECS)
+        self._logger.warning(
+            "Meet didn't confirm our %s toggle within %.1f s. Rolling back.",
+            self.FRIENDLY_DEVICE_NAME, self.OPTIMISTIC_TOGGLE_TIMEOUT_SECS)
+        self._expected_state = None
+        self._expectation_timeout_task = None
+        try:
+            await self._state_update_coalescer.submit_now(self._reported_state or SDToggleState.DISCONNECTED)
+        except Exception:
+            self._logger.exception(
+                "Exception while rolling back an unconfirmed %s toggle.", self.FRIENDLY_DEVICE_NAME)
 
     async def _will_appear_handler(self, event: dict) -> None:
         """
-        We save the context of the button that just appeared on the Stream Deck,
-        for use in future outbound events.
+        Our base class has saved the context of the button that just appeared on
+        the Stream Deck, for use in future outbound events. Now we paint it.
         """
         context = event.get("context")
         if context:
-            self._toggle_contexts.append(context)
+            # The button may not be showing whatever we sent it last time, so always paint it.
+            self.invalidate_sent_states(context)
 
         self._logger.info(
-            (f"Saved action context {context}. We now have {len(self._toggle_contexts)}"
-             f" active {self.FRIENDLY_DEVICE_NAME} contexts."))
+            "Saved action context %s. We now have %d active %s contexts.",
+            context, len(self._get_contexts()), self.FRIENDLY_DEVICE_NAME)
+
+        # Ask the browser extension for our current state, along with every other device's.
+        num_state_updates = self._num_state_updates
+        timed_out = False
+        try:
+            states = await self._browser_manager.request_all_states()
+        except asyncio.TimeoutError:
+            states, timed_out = None, True
+        if isinstance(states, Mapping):
+            # If an update came in while we waited, it's newer than our answer and has been shown already.
+            if self._num_state_updates == num_state_updates:
+                self._reported_state = self._get_sd_state(states.get(self.BROWSER_STATE_UPDATED_EVENT_TYPE))
+                await self._set_stream_deck_mute_state(self._reported_state)
+            return
 
-        # Until we know otherwise, assume there isn't an active Meet call.
-        await self._set_stream_deck_mute_state(SDToggleState.DISCONNECTED)
+        if self._reported_state is not None:
+            # Show the state the browser extension last reported, e.g. for our other buttons. Its reply to the
+            # request below only reaches us if it changes that state.
+            await self._set_stream_deck_mute_state(self._reported_state)
+        elif not timed_out:
+            # Until we know otherwise, assume there isn't an active Meet call. A browser that's just slow to
+            # answer is still there, though, so then we leave the button as it is.
+            await self._set_stream_deck_mute_state(SDToggleState.DISCONNECTED)
 
-        # Request current mute state from the browser extension.
+        # Older (or slow) browser extensions can't answer that, so request our state on its own.
         # We'll asynchronously update button states when we get a response.
         await self._browser_manager.send_to_clients(
             self._make_simple_sd_event(self.BROWSER_STATE_REQUEST_EVENT_TYPE))
 
     async def _will_disappear_handler(self, event: dict) -> None:
         """
-        Remove the disappearing button from our saved contexts. The Stream Deck
-        will send another willAppear event if/when it comes back.
+        Our base class has removed the disappearing button from our saved
+        contexts. The Stream Deck will send another willAppear event if/when it
+        comes back.
         """
         context = event.get("context")
-        if context in self._toggle_contexts:
-            self._toggle_contexts.remove(context)
+        self._set_state_messages.evict_context(context)
 
         self._logger.info(
-            (f"Removed action context {context}. We now have {len(self._toggle_contexts)}"
-             f" active {self.FRIENDLY_DEVICE_NAME} contexts."))
+            "Removed action context %s. We now have %d active %s contexts.",
+            context, len(self._get_contexts()), self.FRIENDLY_DEVICE_NAME)
+
+    def invalidate_sent_states(self, context: str | None = None) -> None:
+        """
+        Forget what we last sent to the Stream Deck for the given context (or for
+        all of our contexts), so the next state update is written out even if it
+        looks redundant. Use this whenever the Stream Deck may have lost track of
+        our button states, e.g. after reconnecting to it.
+        """
+        if context is None:
+            for record in self._get_contexts():
+                record.state = None
+        else:
+            record = self._contexts.get(context)
+            if record is not None:
+                record.state = None
 
     async def _set_stream_deck_mute_state(self, state: SDToggleState) -> None:
         """
-        Updates what's shown on our Stream Deck's toggle button.
+        Updates what's shown on our Stream Deck's toggle button, for any of our
+        contexts that aren't already showing that state.
+        """
+        changed_contexts = [record for record in self._get_contexts() if record.state is not state]
+        if not changed_contexts:
+            return
+
+        # Record our states before sending, so concurrent updates don't duplicate our writes.
+        for record in changed_contexts:
+            record.state = state
+
+        # Meet usually confirms a press with a state update, so updates soon after one are its feedback.
+        priority = OutboundPriority.KEY_PRESS if self._state_update_coalescer.is_expedited() else None
+
+        # Only the newest state queued for each button needs to be written.
+        try:
+            await asyncio.gather(*[
+                self._stream_deck.send_outbound_message(
+                    self._make_sd_set_state_event(record.context, state.value),
+                    priority=priority, supersede_key=("setState", record.context))
+                for record in changed_contexts
+            ])
+        except Exception:
+            # We can't be sure what the buttons are showing now, so don't skip the next update.
+            for record in changed_contexts:
+                record.state = None
+            raise
+        startup_timing.mark(startup_timing.REPORT_MILESTONE)
+
+    def _get_contexts(self) -> Collection[ActionContext]:
+        """
+        Returns the records for our buttons that are currently on the Stream Deck.
         """
-        events = [self._make_sd_set_state_event(
-            context, state.value) for context in self._toggle_contexts]
+        return self._contexts.contexts_for_action(self.STREAM_DECK_ACTION)
 
-        await asyncio.gather(*[
-            self._stream_deck.send_outbound_message(event) for event in events
-        ])
+    def _get_sd_state(self, state_update: dict | None) -> SDToggleState:
+        """
+        Returns the button state for one of the browser extension's state update
+        messages. No update at all means the extension couldn't find our device.
+        """
+        if not isinstance(state_update, dict) or state_update.get("disconnected"):
+            return SDToggleState.DISCONNECTED
+        elif state_update.get("muted"):
+            return SDToggleState.MUTED
+        return SDToggleState.UNMUTED
 
     def _make_sd_set_state_event(self, context: str, state: int) -> str:
-        message = json.dumps({
-            "event": "setState",
-            "context": context,
-            "payload": {
-                "state": state
-            }
-        })
-        return message
+        return self._set_state_messages.get(context, state)
@@ -1,4 +1,5 @@
 from event_handlers.base_toggle_event_handler import BaseToggleEventHandler
+from handler_registry import action_for_module
 
 
 class CameraToggleEventHandler(BaseToggleEventHandler):
@@ -7,7 +8,7 @@ class CameraToggleEventHandler(BaseToggleEventHandler):
     and toggles the camera on and off when you press the button.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglecamera"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     BROWSER_STATE_REQUEST_EVENT_TYPE = "getCameraState"
     BROWSER_STATE_UPDATED_EVENT_TYPE = "cameraMutedState"
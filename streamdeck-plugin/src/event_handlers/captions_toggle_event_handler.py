@@ -1,4 +1,5 @@
 from event_handlers.base_toggle_event_handler import BaseToggleEventHandler
+from handler_registry import action_for_module
 
 
 class CaptionsToggleEventHandler(BaseToggleEventHandler):
@@ -7,7 +8,7 @@ class CaptionsToggleEventHandler(BaseToggleEventHandler):
     and toggles captions on and off when you press the button.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglecaptions"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     BROWSER_STATE_REQUEST_EVENT_TYPE = "getCaptionsState"
     BROWSER_STATE_UPDATED_EVENT_TYPE = "captionsMutedState"
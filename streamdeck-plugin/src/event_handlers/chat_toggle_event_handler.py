@@ -1,4 +1,6 @@
+from browser_client import RoutingPolicy
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
 
 
 class ChatToggleEventHandler(EventHandler):
@@ -6,8 +8,8 @@ class ChatToggleEventHandler(EventHandler):
     A Stream Deck button that toggles display of the sidebar chat.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglechat"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     async def _key_up_handler(self, event: dict) -> None:
         chat = self._make_simple_sd_event("toggleChat")
-        await self._browser_manager.send_to_clients(chat)
+        await self._browser_manager.send_to_clients(chat, policy=RoutingPolicy.MOST_RECENT)
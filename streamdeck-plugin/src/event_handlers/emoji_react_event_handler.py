@@ -1,5 +1,7 @@
-import json
+import json_codec
+from browser_client import RoutingPolicy
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
 
 
 class EmojiReactEventHandler(EventHandler):
@@ -19,25 +21,30 @@ class EmojiReactEventHandler(EventHandler):
         "com.chrisregado.googlemeet.emojireact.thumbsdown": "👎"
     }
 
-    STREAM_DECK_ACTION_PREFIX = "com.chrisregado.googlemeet.emojireact."
+    STREAM_DECK_ACTION_PREFIX = action_for_module(__name__)
 
-    def _get_emoji_char_for_event(self, event: dict) -> str:
+    # Allow a short burst of each emoji, but not a flood of them.
+    KEY_PRESS_BURST_LIMIT = 5
+    KEY_PRESSES_PER_SEC = 2.0
+
+    # Our browser messages for each emoji action, serialized up front since they never change.
+    ACTION_TO_MESSAGE = {
+        action: json_codec.dumps({"event": "emojiReact", "emojiChar": emoji_char})
+        for action, emoji_char in ACTION_TO_EMOJI.items()
+    }
+
+    def _get_message_for_event(self, event: dict) -> str:
         action = event['action']
-        emoji_char = self.ACTION_TO_EMOJI.get(action)
-        if not emoji_char:
+        message = self.ACTION_TO_MESSAGE.get(action)
+        if not message:
             raise NotImplementedError(f"The action '{action}' was requested, but there is no corresponding emoji.")
-        return emoji_char
-
-    @staticmethod
-    def _make_emoji_react_browser_plugin_message(emoji_char) -> str:
-        return json.dumps({"event": "emojiReact", "emojiChar": emoji_char})
+        return message
 
     async def _key_up_handler(self, event: dict) -> None:
         # noinspection PyBroadException
         try:
-            emoji_char = self._get_emoji_char_for_event(event)
+            message = self._get_message_for_event(event)
         except Exception:
             self._logger.exception("Failed to find emoji for event!")
             return
-        message = self._make_emoji_react_browser_plugin_message(emoji_char)
-        await self._browser_manager.send_to_clients(message)
+        await self._browser_manager.send_to_clients(message, policy=RoutingPolicy.MOST_RECENT)
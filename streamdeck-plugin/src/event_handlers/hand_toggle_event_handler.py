@@ -1,4 +1,5 @@
 from event_handlers.base_toggle_event_handler import BaseToggleEventHandler
+from handler_registry import action_for_module
 
 
 class HandToggleEventHandler(BaseToggleEventHandler):
@@ -7,9 +8,16 @@ class HandToggleEventHandler(BaseToggleEventHandler):
     and toggles the hand on and off when you press the button.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglehand"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     BROWSER_STATE_REQUEST_EVENT_TYPE = "getHandState"
     BROWSER_STATE_UPDATED_EVENT_TYPE = "handMutedState"
     BROWSER_TOGGLE_EVENT_TYPE = "toggleHand"
     FRIENDLY_DEVICE_NAME = "Hand"
+
+    """
+    Raising and lowering your hand is visible to everyone in the call, so hold
+    presses back briefly, letting a double tap cancel out instead of flashing a
+    raised hand.
+    """
+    KEY_PRESS_COALESCE_SECS = 0.3
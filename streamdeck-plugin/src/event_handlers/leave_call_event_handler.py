@@ -1,13 +1,54 @@
+import time
+from typing import TYPE_CHECKING
+
+from browser_client import RoutingPolicy
+from context_registry import ContextRegistry
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
+
+if TYPE_CHECKING:
+    from browser_websocket_server import BrowserWebsocketServer
+    from stream_deck_client import StreamDeckWebsocketClient
 
 
 class LeaveCallEventHandler(EventHandler):
     """
     A Stream Deck button that leaves the meeting.
+
+    Presses while we're still leaving are ignored, until a tab tells us it's no
+    longer in a call (or LEAVE_TIMEOUT_SECS pass without one doing so, e.g. for
+    older extensions that don't report their tabStatus).
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.leavecall"
+    STREAM_DECK_ACTION = action_for_module(__name__)
+
+    BROWSER_EVENT_TYPES = ("tabStatus",)
+
+    LEAVE_TIMEOUT_SECS = 5.0
+
+    def __init__(
+            self,
+            stream_deck: "StreamDeckWebsocketClient",
+            browser_manager: "BrowserWebsocketServer",
+            context_registry: ContextRegistry | None = None) -> None:
+        super().__init__(stream_deck, browser_manager, context_registry)
+
+        # When we asked to leave, if we're still waiting for that to happen.
+        self._leave_requested_at: float | None = None
+
+    async def on_browser_event(self, event: dict) -> None:
+        if not event.get("inCall"):
+            self._leave_requested_at = None
+
+    async def on_all_browsers_disconnected(self) -> None:
+        self._leave_requested_at = None
 
     async def _key_up_handler(self, event: dict) -> None:
+        now = time.monotonic()
+        if self._leave_requested_at is not None and now - self._leave_requested_at < self.LEAVE_TIMEOUT_SECS:
+            self._logger.info("Ignoring a leave call press, since we're already leaving.")
+            return
+
+        self._leave_requested_at = now
         leave = self._make_simple_sd_event("leaveCall")
-        await self._browser_manager.send_to_clients(leave)
+        await self._browser_manager.send_to_clients(leave, policy=RoutingPolicy.MOST_RECENT)
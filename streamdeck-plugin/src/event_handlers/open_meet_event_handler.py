@@ -1,5 +1,6 @@
-import json
+import json_codec
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
 
 
 class OpenMeetEventHandler(EventHandler):
@@ -8,12 +9,12 @@ class OpenMeetEventHandler(EventHandler):
     web browser.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.openmeet"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
-    async def _key_up_handler(self, event: dict) -> None:
-        message = json.dumps({
-            "event": "openUrl",
-            "payload": { "url": "https://meet.google.com/landing" }
-        })
+    OPEN_MEET_MESSAGE = json_codec.dumps({
+        "event": "openUrl",
+        "payload": { "url": "https://meet.google.com/landing" }
+    })
 
-        await self._stream_deck.send_outbound_message(message)
\ No newline at end of file
+    async def _key_up_handler(self, event: dict) -> None:
+        await self._stream_deck.send_outbound_message(self.OPEN_MEET_MESSAGE)
\ No newline at end of file
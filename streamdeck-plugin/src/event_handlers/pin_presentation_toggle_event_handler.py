@@ -1,4 +1,5 @@
 from event_handlers.base_toggle_event_handler import BaseToggleEventHandler
+from handler_registry import action_for_module
 
 
 class PinPresentationToggleEventHandler(BaseToggleEventHandler):
@@ -7,7 +8,7 @@ class PinPresentationToggleEventHandler(BaseToggleEventHandler):
     screen when you press the button, and shows you the current pin state.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglepinpresentation"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     BROWSER_STATE_REQUEST_EVENT_TYPE = "getPinPresentationState"
     BROWSER_STATE_UPDATED_EVENT_TYPE = "pinPresentationMutedState"
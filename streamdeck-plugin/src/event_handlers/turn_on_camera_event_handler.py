@@ -1,4 +1,6 @@
+from browser_client import RoutingPolicy
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
 
 
 class TurnOnCameraEventHandler(EventHandler):
@@ -7,8 +9,8 @@ class TurnOnCameraEventHandler(EventHandler):
     It only turns the camera on, no matter how many times you press it.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.enablecamera"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     async def _key_up_handler(self, event: dict) -> None:
         enable = self._make_simple_sd_event("enableCamera")
-        await self._browser_manager.send_to_clients(enable)
+        await self._browser_manager.send_to_clients(enable, policy=RoutingPolicy.MOST_RECENT)
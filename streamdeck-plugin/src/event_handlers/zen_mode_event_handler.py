@@ -1,4 +1,6 @@
+from browser_client import RoutingPolicy
 from event_handlers.base_event_handler import EventHandler
+from handler_registry import action_for_module
 
 
 class ZenModeEventHandler(EventHandler):
@@ -8,8 +10,8 @@ class ZenModeEventHandler(EventHandler):
     Note that this is not an official Google Meet feature.
     """
 
-    STREAM_DECK_ACTION = "com.chrisregado.googlemeet.togglezenmode"
+    STREAM_DECK_ACTION = action_for_module(__name__)
 
     async def _key_up_handler(self, event: dict) -> None:
         message = self._make_simple_sd_event("toggleZenMode")
-        await self._browser_manager.send_to_clients(message)
+        await self._browser_manager.send_to_clients(message, policy=RoutingPolicy.MOST_RECENT)
@@ -0,0 +1,202 @@
+import importlib
+import json
+import logging
+import os
+import sys
+from typing import Iterable, List, Mapping, NamedTuple, Type, TYPE_CHECKING
+
+from context_registry import ContextRegistry
+from stream_deck_client import UNSET_ACTION
+
+if TYPE_CHECKING:
+    from browser_websocket_server import BrowserWebsocketServer
+    from event_handlers.base_event_handler import EventHandler
+    from stream_deck_client import StreamDeckWebsocketClient
+
+
+"""
+The module of the EventHandler for each of our Stream Deck actions, as declared
+in manifest.json. Actions ending in "." are prefixes, covering a family of
+actions. This is the one place that ties our actions to their handlers: each
+handler class reads its action from here (see action_for_module), and we use it
+to find the handlers for our manifest's actions without importing any of them.
+When adding a new action, add its handler's module here.
+
+Note: These modules are imported dynamically, so our PyInstaller build must be
+told to bundle them with `--collect-submodules event_handlers`.
+"""
+ACTION_HANDLER_MODULES: Mapping[str, str] = {
+    "com.chrisregado.googlemeet.togglecamera": "event_handlers.camera_toggle_event_handler",
+    "com.chrisregado.googlemeet.togglecaptions": "event_handlers.captions_toggle_event_handler",
+    "com.chrisregado.googlemeet.togglechat": "event_handlers.chat_toggle_event_handler",
+    "com.chrisregado.googlemeet.togglehand": "event_handlers.hand_toggle_event_handler",
+    "com.chrisregado.googlemeet.leavecall": "event_handlers.leave_call_event_handler",
+    "com.chrisregado.googlemeet.togglemic": "event_handlers.mic_toggle_event_handler",
+    "com.chrisregado.googlemeet.mutemic": "event_handlers.mute_mic_event_handler",
+    "com.chrisregado.googlemeet.openmeet": "event_handlers.open_meet_event_handler",
+    "com.chrisregado.googlemeet.toggleparticipants": "event_handlers.participants_toggle_event_handler",
+    "com.chrisregado.googlemeet.togglepinpresentation": "event_handlers.pin_presentation_toggle_event_handler",
+    "com.chrisregado.googlemeet.disablecamera": "event_handlers.turn_off_camera_event_handler",
+    "com.chrisregado.googlemeet.enablecamera": "event_handlers.turn_on_camera_event_handler",
+    "com.chrisregado.googlemeet.unmutemic": "event_handlers.unmute_mic_event_handler",
+    "com.chrisregado.googlemeet.emojireact.": "event_handlers.emoji_react_event_handler",
+    "com.chrisregado.googlemeet.togglezenmode": "event_handlers.zen_mode_event_handler",
+}
+
+# Each handler module's action, by the module's own name (i.e. its file name).
+_ACTIONS_BY_MODULE_NAME = {
+    module_name.rpartition(".")[2]: action for action, module_name in ACTION_HANDLER_MODULES.items()}
+
+
+def action_for_module(module_name: str) -> str:
+    """
+    Returns the action (or action prefix) of one of our handler modules, for
+    its EventHandler class to declare, e.g.
+    `STREAM_DECK_ACTION = action_for_module(__name__)`.
+    """
+    return _ACTIONS_BY_MODULE_NAME[module_name.rpartition(".")[2]]
+
+
+class HandlerSpec(NamedTuple):
+    """
+    Describes where to find the EventHandler for one of our Stream Deck actions
+    (or family of actions), without having to import it.
+    """
+    module_name: str
+    action: str | None = None
+    action_prefix: str | None = None
+
+    @classmethod
+    def for_action(cls, action: str, module_name: str) -> "HandlerSpec":
+        if action.endswith("."):
+            return cls(module_name, action_prefix=action)
+        return cls(module_name, action=action)
+
+    def load_class(self) -> Type["EventHandler"]:
+        """
+        Imports our module, and returns the EventHandler class it defines for our action.
+        """
+        module = importlib.import_module(self.module_name)
+        for value in vars(module).values():
+            if isinstance(value, type) and value.__module__ == module.__name__ and (
+                    (self.action is not None and getattr(value, "STREAM_DECK_ACTION", None) == self.action)
+                    or (self.action_prefix is not None
+                        and getattr(value, "STREAM_DECK_ACTION_PREFIX", None) == self.action_prefix)):
+                return value
+        raise ImportError(f"{self.module_name} doesn't define a handler for {self.action or self.action_prefix}")
+
+    def matches_any(self, action_uuids: Iterable[str]) -> bool:
+        return any(uuid == self.action
+                   or (self.action_prefix is not None and uuid.startswith(self.action_prefix))
+                   for uuid in action_uuids)
+
+
+"""
+Every EventHandler in our plugin, per ACTION_HANDLER_MODULES.
+"""
+HANDLER_SPECS = tuple(
+    HandlerSpec.for_action(action, module_name) for action, module_name in ACTION_HANDLER_MODULES.items())
+
+"""
+The name of our plugin's folder, which holds our manifest.json.
+"""
+PLUGIN_FOLDER_NAME = "com.chrisregado.googlemeet.sdPlugin"
+
+
+class LazyEventHandler:
+    """
+    A stand-in for one of our EventHandlers that doesn't import or create the
+    real handler until the Stream Deck sends an event for its action, e.g. when
+    one of its buttons first appears. Most users only have a few of our actions
+    on their Stream Deck, so this keeps the rest off our startup path.
+
+    Until it's loaded, a handler has no buttons on the Stream Deck, so there's
+    nothing for it to do with browser events either. Once loaded, the real
+    handler is registered with the BrowserWebsocketServer directly.
+    """
+
+    def __init__(
+            self,
+            spec: HandlerSpec,
+            stream_deck: "StreamDeckWebsocketClient",
+            browser_manager: "BrowserWebsocketServer",
+            context_registry: ContextRegistry | None = None) -> None:
+        self._logger = logging.getLogger(__name__)
+
+        self.STREAM_DECK_ACTION = spec.action or UNSET_ACTION
+        self.STREAM_DECK_ACTION_PREFIX = spec.action_prefix
+
+        self._spec = spec
+        self._stream_deck = stream_deck
+        self._browser_manager = browser_manager
+        self._context_registry = context_registry
+        self._handler: "EventHandler | None" = None
+
+    async def on_stream_deck_event(self, event: dict) -> None:
+        await self._get_handler().on_stream_deck_event(event)
+
+    async def on_stream_deck_reconnected(self) -> None:
+        if self._handler:
+            await self._handler.on_stream_deck_reconnected()
+
+    def _get_handler(self) -> "EventHandler":
+        if self._handler is None:
+            self._logger.info("Loading %s", self._spec.module_name)
+            handler_class = self._spec.load_class()
+            self._handler = handler_class(self._stream_deck, self._browser_manager, self._context_registry)
+            self._browser_manager.register_event_handler(self._handler)
+        return self._handler
+
+
+def find_manifest_path() -> str | None:
+    """
+    Finds our plugin's manifest.json by searching upwards from our executable
+    (when bundled by PyInstaller) or from our source code (when developing).
+    """
+    if getattr(sys, "frozen", False):
+        start_dir = os.path.dirname(sys.executable)
+    else:
+        start_dir = os.path.dirname(os.path.realpath(__file__))
+
+    directory = start_dir
+    while True:
+        for candidate in (os.path.join(directory, "manifest.json"),
+                          os.path.join(directory, PLUGIN_FOLDER_NAME, "manifest.json")):
+            if os.path.isfile(candidate):
+                return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def load_manifest_action_uuids(manifest_path: str) -> List[str]:
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    return [action["UUID"] for action in manifest.get("Actions", [])]
+
+
+def get_handler_specs(manifest_path: str | None) -> List[HandlerSpec]:
+    """
+    Returns the specs for the handlers of the actions declared in our manifest,
+    in the manifest's order. If we can't read the manifest, we fall back to all
+    of our handlers.
+    """
+    if manifest_path is None:
+        return list(HANDLER_SPECS)
+
+    try:
+        action_uuids = load_manifest_action_uuids(manifest_path)
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "Failed to read actions from %s. Loading all handlers.", manifest_path)
+        return list(HANDLER_SPECS)
+
+    specs: List[HandlerSpec] = []
+    for uuid in action_uuids:
+        spec = next((spec for spec in HANDLER_SPECS if spec.matches_any([uuid])), None)
+        if spec is None:
+            logging.getLogger(__name__).warning("Our manifest's %s action has no handler.", uuid)
+        elif spec not in specs:
+            specs.append(spec)
+    return specs
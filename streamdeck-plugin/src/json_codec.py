@@ -0,0 +1,57 @@
+"""
+The JSON encoder/decoder used for every message on both of our websockets.
+
+We use an accelerated JSON library if one is installed (orjson, then msgspec),
+and fall back to the standard library otherwise. None of them are required
+dependencies.
+
+Messages are always encoded to `str`, since the Stream Deck app and our browser
+extension both expect text websocket frames. The accelerated encoders produce
+compact JSON with raw UTF-8 characters, where the standard library adds spaces
+after separators and escapes non-ASCII characters. Both forms parse identically
+on the receiving end.
+"""
+
+import json
+from typing import Any, Callable
+
+_dumps: Callable[[Any], str]
+_loads: Callable[[str | bytes], Any]
+
+try:
+    import orjson
+
+    CODEC_NAME = "orjson"
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        CODEC_NAME = "msgspec"
+        _msgspec_encoder = msgspec.json.Encoder()
+        _msgspec_decoder = msgspec.json.Decoder()
+
+        def _dumps(obj: Any) -> str:
+            return _msgspec_encoder.encode(obj).decode()
+
+        _loads = _msgspec_decoder.decode
+    except ImportError:
+        CODEC_NAME = "json"
+        _dumps = json.dumps
+        _loads = json.loads
+
+
+def dumps(obj: Any) -> str:
+    return _dumps(obj)
+
+
+def loads(data: str | bytes) -> Any:
+    """
+    Raises an exception if `data` isn't valid JSON. The exception type depends on
+    which JSON library is in use.
+    """
+    return _loads(data)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to `capacity` events, after which events are only
+    allowed as fast as the bucket refills, at `refill_per_sec` events per second.
+    """
+
+    def __init__(self, capacity: int, refill_per_sec: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self._capacity = capacity
+        self._refill_per_sec = refill_per_sec
+        self._clock = clock
+
+        self._tokens = float(capacity)
+        self._refilled_at = clock()
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token for one event, if there's one available. Returns False if
+        the event should be dropped.
+        """
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self._refill_per_sec)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class KeyPressCoalescer:
+    """
+    Merges presses of the same button (i.e. the same context) that arrive within
+    `window_secs` of the first one. When the window closes, `act` is called once,
+    with the first press's event.
+
+    With `cancel_in_pairs`, presses cancel each other out in pairs instead, and
+    `act` is only called if an odd number of presses arrived. That suits toggles,
+    where a quick double tap means the user changed their mind.
+    """
+
+    def __init__(self, window_secs: float, cancel_in_pairs: bool, act: Callable[[dict], Awaitable[None]]) -> None:
+        self._logger = logging.getLogger(__name__)
+
+        self._window_secs = window_secs
+        self._cancel_in_pairs = cancel_in_pairs
+        self._act = act
+
+        # For each context with an open window: its first press, how many presses we've had, and its window task.
+        self._first_presses: Dict[str, dict] = {}
+        self._press_counts: Dict[str, int] = {}
+        self._open_windows: Dict[str, asyncio.Task] = {}
+
+        # Strong references to our window tasks, so they aren't garbage collected mid-flight.
+        self._window_tasks: List[asyncio.Task] = []
+
+    def submit(self, context: str, event: dict) -> None:
+        if context in self._first_presses:
+            self._press_counts[context] += 1
+            return
+
+        self._first_presses[context] = event
+        self._press_counts[context] = 1
+        task = asyncio.create_task(self._act_at_window_end(context))
+        self._open_windows[context] = task
+        self._window_tasks.append(task)
+        task.add_done_callback(self._window_tasks.remove)
+
+    def cancel(self, context: str) -> None:
+        """
+        Drops the presses of a context whose window is still open, e.g. because
+        its button has disappeared. Presses we're already acting on aren't affected.
+        """
+        task = self._open_windows.pop(context, None)
+        if task is None:
+            return
+        del self._first_presses[context]
+        del self._press_counts[context]
+        task.cancel()
+
+    async def _act_at_window_end(self, context: str) -> None:
+        await asyncio.sleep(self._window_secs)
+        event = self._first_presses.pop(context)
+        press_count = self._press_counts.pop(context)
+        del self._open_windows[context]
+
+        if self._cancel_in_pairs and press_count % 2 == 0:
+            self._logger.info("Ignoring %d presses of %s, which cancel each other out.", press_count, context)
+            return
+        if press_count > 1:
+            self._logger.info("Merged %d presses of %s into one.", press_count, context)
+        try:
+            await self._act(event)
+        except Exception:
+            self._logger.exception("Exception while acting on a coalesced key press.")
@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+import logging
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Set
+
+
+class KeyedTaskDispatcher:
+    """
+    Runs jobs concurrently as asyncio tasks, while guaranteeing that jobs
+    submitted with the same key run one at a time, in the order they were
+    submitted.
+
+    We use this to process inbound websocket events without making unrelated
+    buttons wait on each other, e.g. a slow toggle button shouldn't delay a
+    press on a different button, but two presses on the same button must never
+    be handled out of order.
+    """
+
+    def __init__(self, max_in_flight: int = 64) -> None:
+        """
+        `max_in_flight` bounds how many jobs may be queued or running at once.
+        Once we hit it, `submit` waits for a slot to free up, which pushes back
+        on whoever is feeding us events.
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self._in_flight_slots = asyncio.Semaphore(max_in_flight)
+        self._num_in_flight = 0
+
+        # Pending jobs for each key that currently has a worker task running.
+        self._queues: Dict[Hashable, Deque[Callable[[], Awaitable[None]]]] = {}
+
+        # Our per-key worker tasks, also kept here so they aren't garbage collected.
+        self._workers: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, job: Callable[[], Awaitable[None]]) -> None:
+        """
+        Schedule `job` to run after any previously submitted jobs with the same key.
+        Returns once the job is scheduled, not when it completes.
+        """
+        await self._in_flight_slots.acquire()
+        self._num_in_flight += 1
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            # A worker is already running for this key, and it will pick our job up.
+            queue.append(job)
+            return
+
+        self._queues[key] = deque([job])
+        worker = asyncio.create_task(self._run_jobs_for_key(key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+
+    def num_in_flight(self) -> int:
+        return self._num_in_flight
+
+    async def join(self) -> None:
+        """
+        Wait until every submitted job has finished.
+        """
+        while self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _run_jobs_for_key(self, key: Hashable) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                job = queue.popleft()
+                try:
+                    await job()
+                except Exception:
+                    self._logger.exception(
+                        f"KeyedTaskDispatcher job for key {key} raised an exception!")
+                finally:
+                    self._num_in_flight -= 1
+                    self._in_flight_slots.release()
+        finally:
+            del self._queues[key]
@@ -1,24 +1,18 @@
+# Imported first, so it can time the rest of our startup when enabled.
+import startup_timing  # noqa: F401
+
 import argparse
 import asyncio
 import logging
+from typing import Tuple
 
-from browser_websocket_server import BrowserWebsocketServer
-from event_handlers.camera_toggle_event_handler import CameraToggleEventHandler
-from event_handlers.captions_toggle_event_handler import CaptionsToggleEventHandler
-from event_handlers.chat_toggle_event_handler import ChatToggleEventHandler
-from event_handlers.hand_toggle_event_handler import HandToggleEventHandler
-from event_handlers.leave_call_event_handler import LeaveCallEventHandler
-from event_handlers.mic_toggle_event_handler import MicToggleEventHandler
-from event_handlers.mute_mic_event_handler import MuteMicEventHandler
-from event_handlers.open_meet_event_handler import OpenMeetEventHandler
-from event_handlers.participants_toggle_event_handler import ParticipantsToggleEventHandler
-from event_handlers.pin_presentation_toggle_event_handler import PinPresentationToggleEventHandler
-from event_handlers.turn_off_camera_event_handler import TurnOffCameraEventHandler
-from event_handlers.turn_on_camera_event_handler import TurnOnCameraEventHandler
-from event_handlers.unmute_mic_event_handler import UnmuteMicEventHandler
-from event_handlers.emoji_react_event_handler import EmojiReactEventHandler
-from event_handlers.zen_mode_event_handler import ZenModeEventHandler
+from browser_websocket_server import BrowserWebsocketServer, ConnectionCaps
+from context_registry import ContextRegistry
+from handler_registry import HandlerSpec, LazyEventHandler, find_manifest_path, get_handler_specs, HANDLER_SPECS
+from keyed_task_dispatcher import KeyedTaskDispatcher
+import metrics
 from stream_deck_client import StreamDeckWebsocketClient
+import traffic_recorder
 
 
 """
@@ -27,6 +21,23 @@ browser extension.
 """
 BROWSER_WEBSOCKET_PORT = 2394
 
+"""
+How many times in a row we try to reconnect to the Stream Deck app if our
+connection drops, before exiting and leaving it to the Stream Deck app to
+restart our plugin.
+"""
+STREAM_DECK_MAX_RECONNECT_ATTEMPTS = 10
+
+"""
+Our caps on browser extension connections, past which we disconnect the idlest
+ones: in total, from one web origin, and from one tab (a tab only needs one, so
+a second means the first is stale). New connections beyond a burst are only
+accepted at a limited rate. See BrowserWebsocketServer.
+"""
+BROWSER_CONNECTION_CAPS = ConnectionCaps(
+    max_clients=16, max_clients_per_origin=8, max_clients_per_tab=1,
+    connection_burst_limit=10, connections_per_sec=1.0)
+
 
 def parse_cli_args():
     """
@@ -48,49 +59,81 @@ def parse_cli_args():
     return known_args
 
 
+def create_connections(
+        metrics_registry: metrics.MetricsRegistry | None = None,
+        recorder: traffic_recorder.TrafficRecorder | None = None
+) -> Tuple[StreamDeckWebsocketClient, BrowserWebsocketServer]:
+    """
+    Creates our Stream Deck and browser connection managers, configured the way
+    we run them in production.
+    """
+    stream_deck_client = StreamDeckWebsocketClient(
+        dispatcher=KeyedTaskDispatcher(), max_reconnect_attempts=STREAM_DECK_MAX_RECONNECT_ATTEMPTS,
+        batch_window_secs=0, metrics_registry=metrics_registry, traffic_recorder=recorder)
+    browser_manager = BrowserWebsocketServer(
+        queue_broadcasts=True, connection_caps=BROWSER_CONNECTION_CAPS, dispatcher=KeyedTaskDispatcher(),
+        metrics_registry=metrics_registry, traffic_recorder=recorder)
+    return stream_deck_client, browser_manager
+
+
 def register_handlers(
         stream_deck_client: StreamDeckWebsocketClient,
-        browser_manager: BrowserWebsocketServer) -> None:
-    event_handlers = [
-        CameraToggleEventHandler(stream_deck_client, browser_manager),
-        CaptionsToggleEventHandler(stream_deck_client, browser_manager),
-        ChatToggleEventHandler(stream_deck_client, browser_manager),
-        HandToggleEventHandler(stream_deck_client, browser_manager),
-        LeaveCallEventHandler(stream_deck_client, browser_manager),
-        MicToggleEventHandler(stream_deck_client, browser_manager),
-        MuteMicEventHandler(stream_deck_client, browser_manager),
-        OpenMeetEventHandler(stream_deck_client, browser_manager),
-        ParticipantsToggleEventHandler(stream_deck_client, browser_manager),
-        PinPresentationToggleEventHandler(stream_deck_client, browser_manager),
-        TurnOffCameraEventHandler(stream_deck_client, browser_manager),
-        TurnOnCameraEventHandler(stream_deck_client, browser_manager),
-        UnmuteMicEventHandler(stream_deck_client, browser_manager),
-        EmojiReactEventHandler(stream_deck_client, browser_manager),
-        ZenModeEventHandler(stream_deck_client, browser_manager),
-    ]
-
-    for event_handler in event_handlers:
+        browser_manager: BrowserWebsocketServer,
+        specs: Tuple[HandlerSpec, ...] = HANDLER_SPECS) -> None:
+    """
+    Creates and registers every one of our EventHandlers up front.
+    """
+    context_registry = ContextRegistry()
+    for spec in specs:
+        event_handler = spec.load_class()(stream_deck_client, browser_manager, context_registry)
         browser_manager.register_event_handler(event_handler)
         stream_deck_client.register_event_handler(event_handler)
 
 
+def register_lazy_handlers(
+        stream_deck_client: StreamDeckWebsocketClient,
+        browser_manager: BrowserWebsocketServer) -> None:
+    """
+    Registers a LazyEventHandler for each action in our manifest, so handler
+    modules are only imported once the Stream Deck sends us an event for them.
+    """
+    context_registry = ContextRegistry()
+    for spec in get_handler_specs(find_manifest_path()):
+        stream_deck_client.register_event_handler(
+            LazyEventHandler(spec, stream_deck_client, browser_manager, context_registry))
+
+
 if __name__ == '__main__':
     """
     Note: The Stream Deck SDK doesn't offer any facilities for low-level logging
     from plugins, or even passing any custom CLI flags. While debugging, you may
     want to write logs to a file:
         logging.basicConfig(filename='meetplugin.log', level=logging.INFO)
+    Websocket messages are truncated at the INFO level. Use message_logging.TRACE
+    as your level to log full message bodies.
     This log file will be created in the folder of your installed plugin. On a Mac, that's:
     ~/Library/Application Support/com.elgato.StreamDeck/Plugins/com.chrisregado.googlemeet.sdPlugin/meetplugin.log
+
+    To find out where our startup time goes, set the MEETPLUGIN_STARTUP_TIMING
+    environment variable (see startup_timing.py). To inspect our queues and
+    latencies while running, set MEETPLUGIN_METRICS_PORT and then fetch
+    http://127.0.0.1:<port>/metrics (see metrics.py). To have toggle buttons
+    flip as soon as they're pressed, rather than once Meet confirms the change,
+    set MEETPLUGIN_OPTIMISTIC_TOGGLES (see base_toggle_event_handler.py). To
+    record every websocket frame for replaying later, set MEETPLUGIN_TRAFFIC_LOG
+    to a log file path (see traffic_recorder.py).
     """
 
     args = parse_cli_args()
     logging.debug(f"Starting with command line args: {args}")
 
-    browser_manager = BrowserWebsocketServer()
-    stream_deck_client = StreamDeckWebsocketClient()
+    metrics_port = metrics.get_port_from_environment()
+    metrics_registry = metrics.MetricsRegistry() if metrics_port is not None else None
+
+    stream_deck_client, browser_manager = create_connections(
+        metrics_registry, traffic_recorder.from_environment())
 
-    register_handlers(stream_deck_client, browser_manager)
+    register_lazy_handlers(stream_deck_client, browser_manager)
 
     browser_manager_loop = browser_manager.start(
         hostname="127.0.0.1", port=BROWSER_WEBSOCKET_PORT)
@@ -98,6 +141,12 @@ if __name__ == '__main__':
         port=args.port, register_event=args.register_event, plugin_uuid=args.plugin_uuid)
 
     async def websocket_loop():
+        if metrics_registry:
+            try:
+                await metrics_registry.start_http_server(metrics_port)
+            except OSError:
+                # e.g. the port is taken. Our metrics are optional, so carry on without serving them.
+                logging.exception(f"Couldn't serve metrics on port {metrics_port}; continuing without them.")
         await asyncio.gather(browser_manager_loop, stream_deck_loop)
 
     asyncio.run(websocket_loop())
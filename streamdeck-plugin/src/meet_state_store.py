@@ -0,0 +1,118 @@
+import logging
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, NamedTuple
+
+"""
+Called with a state key and its new value whenever that key's value changes.
+"""
+StateSubscriber = Callable[[str, Any], Awaitable[None]]
+
+
+class StateSnapshot(NamedTuple):
+    """
+    A read-only view of every state we know, as of one version of the store.
+    """
+    version: int
+    states: Mapping[str, Any]
+
+
+class MeetStateStore:
+    """
+    The one place that knows Meet's current state, as last reported by our
+    browser extension: whether the mic is muted, the camera is on, the hand is
+    raised, and so on.
+
+    Each state is keyed by the type of the browser extension's update event for
+    it (e.g. "micMutedState"), and its value is that update message. A value of
+    None means we don't know the state, e.g. because no browser is connected.
+
+    Subscribers are only called when a key they care about actually changes, so
+    Meet's frequent redundant updates stop here. Every change bumps our version,
+    which snapshots carry so readers can tell whether they're out of date.
+    """
+
+    def __init__(self) -> None:
+        self._logger = logging.getLogger(__name__)
+
+        self._states: Dict[str, Any] = {}
+        self._version = 0
+        self._snapshot = StateSnapshot(0, MappingProxyType({}))
+
+        # The callbacks interested in each key, in the order they subscribed.
+        self._subscribers: Dict[str, List[StateSubscriber]] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._states.get(key, default)
+
+    def tracks(self, key: str) -> bool:
+        """
+        Whether we keep the state for this key, i.e. someone has subscribed to it
+        or our browser extension has reported it.
+        """
+        return key in self._states or key in self._subscribers
+
+    def snapshot(self) -> StateSnapshot:
+        """
+        Returns every state we know, as of our current version. Snapshots are
+        only rebuilt after a change, so they're cheap to ask for repeatedly.
+        """
+        if self._snapshot.version != self._version:
+            self._snapshot = StateSnapshot(self._version, MappingProxyType(dict(self._states)))
+        return self._snapshot
+
+    def subscribe(self, keys: Iterable[str], subscriber: StateSubscriber) -> None:
+        for key in keys:
+            self._subscribers.setdefault(key, []).append(subscriber)
+
+    async def update(self, key: str, value: Any) -> bool:
+        """
+        Sets one state, and notifies its subscribers if it changed. Returns
+        whether it changed.
+        """
+        if not self._set(key, value):
+            return False
+        self._version += 1
+        await self._notify(key, value)
+        return True
+
+    async def sync(self, states: Mapping[str, Any]) -> None:
+        """
+        Replaces all of our states with a complete report from our browser
+        extension. Keys we know that the report leaves out become None, since the
+        extension couldn't find those controls.
+        """
+        new_states = {key: None for key in self._states}
+        new_states.update(states)
+        await self._update_all(new_states)
+
+    async def reset(self) -> None:
+        """
+        Forgets every state, e.g. when our last browser disconnects.
+        """
+        await self._update_all({key: None for key in self._states})
+
+    async def _update_all(self, states: Mapping[str, Any]) -> None:
+        changed_keys = [key for key, value in states.items() if self._set(key, value)]
+        if not changed_keys:
+            return
+        # One version for the whole batch, so nobody sees it half applied.
+        self._version += 1
+        for key in changed_keys:
+            await self._notify(key, self._states[key])
+
+    def _set(self, key: str, value: Any) -> bool:
+        if key in self._states and self._states[key] == value:
+            return False
+        self._states[key] = value
+        return True
+
+    async def _notify(self, key: str, value: Any) -> None:
+        for subscriber in self._subscribers.get(key, ()):
+            try:
+                await subscriber(key, value)
+            except Exception:
+                self._logger.exception("Exception while notifying a subscriber of a %s change.", key)
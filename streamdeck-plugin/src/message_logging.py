@@ -0,0 +1,73 @@
+import logging
+from typing import List
+
+"""
+A log level below DEBUG, for logging full websocket message bodies. Enable it with
+e.g. `logging.basicConfig(level=message_logging.TRACE)`.
+"""
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+"""
+Message bodies logged at INFO level are cut off after this many characters.
+"""
+DEFAULT_MAX_PAYLOAD_CHARS = 200
+
+
+class MessageLogger:
+    """
+    Logs the websocket messages flowing through our message hot paths.
+
+    Nothing is formatted unless a log record is actually going to be emitted, so
+    messages cost us next to nothing when logging is turned off, which it is in
+    our packaged plugin.
+
+    At INFO level, we log a truncated copy of each message. At TRACE level, we log
+    full message bodies, optionally only for every Nth message to keep log volume
+    manageable under heavy traffic.
+    """
+
+    def __init__(
+            self,
+            logger: logging.Logger,
+            max_payload_chars: int | None = DEFAULT_MAX_PAYLOAD_CHARS,
+            trace_sample_interval: int = 1) -> None:
+        """
+        Set `max_payload_chars` to None to log full messages at INFO level.
+        `trace_sample_interval` sets how often full messages are traced, e.g. 10
+        traces every 10th message (the rest are still logged at INFO level).
+        """
+        self._logger = logger
+        self._max_payload_chars = max_payload_chars
+        self._trace_sample_interval = max(trace_sample_interval, 1)
+        self._num_messages_seen = 0
+
+    def log_message(self, description: str, message: str | bytes) -> None:
+        if not self._logger.isEnabledFor(logging.INFO):
+            return
+
+        if self._logger.isEnabledFor(TRACE):
+            self._num_messages_seen += 1
+            if self._num_messages_seen % self._trace_sample_interval == 0:
+                self._logger.log(TRACE, "%s Message: %s", description, message)
+                return
+
+        self._logger.info("%s Message: %s", description, self._truncate(message))
+
+    def log_messages(self, description: str, messages: List[str]) -> None:
+        """
+        Logs a batch of messages, e.g. ones we're about to write in one go.
+        """
+        if len(messages) == 1:
+            self.log_message(description, messages[0])
+        elif self._logger.isEnabledFor(logging.INFO):
+            self.log_message(f"{description} ({len(messages)} messages)", "\n".join(messages))
+
+    def _truncate(self, message: str | bytes) -> str | bytes:
+        if self._max_payload_chars is None or len(message) <= self._max_payload_chars:
+            return message
+
+        suffix = f"... ({len(message) - self._max_payload_chars} more)"
+        if isinstance(message, bytes):
+            return message[:self._max_payload_chars] + suffix.encode()
+        return message[:self._max_payload_chars] + suffix
@@ -0,0 +1,262 @@
+"""
+A lightweight, in-process metrics registry for our plugin: counters, gauges and
+fixed-bucket histograms, optionally served in Prometheus' text format over HTTP
+on 127.0.0.1.
+
+Metrics are off unless the MEETPLUGIN_METRICS_PORT environment variable is set.
+Components given the DISABLED registry get no-op metrics, and skip their timing
+measurements entirely, so metrics cost us next to nothing when they're off.
+"""
+
+import asyncio
+import bisect
+import logging
+import math
+import os
+from typing import Callable, Dict, Iterator, List, Tuple
+
+PORT_ENVIRONMENT_VARIABLE = "MEETPLUGIN_METRICS_PORT"
+
+"""
+Histogram buckets for our message handling latencies, in seconds. Everything
+here should normally take well under a millisecond.
+"""
+DEFAULT_LATENCY_BUCKETS_SECS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# A metric sample: name suffix, label pairs, and value.
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+class Counter:
+    """
+    A count that only goes up, optionally broken down by the value of one label.
+    """
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, label_name: str | None = None) -> None:
+        self.name = name
+        self.description = description
+        self._label_name = label_name
+        self._values: Dict[str | None, float] = {}
+
+    def inc(self, amount: float = 1, label: str | None = None) -> None:
+        self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label: str | None = None) -> float:
+        return self._values.get(label, 0)
+
+    def samples(self) -> Iterator[Sample]:
+        for label, value in self._values.items():
+            yield "", _make_labels(self._label_name, label), value
+
+
+class Gauge:
+    """
+    A value that can go up and down. Gauges with a `callback` read their value
+    when they're collected, so they cost nothing in between.
+    """
+    TYPE = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable[[], float] | None = None) -> None:
+        self.name = name
+        self.description = description
+        self.callback = callback
+        self._value: float = 0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def value(self) -> float:
+        return self.callback() if self.callback else self._value
+
+    def samples(self) -> Iterator[Sample]:
+        yield "", (), self.value()
+
+
+class Histogram:
+    """
+    Counts observations in fixed buckets, optionally broken down by the value of
+    one label.
+    """
+    TYPE = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            description: str,
+            label_name: str | None = None,
+            buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS_SECS) -> None:
+        self.name = name
+        self.description = description
+        self._label_name = label_name
+        self._buckets = tuple(sorted(buckets))
+
+        # For each label value: the count in each bucket (plus +Inf), then the sum of observations.
+        self._counts: Dict[str | None, List[int]] = {}
+        self._sums: Dict[str | None, float] = {}
+
+    def observe(self, value: float, label: str | None = None) -> None:
+        counts = self._counts.get(label)
+        if counts is None:
+            counts = [0] * (len(self._buckets) + 1)
+            self._counts[label] = counts
+            self._sums[label] = 0.0
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._sums[label] += value
+
+    def count(self, label: str | None = None) -> int:
+        return sum(self._counts.get(label, ()))
+
+    def samples(self) -> Iterator[Sample]:
+        for label, counts in self._counts.items():
+            labels = _make_labels(self._label_name, label)
+            cumulative_count = 0
+            for upper_bound, count in zip(self._buckets + (math.inf,), counts):
+                cumulative_count += count
+                yield "_bucket", labels + (("le", _format_value(upper_bound)),), cumulative_count
+            yield "_sum", labels, self._sums[label]
+            yield "_count", labels, cumulative_count
+
+
+class _NullMetric:
+    """
+    Stands in for every kind of metric when metrics are disabled.
+    """
+
+    def inc(self, amount: float = 1, label: str | None = None) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float, label: str | None = None) -> None:
+        pass
+
+
+_NULL_METRIC = _NullMetric()
+
+
+class MetricsRegistry:
+    """
+    Creates and collects our metrics. Asking for a metric that already exists
+    returns the existing one.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self._logger = logging.getLogger(__name__)
+
+        """
+        Check this before taking any measurements that cost something, e.g.
+        reading the clock to time a dispatch.
+        """
+        self.enabled = enabled
+
+        self._metrics: Dict[str, Counter | Gauge | Histogram] = {}
+
+    def counter(self, name: str, description: str, label_name: str | None = None) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, description, label_name))
+
+    def gauge(self, name: str, description: str, callback: Callable[[], float] | None = None) -> Gauge:
+        gauge = self._get_or_create(name, lambda: Gauge(name, description, callback))
+        if callback and self.enabled:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(
+            self,
+            name: str,
+            description: str,
+            label_name: str | None = None,
+            buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS_SECS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, description, label_name, buckets))
+
+    def get(self, name: str) -> Counter | Gauge | Histogram | None:
+        return self._metrics.get(name)
+
+    def render_text(self) -> str:
+        """
+        Renders all of our metrics in Prometheus' text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for suffix, labels, value in metric.samples():
+                label_text = ",".join(f'{name}="{_escape_label_value(label_value)}"'
+                                      for name, label_value in labels)
+                label_text = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"{metric.name}{suffix}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    async def start_http_server(self, port: int) -> asyncio.Server:
+        """
+        Serves our metrics over HTTP on 127.0.0.1 only, e.g. for
+        `curl http://127.0.0.1:<port>/metrics`.
+        """
+        server = await asyncio.start_server(self._handle_http_request, "127.0.0.1", port)
+        self._logger.info("Serving metrics on http://127.0.0.1:%d/metrics", server.sockets[0].getsockname()[1])
+        return server
+
+    async def _handle_http_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            request_parts = request_line.decode("latin-1").split()
+            if len(request_parts) >= 2 and request_parts[0] == "GET" and request_parts[1] in ("/", "/metrics"):
+                status, body = "200 OK", self.render_text().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write((f"HTTP/1.1 {status}\r\n"
+                          "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                          f"Content-Length: {len(body)}\r\n"
+                          "Connection: close\r\n\r\n").encode() + body)
+            await writer.drain()
+        except Exception:
+            self._logger.exception("Exception while serving metrics.")
+        finally:
+            writer.close()
+
+    def _get_or_create(self, name: str, create: Callable):
+        if not self.enabled:
+            return _NULL_METRIC
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = create()
+            self._metrics[name] = metric
+        return metric
+
+
+"""
+The registry for components that weren't given one. Its metrics do nothing.
+"""
+DISABLED = MetricsRegistry(enabled=False)
+
+
+def get_port_from_environment() -> int | None:
+    """
+    Returns the port to serve metrics on, or None if metrics are disabled.
+    """
+    port = os.environ.get(PORT_ENVIRONMENT_VARIABLE)
+    if not port:
+        return None
+    try:
+        return int(port)
+    except ValueError:
+        logging.getLogger(__name__).error("Ignoring invalid %s: %s", PORT_ENVIRONMENT_VARIABLE, port)
+        return None
+
+
+def _make_labels(label_name: str | None, label: str | None) -> Tuple[Tuple[str, str], ...]:
+    return ((label_name, str(label)),) if label_name else ()
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
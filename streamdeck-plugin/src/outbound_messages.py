@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import functools
+from typing import Dict
+
+import json_codec
+
+
+@functools.lru_cache(maxsize=None)
+def make_simple_event(event_type: str) -> str:
+    """
+    Returns the serialized form of a message consisting of only an event type,
+    e.g. `{"event": "toggleMic"}`. We only have a handful of these, so they're
+    serialized once and then reused for every key press.
+    """
+    return json_codec.dumps({"event": event_type})
+
+
+def make_set_state_event(context: str, state: int) -> str:
+    return json_codec.dumps({
+        "event": "setState",
+        "context": context,
+        "payload": {
+            "state": state
+        }
+    })
+
+
+class SetStateMessageCache:
+    """
+    A bounded LRU cache of serialized Stream Deck setState messages, for each
+    (context, state) pair we've sent, so repeatedly updating a button doesn't
+    re-serialize identical messages.
+    """
+
+    def __init__(self, max_contexts: int = 128) -> None:
+        self._max_contexts = max_contexts
+
+        # Serialized messages by state value, for each context, in least-recently-used order.
+        self._messages: OrderedDict[str, Dict[int, str]] = OrderedDict()
+
+    def get(self, context: str, state: int) -> str:
+        messages_for_context = self._messages.get(context)
+        if messages_for_context is None:
+            messages_for_context = {}
+            self._messages[context] = messages_for_context
+            if len(self._messages) > self._max_contexts:
+                self._messages.popitem(last=False)
+        else:
+            self._messages.move_to_end(context)
+
+        message = messages_for_context.get(state)
+        if message is None:
+            message = make_set_state_event(context, state)
+            messages_for_context[state] = message
+        return message
+
+    def evict_context(self, context: str) -> None:
+        """
+        Drop our messages for a context that's gone away, e.g. after willDisappear.
+        """
+        self._messages.pop(context, None)
@@ -0,0 +1,129 @@
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, Hashable, Iterator, List, Tuple
+
+
+class OutboundPriority(IntEnum):
+    """
+    How urgently a message to the Stream Deck should be written. Lower values are
+    written first.
+    """
+
+    # Feedback for a button the user just pressed, which they're watching for.
+    KEY_PRESS = 0
+
+    # Everything else, e.g. state updates from Meet and buttons being repainted.
+    NORMAL = 1
+
+
+"""
+The priority of the messages sent from the current context, unless a sender
+says otherwise. EventHandlers raise it while handling a key press, so all of the
+press's feedback goes out ahead of everything else, however deep in our code
+it's sent from.
+"""
+OUTBOUND_PRIORITY: ContextVar[OutboundPriority] = ContextVar("outbound_priority", default=OutboundPriority.NORMAL)
+
+
+@contextmanager
+def outbound_priority(priority: OutboundPriority) -> Iterator[None]:
+    """
+    Sends the messages sent within this block (including from tasks started
+    within it) with the given priority.
+    """
+    token = OUTBOUND_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        OUTBOUND_PRIORITY.reset(token)
+
+
+class OutboundMessage:
+    """
+    One message waiting in an OutboundQueue, and the future its senders wait on
+    until it's been written.
+    """
+
+    __slots__ = ("message", "priority", "supersede_key", "enqueued_at", "written", "superseded")
+
+    def __init__(self, message: str, priority: OutboundPriority, supersede_key: Hashable | None,
+                 enqueued_at: float, written: asyncio.Future | None = None) -> None:
+        self.message = message
+        self.priority = priority
+        self.supersede_key = supersede_key
+        self.enqueued_at = enqueued_at
+        self.written = written
+
+        # Set once a newer message with the same supersede_key has taken our place.
+        self.superseded = False
+
+
+class OutboundQueue:
+    """
+    Outbound messages waiting for our writer, in priority order, and in the order
+    they were sent within each priority.
+
+    A message sent with a `supersede_key` replaces any message with the same key
+    that's still waiting, e.g. so that only the newest of several queued setState
+    messages for one button is written. The replacement joins the back of the
+    queue, at the more urgent of its own and the replaced message's priorities,
+    and shares the replaced message's future, so the replaced message's senders
+    are released once it's written instead.
+    """
+
+    def __init__(self) -> None:
+        self._messages: Tuple[Deque[OutboundMessage], ...] = tuple(deque() for _ in OutboundPriority)
+
+        # The waiting message for each supersede_key.
+        self._superseding: Dict[Hashable, OutboundMessage] = {}
+
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def put(self, message: OutboundMessage) -> OutboundMessage | None:
+        """
+        Queues a message. Returns the message it superseded, if any.
+        """
+        superseded = None
+        if message.supersede_key is not None:
+            superseded = self._superseding.get(message.supersede_key)
+            if superseded is not None:
+                superseded.superseded = True
+                message.priority = min(message.priority, superseded.priority)
+                message.written = superseded.written
+                self._len -= 1
+            self._superseding[message.supersede_key] = message
+        self._messages[message.priority].append(message)
+        self._len += 1
+        return superseded
+
+    def pop(self) -> OutboundMessage:
+        """
+        Removes and returns our most urgent message. Raises IndexError if we're empty.
+        """
+        for messages in self._messages:
+            while messages:
+                message = messages.popleft()
+                if message.superseded:
+                    continue
+                if message.supersede_key is not None:
+                    del self._superseding[message.supersede_key]
+                self._len -= 1
+                return message
+        raise IndexError("pop from an empty OutboundQueue")
+
+    def pop_all(self) -> List[OutboundMessage]:
+        """
+        Removes and returns all of our messages, most urgent first.
+        """
+        messages = [message for queue in self._messages for message in queue if not message.superseded]
+        for queue in self._messages:
+            queue.clear()
+        self._superseding.clear()
+        self._len = 0
+        return messages
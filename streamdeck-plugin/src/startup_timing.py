@@ -0,0 +1,204 @@
+"""
+An opt-in report of how long our plugin takes to start up, for tracking down
+slow cold starts (particularly in our PyInstaller build, where `-X importtime`
+isn't available).
+
+Set the MEETPLUGIN_STARTUP_TIMING environment variable to enable it. We time
+every module import from then on (like `-X importtime`), plus milestones such as
+registering with the Stream Deck app and sending our first setState. The report
+is logged at INFO level once we've sent our first setState. If the variable is
+set to anything other than "1", it's also treated as a file path the report is
+appended to, since our packaged plugin doesn't log anywhere by default.
+
+This module must be imported before anything else in main.py, so its import
+timer can see our other imports.
+"""
+
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, List, NamedTuple
+
+ENVIRONMENT_VARIABLE = "MEETPLUGIN_STARTUP_TIMING"
+
+"""
+The milestone after which we log our report.
+"""
+REPORT_MILESTONE = "first_set_state"
+
+
+class ImportTiming(NamedTuple):
+    module_name: str
+    self_secs: float
+    cumulative_secs: float
+    depth: int
+
+
+class StartupTimer:
+    """
+    Records module import times and named milestones, relative to when the timer
+    was created.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self._clock = clock
+        self._started_at = clock()
+
+        """
+        Every import we've timed, in the order they finished (so nested imports
+        come before the modules that imported them, as with `-X importtime`).
+        """
+        self.imports: List[ImportTiming] = []
+
+        # The first time each milestone was reached, in seconds after we started.
+        self.milestones: dict[str, float] = {}
+
+        # For each import in progress, the total time spent in its nested imports so far.
+        self._nested_import_secs: List[float] = []
+
+        self._import_finder: _TimingFinder | None = None
+
+    def mark(self, milestone: str) -> bool:
+        """
+        Records the first time we reach a milestone. Returns False if we'd
+        already reached it.
+        """
+        if milestone in self.milestones:
+            return False
+        self.milestones[milestone] = self._clock() - self._started_at
+        return True
+
+    def install_import_hook(self) -> None:
+        if self._import_finder is None:
+            self._import_finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._import_finder)
+
+    def uninstall_import_hook(self) -> None:
+        if self._import_finder is not None:
+            sys.meta_path.remove(self._import_finder)
+            self._import_finder = None
+
+    def format_report(self) -> str:
+        lines = ["Startup timing report:", "import time: self [us] | cumulative | imported package"]
+        for timing in self.imports:
+            lines.append(
+                f"import time: {timing.self_secs * 1e6:9.0f} | {timing.cumulative_secs * 1e6:10.0f} |"
+                f" {'  ' * timing.depth}{timing.module_name}")
+        for milestone, secs in self.milestones.items():
+            lines.append(f"{milestone}: {secs * 1000:.1f} ms after startup")
+        return "\n".join(lines)
+
+    def _exec_module_timed(self, module_name: str, loader: importlib.abc.Loader, module: Any) -> None:
+        self._nested_import_secs.append(0.0)
+        started_at = self._clock()
+        try:
+            loader.exec_module(module)
+        finally:
+            cumulative_secs = self._clock() - started_at
+            nested_secs = self._nested_import_secs.pop()
+            if self._nested_import_secs:
+                self._nested_import_secs[-1] += cumulative_secs
+            self.imports.append(ImportTiming(
+                module_name, cumulative_secs - nested_secs, cumulative_secs, len(self._nested_import_secs)))
+
+
+class _TimingLoader:
+    """
+    Wraps a module's real loader to time its execution. Anything else is
+    forwarded to the real loader.
+    """
+
+    def __init__(self, loader: importlib.abc.Loader, timer: StartupTimer) -> None:
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec: Any) -> Any:
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module: Any) -> None:
+        # Don't leave our wrapper visible to the module (or anything that inspects it later).
+        module.__loader__ = self._loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self._loader
+        self._timer._exec_module_timed(module.__name__, self._loader, module)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds modules using the rest of `sys.meta_path`, and wraps their loaders
+    with a _TimingLoader.
+    """
+
+    def __init__(self, timer: StartupTimer) -> None:
+        self._timer = timer
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimingLoader(spec.loader, self._timer)
+        return spec
+
+
+_timer: StartupTimer | None = None
+_report_path: str | None = None
+
+
+def enable(report_path: str | None = None) -> StartupTimer:
+    global _timer, _report_path
+    if _timer is None:
+        _timer = StartupTimer()
+        _timer.install_import_hook()
+    _report_path = report_path
+    return _timer
+
+
+def disable() -> None:
+    global _timer, _report_path
+    if _timer is not None:
+        _timer.uninstall_import_hook()
+    _timer = None
+    _report_path = None
+
+
+def mark(milestone: str) -> None:
+    """
+    Records a startup milestone, if startup timing is enabled. Cheap enough to
+    call from our message hot paths when it isn't.
+    """
+    if _timer is None or not _timer.mark(milestone):
+        return
+
+    if milestone == REPORT_MILESTONE:
+        _report(_timer)
+
+
+def _report(timer: StartupTimer) -> None:
+    # Imports after this point aren't part of our startup.
+    timer.uninstall_import_hook()
+
+    report = timer.format_report()
+    logging.getLogger(__name__).info(report)
+    if _report_path:
+        try:
+            with open(_report_path, "a", encoding="utf-8") as report_file:
+                report_file.write(report + "\n")
+        except OSError:
+            logging.getLogger(__name__).exception("Failed to write startup timing report to %s", _report_path)
+
+
+_environment_value = os.environ.get(ENVIRONMENT_VARIABLE)
+if _environment_value:
+    enable(report_path=None if _environment_value == "1" else _environment_value)
@@ -1,12 +1,32 @@
-import json
+import asyncio
+from collections import deque
+from collections.abc import Mapping
 import logging
-from typing import List, TYPE_CHECKING
+import random
+import time
+from typing import Deque, Hashable, List, TYPE_CHECKING
 import websockets
 
+from action_dispatch_table import ActionDispatchTable
+import json_codec
+from keyed_task_dispatcher import KeyedTaskDispatcher
+from message_logging import MessageLogger
+import metrics
+from outbound_queue import OUTBOUND_PRIORITY, OutboundMessage, OutboundPriority, OutboundQueue
+import startup_timing
+from stream_deck_events import to_typed_stream_deck_event
+from traffic_recorder import CLOSED, INBOUND, OPENED, OUTBOUND, STREAM_DECK_LINK, TrafficRecorder
+
 if TYPE_CHECKING:
     from event_handlers.base_event_handler import EventHandler
 
 
+"""
+The placeholder STREAM_DECK_ACTION of handlers that don't target a specific action.
+"""
+UNSET_ACTION = "(invalid)"
+
+
 class StreamDeckWebsocketClient:
     """
     The StreamDeckWebsocketClient manages our connection to the Stream Deck
@@ -14,58 +34,361 @@ class StreamDeckWebsocketClient:
     plugin's EventHandlers.
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            dispatcher: KeyedTaskDispatcher | None = None,
+            max_reconnect_attempts: int = 0,
+            reconnect_base_delay_secs: float = 0.05,
+            reconnect_max_delay_secs: float = 5.0,
+            max_buffered_messages: int = 256,
+            batch_window_secs: float | None = None,
+            metrics_registry: metrics.MetricsRegistry | None = None,
+            traffic_recorder: TrafficRecorder | None = None):
         """
         Remember to call start() before attempting to use your new instance!
+
+        By default, we finish handling each inbound event before reading the next
+        one. If a `dispatcher` is given, events are instead handled concurrently,
+        while events for the same action instance (i.e. the same button) are
+        still handled in order.
+
+        By default, start() returns as soon as our connection drops, and the
+        Stream Deck app will restart our plugin. With `max_reconnect_attempts`
+        set, we instead try to reconnect that many times in a row, with jittered
+        exponential backoff between `reconnect_base_delay_secs` and
+        `reconnect_max_delay_secs`. That keeps our process (and all of our
+        handlers' state) alive, which is much faster than a cold start. Outbound
+        messages sent while we're reconnecting are buffered, keeping only the
+        newest `max_buffered_messages`.
+
+        By default, each outbound message is written as soon as it's sent. With
+        `batch_window_secs` set, messages are instead queued for a single writer
+        task, which waits that many seconds after the first message arrives in an
+        empty queue (or for the next event loop iteration, for 0), then writes
+        everything queued in one flush. That turns updates to many buttons at
+        once, e.g. after a profile switch, into a single burst instead of many
+        interleaved writes. Each flush is written in priority order (see
+        OutboundQueue), without the setStates newer ones superseded, so the
+        feedback for a key press never waits behind a backlog of stale updates.
+
+        Pass a `metrics_registry` to record our dispatch times, reconnects, etc.,
+        and a `traffic_recorder` to record every frame we send and receive.
         """
 
         self._logger = logging.getLogger(__name__)
+        self._message_logger = MessageLogger(self._logger)
 
         """
         Any EventHandlers registered to receive inbound events from the Stream Deck.
         """
         self._handlers: List["EventHandler"] = []
 
+        """
+        An index of our registered EventHandlers by the Stream Deck action(s)
+        they handle, so each inbound event is only dispatched to the handlers
+        that care about it.
+        """
+        self._dispatch_table: ActionDispatchTable["EventHandler"] = ActionDispatchTable()
+
+        self._dispatcher = dispatcher
+
         """
         Our socket to the Stream Deck desktop software.
         """
         self._websocket: websockets.ClientConnection | None = None
 
+        self._max_reconnect_attempts = max_reconnect_attempts
+        self._reconnect_base_delay_secs = reconnect_base_delay_secs
+        self._reconnect_max_delay_secs = reconnect_max_delay_secs
+
+        """
+        Outbound messages waiting for us to reconnect to the Stream Deck. When
+        full, the oldest messages are dropped first.
+        """
+        self._buffered_messages: Deque[str] = deque(maxlen=max_buffered_messages)
+
+        """
+        The outbound messages waiting for our writer task, the task itself while
+        it's running, and whether it's in the middle of writing a batch.
+        """
+        self._batch_window_secs = batch_window_secs
+        self._outbound_queue = OutboundQueue()
+        self._outbound_writer_task: asyncio.Task | None = None
+        self._outbound_writing = False
+
+        # Numbers our connections in the traffic recorder's log.
+        self._traffic_recorder = traffic_recorder
+        self._connection_id = 0
+
+        self._metrics = metrics_registry or metrics.DISABLED
+        self._dispatch_seconds = self._metrics.histogram(
+            "streamdeck_dispatch_seconds", "Time spent handling each Stream Deck event, by action.", "action")
+        self._handler_exceptions = self._metrics.counter(
+            "streamdeck_handler_exceptions_total", "Exceptions raised by handlers of Stream Deck events, by action.",
+            "action")
+        self._reconnects = self._metrics.counter(
+            "streamdeck_reconnects_total", "Successful reconnections to the Stream Deck app.")
+        self._connect_failures = self._metrics.counter(
+            "streamdeck_connect_failures_total", "Failed attempts to connect to the Stream Deck app.")
+        self._dropped_messages = self._metrics.counter(
+            "streamdeck_dropped_messages_total", "Outbound messages dropped from our reconnection buffer.")
+        self._outbound_batch_sizes = self._metrics.histogram(
+            "streamdeck_outbound_batch_size", "Messages written to the Stream Deck per flush of our writer task.",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+        self._outbound_wait_seconds = self._metrics.histogram(
+            "streamdeck_outbound_wait_seconds", "Time outbound messages spent queued for our writer, by priority.",
+            "priority")
+        self._superseded_messages = self._metrics.counter(
+            "streamdeck_superseded_messages_total", "Queued outbound messages replaced by newer ones.")
+        self._metrics.gauge(
+            "streamdeck_outbound_queue_depth", "Outbound messages queued for our writer.",
+            lambda: len(self._outbound_queue))
+        self._metrics.gauge(
+            "streamdeck_buffered_messages", "Outbound messages waiting for us to reconnect.",
+            lambda: len(self._buffered_messages))
+        if dispatcher:
+            self._metrics.gauge(
+                "streamdeck_dispatcher_in_flight", "Stream Deck events queued or being handled.",
+                dispatcher.num_in_flight)
+
     async def start(self, port: int, register_event: str, plugin_uuid: str) -> None:
         uri = f"ws://127.0.0.1:{port}"
-        self._websocket = await websockets.connect(uri)
-
-        # Complete the mandatory Stream Deck Plugin registration procedure:
-        await self.send_outbound_message(json.dumps({
+        registration_message = json_codec.dumps({
             "event": register_event,
             "uuid": plugin_uuid
-        }))
+        })
+
+        has_connected = False
+        failed_attempts = 0
+        while True:
+            try:
+                websocket = await websockets.connect(uri)
+            except OSError:
+                if not self._max_reconnect_attempts:
+                    raise
+                self._connect_failures.inc()
+                self._logger.warning("Failed to connect to Stream Deck.", exc_info=True)
+            else:
+                failed_attempts = 0
+                if has_connected:
+                    self._reconnects.inc()
+                    await self._notify_reconnected()
+                has_connected = True
+                await self._run_connection(websocket, registration_message)
 
+            if failed_attempts >= self._max_reconnect_attempts:
+                return
+            failed_attempts += 1
+            await asyncio.sleep(self._get_reconnect_delay_secs(failed_attempts))
+
+    async def _run_connection(self, websocket: websockets.ClientConnection,
+                              registration_message: str) -> None:
+        """
+        Registers our plugin over a freshly connected socket, and processes its
+        inbound messages until it disconnects.
+        """
+        self._connection_id += 1
+        if self._traffic_recorder:
+            self._traffic_recorder.record(STREAM_DECK_LINK, OPENED, self._connection_id)
         try:
-            # This is an infinite loop until the connection dies:
-            await self._message_receive_loop(self._websocket)
+            """
+            Complete the mandatory Stream Deck Plugin registration procedure, then
+            write whatever we buffered while disconnected. Senders can't use our
+            socket until both are written, so nothing (however urgent) gets ahead of
+            them, and buffered messages can't land after newer ones.
+            """
+            self._message_logger.log_message("Registering with Stream Deck.", registration_message)
+            await websocket.send(registration_message)
+            if self._traffic_recorder:
+                self._traffic_recorder.record(STREAM_DECK_LINK, OUTBOUND, self._connection_id, registration_message)
+            startup_timing.mark("registered")
+
+            if await self._flush_buffered_messages(websocket):
+                self._websocket = websocket
+                # This is an infinite loop until the connection dies:
+                await self._message_receive_loop(websocket)
+        except websockets.ConnectionClosed:
+            if not self._max_reconnect_attempts:
+                raise
         finally:
-            await self._websocket.close()
+            self._websocket = None
+            self._abandon_outbound_queue()
+            await websocket.close()
+            if self._traffic_recorder:
+                self._traffic_recorder.record(STREAM_DECK_LINK, CLOSED, self._connection_id)
         self._logger.warning("Websocket to Stream Deck disconnected!")
 
+    def _get_reconnect_delay_secs(self, attempt: int) -> float:
+        """
+        Exponential backoff, randomized so we don't retry in lockstep with anything else.
+        """
+        delay = min(self._reconnect_max_delay_secs,
+                    self._reconnect_base_delay_secs * (2 ** (attempt - 1)))
+        return random.uniform(delay / 2, delay)
+
+    async def _notify_reconnected(self) -> None:
+        self._logger.info("Reconnected to Stream Deck.")
+        for handler in self._handlers:
+            try:
+                await handler.on_stream_deck_reconnected()
+            except Exception:
+                self._logger.exception(
+                    "StreamDeckWebsocketClient received an exception from EventHandler!")
+
+    async def _flush_buffered_messages(self, websocket: websockets.ClientConnection) -> bool:
+        """
+        Writes our buffered messages to a new connection, including any buffered
+        while we write. Returns False if the connection dropped first, leaving
+        the rest buffered.
+        """
+        while self._buffered_messages:
+            messages = list(self._buffered_messages)
+            self._buffered_messages.clear()
+            if not await self._write_messages(messages, websocket):
+                return False
+        return True
+
     def register_event_handler(self, handler: "EventHandler") -> None:
         """
         Register your EventHandler with this method to have it receive callbacks
         whenever we get an event over the wire from the Stream Deck app.
+
+        Handlers declaring a STREAM_DECK_ACTION and/or STREAM_DECK_ACTION_PREFIX
+        only receive events for matching actions. Handlers that don't declare an
+        action receive every event, and are left to filter for themselves.
         """
         self._handlers.append(handler)
 
-    async def send_outbound_message(self, message: str) -> None:
+        action = getattr(handler, "STREAM_DECK_ACTION", None)
+        action_prefix = getattr(handler, "STREAM_DECK_ACTION_PREFIX", None)
+        has_action = isinstance(action, str) and action != UNSET_ACTION
+        has_action_prefix = isinstance(action_prefix, str)
+
+        if has_action:
+            self._dispatch_table.add_exact(action, handler)
+        if has_action_prefix:
+            self._dispatch_table.add_prefix(action_prefix, handler)
+        if not has_action and not has_action_prefix:
+            self._dispatch_table.add_catch_all(handler)
+
+    async def send_outbound_message(
+            self, message: str, priority: OutboundPriority | None = None,
+            supersede_key: Hashable | None = None) -> None:
+        """
+        Send a message from our plugin to the Stream Deck app. When queueing,
+        this returns once the message has been written.
+
+        Queued messages are written in order of `priority`, which defaults to
+        the current context's OUTBOUND_PRIORITY. A message with a
+        `supersede_key` replaces any queued message with the same key, e.g. an
+        older setState for the same button.
+        """
+        if self._batch_window_secs is None or not self._websocket:
+            await self._write_messages([message])
+            return
+
+        outbound_message = OutboundMessage(
+            message, OUTBOUND_PRIORITY.get() if priority is None else priority, supersede_key,
+            time.perf_counter() if self._metrics.enabled else 0.0)
+        if self._outbound_queue.put(outbound_message) is not None:
+            self._superseded_messages.inc()
+        else:
+            outbound_message.written = asyncio.get_running_loop().create_future()
+        if self._outbound_writer_task is None:
+            self._outbound_writer_task = asyncio.create_task(self._drain_outbound_queue())
+        # Shielded, so one sender being cancelled doesn't cancel the write for everyone else.
+        await asyncio.shield(outbound_message.written)
+
+    async def _drain_outbound_queue(self) -> None:
+        """
+        Our writer task: once our batch window has passed, writes everything
+        queued in one flush, most urgent first. Messages queued meanwhile go out
+        in the next flush, until the queue is empty.
+        """
+        await asyncio.sleep(self._batch_window_secs)
+
+        while self._outbound_queue:
+            batch = self._outbound_queue.pop_all()
+            self._outbound_batch_sizes.observe(len(batch))
+            if self._metrics.enabled:
+                now = time.perf_counter()
+                for outbound_message in batch:
+                    self._outbound_wait_seconds.observe(
+                        now - outbound_message.enqueued_at, outbound_message.priority.name)
+            self._outbound_writing = True
+            try:
+                await self._write_messages([outbound_message.message for outbound_message in batch])
+            except Exception as e:
+                for outbound_message in batch:
+                    outbound_message.written.set_exception(e)
+            else:
+                for outbound_message in batch:
+                    outbound_message.written.set_result(None)
+            finally:
+                self._outbound_writing = False
+        self._outbound_writer_task = None
+
+    def _abandon_outbound_queue(self) -> None:
         """
-        Send a message from our plugin to the Stream Deck app.
+        Stop waiting to write our queued messages, because their connection is
+        gone. They're buffered for our next connection, behind our registration.
+
+        A batch that's already being written is left to finish instead, so
+        nothing it wrote is sent twice: its writes fail fast on the closed socket,
+        and it buffers whatever it didn't write, then anything queued behind it.
         """
-        if not self._websocket:
+        if self._outbound_writer_task is None or self._outbound_writing:
+            return
+
+        unwritten = self._outbound_queue.pop_all()
+        self._outbound_writer_task.cancel()
+        self._outbound_writer_task = None
+        for outbound_message in unwritten:
+            if self._max_reconnect_attempts:
+                self._buffer_message(outbound_message.message)
+                outbound_message.written.set_result(None)
+            else:
+                outbound_message.written.set_exception(Exception(
+                    "Stream Deck websocket closed before our messages were written."))
+
+    async def _write_messages(
+            self, messages: List[str], websocket: websockets.ClientConnection | None = None) -> bool:
+        """
+        Write messages to the Stream Deck app (over `websocket`, or else our
+        current connection), in order. If we're disconnected and expect to
+        reconnect, whatever we couldn't write is buffered instead. Returns whether
+        every message was written.
+        """
+        websocket = websocket or self._websocket
+        if not websocket:
+            if self._max_reconnect_attempts:
+                for message in messages:
+                    self._buffer_message(message)
+                return False
             raise Exception(
                 "Stream Deck websocket is not open! Failed to send message.")
 
-        self._logger.info(
-            f"Sending outbound message to Stream Deck. Message: {message}")
-        await self._websocket.send(message)
+        self._message_logger.log_messages(
+            "Sending outbound message to Stream Deck.", messages)
+        for index, message in enumerate(messages):
+            try:
+                await websocket.send(message)
+                if self._traffic_recorder:
+                    self._traffic_recorder.record(STREAM_DECK_LINK, OUTBOUND, self._connection_id, message)
+            except websockets.ConnectionClosed:
+                if not self._max_reconnect_attempts:
+                    raise
+                for unsent_message in messages[index:]:
+                    self._buffer_message(unsent_message)
+                return False
+        return True
+
+    def _buffer_message(self, message: str) -> None:
+        if len(self._buffered_messages) == self._buffered_messages.maxlen:
+            self._logger.warning(
+                "Outbound buffer is full while reconnecting to Stream Deck. Dropping our oldest message.")
+            self._dropped_messages.inc()
+        self._buffered_messages.append(message)
 
     async def _message_receive_loop(self, websocket: websockets.ClientConnection) -> None:
         """
@@ -73,8 +396,10 @@ class StreamDeckWebsocketClient:
         connection dies.
         """
         async for message in websocket:
-            self._logger.info(
-                f"Received inbound message from Stream Deck: {str(message)}")
+            if self._traffic_recorder:
+                self._traffic_recorder.record(STREAM_DECK_LINK, INBOUND, self._connection_id, message)
+            self._message_logger.log_message(
+                "Received inbound message from Stream Deck.", message)
             await self._process_inbound_message(message)
 
     async def _process_inbound_message(self, message: str | bytes) -> None:
@@ -82,7 +407,7 @@ class StreamDeckWebsocketClient:
         Process one individual inbound websocket message.
         """
         try:
-            parsed_event = json.loads(message)
+            parsed_event = json_codec.loads(message)
         except Exception:
             """
             If we're receiving invalid data from the Stream Deck app, our socket
@@ -90,12 +415,43 @@ class StreamDeckWebsocketClient:
             dies, Stream Deck will restart it for us.
             """
             self._logger.exception(
-                "Failed to parse Stream Deck message as JSON! Message: {message}")
+                "Failed to parse Stream Deck message as JSON! Message: %s", message)
             raise
 
-        for handler in self._handlers:
+        try:
+            parsed_event = to_typed_stream_deck_event(parsed_event)
+        except ValueError:
+            self._logger.exception(
+                "Ignoring malformed Stream Deck event! Message: %s", message)
+            return
+
+        if isinstance(parsed_event, Mapping):
+            target_action = parsed_event.get("action")
+            target_context = parsed_event.get("context")
+        else:
+            target_action = target_context = None
+
+        handlers = self._dispatch_table.lookup(target_action)
+        if not handlers:
+            return
+
+        if self._dispatcher:
+            ordering_key = (target_action, target_context)
+            await self._dispatcher.submit(
+                ordering_key, lambda: self._dispatch_to_handlers(handlers, parsed_event, target_action))
+        else:
+            await self._dispatch_to_handlers(handlers, parsed_event, target_action)
+
+    async def _dispatch_to_handlers(
+            self, handlers: List["EventHandler"], event: Mapping, action: str | None) -> None:
+        started_at = time.perf_counter() if self._metrics.enabled else 0.0
+        for handler in handlers:
             try:
-                await handler.on_stream_deck_event(parsed_event)
+                await handler.on_stream_deck_event(event)
             except Exception:
                 self._logger.exception(
                     "StreamDeckWebsocketClient received an exception from EventHandler!")
+                self._handler_exceptions.inc(label=action)
+        if self._metrics.enabled:
+            self._dispatch_seconds.observe(time.perf_counter() - started_at, action)
+
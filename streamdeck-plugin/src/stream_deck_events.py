@@ -0,0 +1,72 @@
+from collections.abc import Mapping
+from typing import Any, Iterator
+
+
+class StreamDeckActionEvent(Mapping):
+    """
+    A compact, validated representation of the Stream Deck events our handlers
+    act on: keyUp, willAppear, and willDisappear. See
+    https://docs.elgato.com/streamdeck/sdk/references/websocket/plugin for the
+    event definitions.
+
+    It behaves like a read-only dict of the event's JSON fields, so handlers can
+    use it exactly like any other decoded event, e.g. `event.get("context")`.
+    """
+
+    __slots__ = ("event", "action", "context", "device", "payload")
+
+    def __init__(self, event: str, action: str, context: str, device: str | None,
+                 payload: dict | None) -> None:
+        self.event = event
+        self.action = action
+        self.context = context
+        self.device = device
+        self.payload = payload
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field in self.__slots__ if getattr(self, field) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"StreamDeckActionEvent({dict(self)!r})"
+
+
+"""
+The Stream Deck event types we decode into StreamDeckActionEvents.
+"""
+ACTION_EVENT_TYPES = frozenset(["keyUp", "willAppear", "willDisappear"])
+
+
+def to_typed_stream_deck_event(parsed_event: Any) -> Any:
+    """
+    Takes a decoded inbound Stream Deck message. Events our handlers act on are
+    validated and returned as StreamDeckActionEvents. Anything else is returned
+    as-is.
+
+    Raises ValueError if one of our action events is missing required fields.
+    """
+    if not isinstance(parsed_event, dict) or parsed_event.get("event") not in ACTION_EVENT_TYPES:
+        return parsed_event
+
+    action = parsed_event.get("action")
+    context = parsed_event.get("context")
+    device = parsed_event.get("device")
+    payload = parsed_event.get("payload")
+    if not isinstance(action, str) or not isinstance(context, str):
+        raise ValueError(
+            f"Stream Deck {parsed_event['event']} event is missing its action or context.")
+    if device is not None and not isinstance(device, str):
+        raise ValueError(f"Stream Deck {parsed_event['event']} event has an invalid device.")
+    if payload is not None and not isinstance(payload, dict):
+        raise ValueError(f"Stream Deck {parsed_event['event']} event has an invalid payload.")
+
+    return StreamDeckActionEvent(parsed_event["event"], action, context, device, payload)
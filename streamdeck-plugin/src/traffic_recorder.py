@@ -0,0 +1,172 @@
+"""
+An opt-in recording of every frame on our Stream Deck and browser websockets,
+with timestamps, for reproducing latency problems outside of a live session.
+
+Set the MEETPLUGIN_TRAFFIC_LOG environment variable to the path of a log file to
+enable it. The log is NDJSON: one record per line, e.g.
+    {"t":1.25,"link":"browser","kind":"in","conn":3,"msg":"{\"event\":\"micMutedState\",\"muted\":true}"}
+where "t" is seconds since recording started, "kind" is "in" or "out" for
+frames, or "open" or "close" for connections (which have no "msg"), and "conn"
+tells apart the connections on each link. Binary frames (e.g. our compressed
+protocol version 2 frames) are recorded base64 encoded, with `"bin":true`, so
+they can be replayed byte for byte. Each run of our plugin appends a
+"session" record before its own, since its times and connection numbers start
+over. Once the log reaches its size limit, it's rotated like a
+logging.handlers.RotatingFileHandler log: to `<path>.1`, then `<path>.2`, and so
+on, keeping a bounded number of old files.
+
+Records are written to the log from the event loop, as each frame goes by, so
+they're buffered in memory and only flushed to the file every
+`flush_interval_secs` (and on close), rather than costing a write syscall per
+frame. A crash can lose the last moments of a recording.
+
+benchmarks/traffic_replay.py plays a recording back through our handlers.
+"""
+
+import base64
+import logging
+import os
+import time
+from typing import Callable, Iterator, NamedTuple
+
+import json_codec
+
+ENVIRONMENT_VARIABLE = "MEETPLUGIN_TRAFFIC_LOG"
+
+# Our two websocket links.
+STREAM_DECK_LINK = "streamdeck"
+BROWSER_LINK = "browser"
+
+# The kinds of record we write.
+INBOUND = "in"
+OUTBOUND = "out"
+OPENED = "open"
+CLOSED = "close"
+SESSION = "session"
+
+
+class TrafficRecord(NamedTuple):
+    secs: float
+    link: str
+    kind: str
+    connection: int
+    message: str | bytes | None
+
+
+class TrafficRecorder:
+    """
+    Appends TrafficRecords to our log file, rotating it once it grows past
+    `max_bytes`, and keeping `backup_count` rotated files. We always keep at
+    least one, so rotating never just truncates the log we're writing.
+
+    If the log can't be written, we log the error and stop recording, rather than
+    disturbing the plugin.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int = 16 * 1024 * 1024,
+            backup_count: int = 3,
+            flush_interval_secs: float = 1.0,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        if backup_count < 1:
+            raise ValueError(f"backup_count must be at least 1, not {backup_count}")
+        self._logger = logging.getLogger(__name__)
+
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._flush_interval_secs = flush_interval_secs
+        self._clock = clock
+        self._started_at = clock()
+        self._flushed_at = self._started_at
+
+        self._file = open(path, "a", encoding="utf-8")
+        self._bytes_written = self._file.tell()
+        self.record("", SESSION, 0)
+
+    def record(self, link: str, kind: str, connection: int, message: str | bytes | None = None) -> None:
+        if self._file is None:
+            return
+
+        now = self._clock()
+        record = {"t": round(now - self._started_at, 6), "link": link, "kind": kind, "conn": connection}
+        if isinstance(message, bytes):
+            record["msg"] = base64.b64encode(message).decode("ascii")
+            record["bin"] = True
+        elif message is not None:
+            record["msg"] = message
+        line = json_codec.dumps(record) + "\n"
+
+        try:
+            if self._bytes_written and self._bytes_written + len(line) > self._max_bytes:
+                self._rotate()
+            self._file.write(line)
+            if now - self._flushed_at >= self._flush_interval_secs:
+                self._file.flush()
+                self._flushed_at = now
+        except OSError:
+            self._logger.exception("Failed to write to traffic log %s. No longer recording.", self.path)
+            self.close()
+            return
+        # Character counts, so only roughly bytes, which is all our size limit needs.
+        self._bytes_written += len(line)
+
+    def close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                self._logger.exception("Failed to write to traffic log %s.", self.path)
+            self._file = None
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self._backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._bytes_written = 0
+
+
+def read_records(path: str) -> Iterator[TrafficRecord]:
+    """
+    Reads a traffic log in the order it was written, starting from its oldest
+    rotated file. Each session's times start over from its SESSION record.
+    """
+    rotated_paths = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated_paths.append(f"{path}.{index}")
+        index += 1
+
+    for file_path in list(reversed(rotated_paths)) + [path]:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as log_file:
+            for line in log_file:
+                if not line.strip():
+                    continue
+                record = json_codec.loads(line)
+                message = record.get("msg")
+                if message is not None and record.get("bin"):
+                    message = base64.b64decode(message)
+                yield TrafficRecord(record["t"], record["link"], record["kind"], record["conn"], message)
+
+
+def from_environment() -> TrafficRecorder | None:
+    """
+    Returns a recorder for the log named by our environment variable, or None
+    if recording is disabled.
+    """
+    path = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not path:
+        return None
+    try:
+        return TrafficRecorder(path)
+    except OSError:
+        logging.getLogger(__name__).exception("Failed to open traffic log %s.", path)
+        return None
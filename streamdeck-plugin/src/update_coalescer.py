@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class UpdateCoalescer(Generic[T]):
+    """
+    Collapses bursts of updates into fewer emitted updates.
+
+    The first update after a quiet period is emitted right away, so a lone update
+    is never delayed. Any further updates arriving within `window_secs` of an
+    emitted update are held back, and only the latest of them is emitted once the
+    window closes. Intermediate values are dropped, since only the most recent
+    state matters to us.
+    """
+
+    def __init__(self, window_secs: float, emit: Callable[[T], Awaitable[None]]) -> None:
+        """
+        A `window_secs` of 0 disables coalescing, and every update is emitted
+        as soon as it's submitted.
+        """
+        self._logger = logging.getLogger(__name__)
+
+        self._window_secs = window_secs
+        self._emit = emit
+
+        # Loop time at which our current coalescing window closes.
+        self._window_end = 0.0
+
+        # Until this loop time, updates bypass coalescing and are emitted right away.
+        self._expedite_until = 0.0
+
+        self._pending_value: T | None = None
+        self._trailing_emit_task: asyncio.Task | None = None
+
+    async def submit(self, value: T) -> None:
+        """
+        Submit a new update, which will be emitted now or at the end of our
+        current coalescing window.
+        """
+        now = asyncio.get_running_loop().time()
+        window_is_open = now < self._window_end or self._trailing_emit_task is not None
+        if self._window_secs <= 0 or now < self._expedite_until or not window_is_open:
+            await self.submit_now(value)
+            return
+
+        self._pending_value = value
+        if self._trailing_emit_task is None:
+            self._trailing_emit_task = asyncio.create_task(
+                self._emit_at_window_end())
+
+    async def submit_now(self, value: T) -> None:
+        """
+        Emit an update immediately, superseding any update we were holding back.
+        """
+        self._cancel_pending()
+        self._window_end = asyncio.get_running_loop().time() + self._window_secs
+        await self._emit(value)
+
+    async def flush(self) -> None:
+        """
+        Immediately emit the update we're holding back, if any.
+        """
+        if self._trailing_emit_task is not None:
+            await self.submit_now(self._pending_value)
+
+    def expedite(self, duration_secs: float) -> None:
+        """
+        Skip coalescing for updates submitted within the next `duration_secs`,
+        e.g. when we're expecting an update the user is actively waiting on.
+        """
+        self._expedite_until = asyncio.get_running_loop().time() + duration_secs
+
+    def is_expedited(self) -> bool:
+        return asyncio.get_running_loop().time() < self._expedite_until
+
+    def _cancel_pending(self) -> None:
+        if self._trailing_emit_task is not None:
+            self._trailing_emit_task.cancel()
+            self._trailing_emit_task = None
+        self._pending_value = None
+
+    async def _emit_at_window_end(self) -> None:
+        delay = self._window_end - asyncio.get_running_loop().time()
+        await asyncio.sleep(max(delay, 0))
+
+        value = self._pending_value
+        self._trailing_emit_task = None
+        self._pending_value = None
+        self._window_end = asyncio.get_running_loop().time() + self._window_secs
+        try:
+            await self._emit(value)
+        except Exception:
+            self._logger.exception("Exception while emitting a coalesced update.")
@@ -1,3 +1,4 @@
+import asyncio
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, MagicMock
 
@@ -12,6 +13,18 @@ class TestPrefixedEventHandler(EventHandler):
     STREAM_DECK_ACTION_PREFIX = "com.test.prefixedaction"
 
 
+class RateLimitedEventHandler(EventHandler):
+    STREAM_DECK_ACTION = "com.test.action"
+    KEY_PRESS_BURST_LIMIT = 2
+    KEY_PRESSES_PER_SEC = 0.001
+
+
+class CoalescingEventHandler(EventHandler):
+    STREAM_DECK_ACTION = "com.test.action"
+    KEY_PRESS_COALESCE_SECS = 0.01
+    KEY_PRESSES_CANCEL_IN_PAIRS = True
+
+
 def make_mocked_event_handler():
     return TestEventHandler(MagicMock(), MagicMock())
 
@@ -117,3 +130,52 @@ class BaseEventHandlerTests(IsolatedAsyncioTestCase):
         await handler.on_stream_deck_event(test_event)
 
         handler._will_disappear_handler.assert_called_once_with(test_event)
+
+    async def test_key_presses_rate_limited(self):
+        """
+        Tests that presses over a handler's rate limit are dropped.
+        """
+        handler = RateLimitedEventHandler(MagicMock(), MagicMock())
+        handler._logger = MagicMock()  # Suppress logging
+        handler._key_up_handler = AsyncMock()
+
+        for _ in range(4):
+            await handler.on_stream_deck_event({"event": "keyUp", "action": handler.STREAM_DECK_ACTION})
+
+        self.assertEqual(handler._key_up_handler.call_count, 2)
+
+    async def test_key_presses_coalesced(self):
+        """
+        Tests that a handler coalescing key presses acts on them once its window
+        closes, and that a double tap does nothing.
+        """
+        handler = CoalescingEventHandler(MagicMock(), MagicMock())
+        handler._key_up_handler = AsyncMock()
+        test_event = {"event": "keyUp", "action": handler.STREAM_DECK_ACTION, "context": "context"}
+
+        await handler.on_stream_deck_event(test_event)
+        handler._key_up_handler.assert_not_called()
+        await asyncio.sleep(0.05)
+        handler._key_up_handler.assert_called_once_with(test_event)
+
+        await handler.on_stream_deck_event(test_event)
+        await handler.on_stream_deck_event(test_event)
+        await asyncio.sleep(0.05)
+        handler._key_up_handler.assert_called_once_with(test_event)
+
+    async def test_coalesced_key_press_dropped_on_disappear(self):
+        """
+        Tests that a coalesced key press still waiting for its window to close
+        is dropped if its button disappears.
+        """
+        handler = CoalescingEventHandler(MagicMock(), MagicMock())
+        handler._key_up_handler = AsyncMock()
+        handler._will_disappear_handler = AsyncMock()
+
+        await handler.on_stream_deck_event(
+            {"event": "keyUp", "action": handler.STREAM_DECK_ACTION, "context": "context"})
+        await handler.on_stream_deck_event(
+            {"event": "willDisappear", "action": handler.STREAM_DECK_ACTION, "context": "context"})
+        await asyncio.sleep(0.05)
+
+        handler._key_up_handler.assert_not_called()
@@ -1,7 +1,9 @@
+import asyncio
 import json
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import AsyncMock, MagicMock
 
+from src.context_registry import ContextRegistry
 from src.event_handlers.base_toggle_event_handler import BaseToggleEventHandler
 
 TEST_TOGGLE_CONTEXT = "test_toggle_context"
@@ -13,11 +15,25 @@ class MockedToggleEventHandler(BaseToggleEventHandler):
     BROWSER_STATE_UPDATED_EVENT_TYPE = "testMutedState"
     BROWSER_TOGGLE_EVENT_TYPE = "toggleTestDevice"
     FRIENDLY_DEVICE_NAME = "Test Device Name"
+    STATE_UPDATE_COALESCE_SECS = 0
 
 
-def make_mocked_toggle_handler():
-    handler = MockedToggleEventHandler(AsyncMock(), AsyncMock())
-    handler._toggle_contexts = [TEST_TOGGLE_CONTEXT]
+class OtherToggleEventHandler(MockedToggleEventHandler):
+    STREAM_DECK_ACTION = "com.test.otheraction"
+
+
+class OptimisticToggleEventHandler(MockedToggleEventHandler):
+    OPTIMISTIC_TOGGLE_TIMEOUT_SECS = 0.02
+
+
+class CoalescingToggleEventHandler(MockedToggleEventHandler):
+    # Long enough that a loaded test machine still gets each test's whole burst in.
+    STATE_UPDATE_COALESCE_SECS = 0.1
+
+
+def make_mocked_toggle_handler(handler_class=MockedToggleEventHandler):
+    handler = handler_class(AsyncMock(), AsyncMock())
+    handler._contexts.appear(TEST_TOGGLE_CONTEXT, handler.STREAM_DECK_ACTION)
     return handler
 
 
@@ -41,7 +57,7 @@ class BaseToggleEventHandlerTests(IsolatedAsyncioTestCase):
             }
         }
 
-        await handler.on_browser_event({
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
             "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
             "muted": True
         })
@@ -49,6 +65,189 @@ class BaseToggleEventHandlerTests(IsolatedAsyncioTestCase):
         self._assert_called_with_json(
             handler._stream_deck.send_outbound_message, expected_sd_event)
 
+    def test_subscribes_to_state_updates(self):
+        """
+        Tests that toggle handlers subscribe to their own device's state, rather
+        than receiving every state update event.
+        """
+        self.assertEqual(MockedToggleEventHandler.BROWSER_STATE_KEYS,
+                         (MockedToggleEventHandler.BROWSER_STATE_UPDATED_EVENT_TYPE,))
+        self.assertEqual(MockedToggleEventHandler.BROWSER_EVENT_TYPES, ())
+
+    async def test_redundant_state_updates_skipped(self):
+        """
+        Tests that repeated browser updates with an unchanged state only result
+        in one button update.
+        """
+        handler = make_mocked_toggle_handler()
+        update_event = {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": True
+        }
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, update_event)
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, update_event)
+
+        handler._stream_deck.send_outbound_message.assert_called_once()
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": False
+        })
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+
+    async def test_will_appear_repaints_cached_state(self):
+        """
+        Tests that a reappearing button is always painted, even if we had already
+        sent its context the same state before.
+        """
+        handler = make_mocked_toggle_handler()
+        await handler.on_all_browsers_disconnected()
+
+        await handler.on_stream_deck_event({
+            "event": "willAppear",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT
+        })
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+
+    async def test_invalidated_states_resent(self):
+        """
+        Tests that invalidating our sent states causes the next update to be
+        written out even if the state hasn't changed.
+        """
+        handler = make_mocked_toggle_handler()
+        await handler.on_all_browsers_disconnected()
+
+        handler.invalidate_sent_states()
+        await handler.on_all_browsers_disconnected()
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+
+    async def test_state_update_bursts_coalesced(self):
+        """
+        Tests that a burst of browser updates shows the first state right away,
+        and then only the latest state once the coalescing window closes.
+        """
+        handler = make_mocked_toggle_handler(CoalescingToggleEventHandler)
+
+        for muted in [True, False, True, False]:
+            await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+                "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+                "muted": muted
+            })
+
+        self._assert_called_with_json(handler._stream_deck.send_outbound_message, {
+            "event": "setState",
+            "context": TEST_TOGGLE_CONTEXT,
+            "payload": {"state": 1}
+        })
+
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+        self._assert_called_with_json(handler._stream_deck.send_outbound_message, {
+            "event": "setState",
+            "context": TEST_TOGGLE_CONTEXT,
+            "payload": {"state": 2}
+        })
+
+    async def _press_optimistic_toggle(self):
+        handler = make_mocked_toggle_handler(OptimisticToggleEventHandler)
+        handler._logger = MagicMock()  # Suppress logging
+        handler._browser_manager.num_connected_clients = MagicMock(return_value=1)
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": True
+        })
+
+        await handler.on_stream_deck_event({
+            "event": "keyUp",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT
+        })
+
+        # The button flips as soon as the toggle request is sent.
+        handler._browser_manager.send_to_clients.assert_called_once()
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+        self.assertEqual(json.loads(handler._stream_deck.send_outbound_message.call_args[0][0])["payload"],
+                         {"state": 2})
+        return handler
+
+    async def test_optimistic_toggle_confirmed(self):
+        """
+        Tests that with optimistic toggles, a press is shown right away, and Meet's
+        confirmation doesn't cause another write or a rollback.
+        """
+        handler = await self._press_optimistic_toggle()
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": False
+        })
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+        self.assertIn("confirmed", handler._logger.info.call_args[0][0])
+
+    async def test_optimistic_toggle_rolled_back(self):
+        """
+        Tests that an optimistic press Meet never confirms is rolled back to the
+        last reported state.
+        """
+        handler = await self._press_optimistic_toggle()
+
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 3)
+        self.assertEqual(json.loads(handler._stream_deck.send_outbound_message.call_args[0][0])["payload"],
+                         {"state": 1})
+        handler._logger.warning.assert_called_once()
+
+    async def test_key_up_skips_coalescing(self):
+        """
+        Tests that pending updates are flushed on key presses, and that the
+        updates following a press are shown without delay.
+        """
+        handler = make_mocked_toggle_handler(CoalescingToggleEventHandler)
+        handler._browser_manager.num_connected_clients = MagicMock(
+            return_value=1)
+        for muted in [True, False]:
+            await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+                "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+                "muted": muted
+            })
+
+        await handler.on_stream_deck_event({
+            "event": "keyUp",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT
+        })
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": True
+        })
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 3)
+
+    async def test_stream_deck_reconnection_repaints_states(self):
+        """
+        Tests that after reconnecting to the Stream Deck, our next state update
+        is sent even if we had sent the same state before.
+        """
+        handler = make_mocked_toggle_handler()
+        await handler.on_all_browsers_disconnected()
+
+        await handler.on_stream_deck_reconnected()
+        await handler.on_all_browsers_disconnected()
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+
     async def test_browser_disconnection(self):
         """
         Tests that buttons are set to Disconnected when all browsers disconnect.
@@ -111,6 +310,51 @@ class BaseToggleEventHandlerTests(IsolatedAsyncioTestCase):
         self._assert_called_with_json(
             handler._stream_deck.send_outbound_message, expected_sd_event)
 
+    async def test_will_appear_shows_known_state_with_older_extension(self):
+        """
+        Tests that a button appearing mid-call, with a browser extension that
+        can't answer getAllStates, shows the state we already know instead of
+        Disconnected, since the extension's reply won't change it.
+        """
+        handler = make_mocked_toggle_handler()
+        handler._browser_manager.request_all_states.return_value = None
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {"muted": True})
+
+        await handler.on_stream_deck_event({
+            "event": "willAppear",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": "second_context"
+        })
+
+        self._assert_called_with_json(handler._stream_deck.send_outbound_message, {
+            "event": "setState",
+            "context": "second_context",
+            "payload": {
+                "state": 1
+            }
+        })
+
+    async def test_will_appear_keeps_state_when_browser_is_slow(self):
+        """
+        Tests that a button appearing while the browser is slow to answer isn't
+        painted Disconnected, and shows the state we already know, if any.
+        """
+        handler = make_mocked_toggle_handler()
+        handler._browser_manager.request_all_states.side_effect = asyncio.TimeoutError()
+        will_appear = {"event": "willAppear", "action": handler.STREAM_DECK_ACTION, "context": TEST_TOGGLE_CONTEXT}
+
+        await handler.on_stream_deck_event(will_appear)
+
+        handler._stream_deck.send_outbound_message.assert_not_called()
+        handler._browser_manager.send_to_clients.assert_called_once()
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {"muted": False})
+        await handler.on_stream_deck_event(will_appear)
+
+        self.assertEqual(handler._stream_deck.send_outbound_message.call_count, 2)
+        self.assertEqual(json.loads(handler._stream_deck.send_outbound_message.call_args[0][0])["payload"],
+                         {"state": 2})
+
     async def test_will_appear_sends_state_request(self):
         """
         Tests that when a button appears on the Stream Deck, we trigger a state
@@ -143,7 +387,18 @@ class BaseToggleEventHandlerTests(IsolatedAsyncioTestCase):
             "context": TEST_TOGGLE_CONTEXT
         })
 
-        self.assertEqual(handler._toggle_contexts, [TEST_TOGGLE_CONTEXT])
+        # A replayed willAppear shouldn't add the context twice.
+        await handler.on_stream_deck_event({
+            "event": "willAppear",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT,
+            "device": "device",
+            "payload": {"coordinates": {"column": 2, "row": 1}}
+        })
+
+        records = list(handler._get_contexts())
+        self.assertEqual([record.context for record in records], [TEST_TOGGLE_CONTEXT])
+        self.assertEqual((records[0].device, records[0].column, records[0].row), ("device", 2, 1))
 
         await handler.on_stream_deck_event({
             "event": "willDisappear",
@@ -151,4 +406,72 @@ class BaseToggleEventHandlerTests(IsolatedAsyncioTestCase):
             "context": TEST_TOGGLE_CONTEXT
         })
 
-        self.assertEqual(handler._toggle_contexts, [])
+        self.assertEqual(list(handler._get_contexts()), [])
+
+    async def test_contexts_shared_between_handlers(self):
+        """
+        Tests that handlers sharing a context registry each only update their
+        own buttons.
+        """
+        context_registry = ContextRegistry()
+        handler = MockedToggleEventHandler(AsyncMock(), AsyncMock(), context_registry)
+        other_handler = OtherToggleEventHandler(AsyncMock(), AsyncMock(), context_registry)
+        context_registry.appear(TEST_TOGGLE_CONTEXT, handler.STREAM_DECK_ACTION)
+        context_registry.appear("other_context", other_handler.STREAM_DECK_ACTION)
+
+        await handler.on_state_changed(handler.BROWSER_STATE_UPDATED_EVENT_TYPE, {
+            "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE,
+            "muted": True
+        })
+
+        handler._stream_deck.send_outbound_message.assert_called_once()
+        self.assertEqual(json.loads(handler._stream_deck.send_outbound_message.call_args[0][0])["context"],
+                         TEST_TOGGLE_CONTEXT)
+        self.assertIsNone(context_registry.get("other_context").state)
+
+    async def test_will_appear_uses_all_states_answer(self):
+        """
+        Tests that when the browser extension answers our getAllStates request,
+        appearing buttons show that state right away, without a separate state
+        request or an interim Disconnected state.
+        """
+        handler = make_mocked_toggle_handler()
+        handler._browser_manager.request_all_states.return_value = {
+            handler.BROWSER_STATE_UPDATED_EVENT_TYPE: {
+                "event": handler.BROWSER_STATE_UPDATED_EVENT_TYPE, "muted": False}
+        }
+
+        await handler.on_stream_deck_event({
+            "event": "willAppear",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT
+        })
+
+        handler._stream_deck.send_outbound_message.assert_called_once()
+        self._assert_called_with_json(handler._stream_deck.send_outbound_message, {
+            "event": "setState",
+            "context": TEST_TOGGLE_CONTEXT,
+            "payload": {"state": 2}
+        })
+        handler._browser_manager.send_to_clients.assert_not_called()
+
+    async def test_will_appear_without_device_in_all_states(self):
+        """
+        Tests that buttons appear Disconnected when the browser extension answers
+        our getAllStates request without a state for our device.
+        """
+        handler = make_mocked_toggle_handler()
+        handler._browser_manager.request_all_states.return_value = {}
+
+        await handler.on_stream_deck_event({
+            "event": "willAppear",
+            "action": handler.STREAM_DECK_ACTION,
+            "context": TEST_TOGGLE_CONTEXT
+        })
+
+        self._assert_called_with_json(handler._stream_deck.send_outbound_message, {
+            "event": "setState",
+            "context": TEST_TOGGLE_CONTEXT,
+            "payload": {"state": 0}
+        })
+        handler._browser_manager.send_to_clients.assert_not_called()
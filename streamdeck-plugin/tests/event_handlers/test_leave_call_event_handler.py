@@ -0,0 +1,51 @@
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from event_handlers.leave_call_event_handler import LeaveCallEventHandler
+
+
+class LeaveCallEventHandlerTests(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.handler = LeaveCallEventHandler(AsyncMock(), AsyncMock())
+        self.handler._logger = MagicMock()  # Suppress logging
+        self.press = {
+            "event": "keyUp",
+            "action": "com.chrisregado.googlemeet.leavecall",
+            "context": "test_context"
+        }
+
+    async def test_key_up_leaves_call(self):
+        """
+        Tests that Stream Deck button presses send a leave call event to the browser.
+        """
+        await self.handler.on_stream_deck_event(self.press)
+
+        actual_response = json.loads(self.handler._browser_manager.send_to_clients.call_args[0][0])
+        self.assertEqual({"event": "leaveCall"}, actual_response)
+
+    async def test_presses_ignored_while_leaving(self):
+        """
+        Tests that we only ask to leave once, until a tab tells us it has left.
+        """
+        await self.handler.on_stream_deck_event(self.press)
+        await self.handler.on_stream_deck_event(self.press)
+        await self.handler.on_browser_event({"event": "tabStatus", "inCall": True})
+        await self.handler.on_stream_deck_event(self.press)
+        self.handler._browser_manager.send_to_clients.assert_called_once()
+
+        await self.handler.on_browser_event({"event": "tabStatus", "inCall": False})
+        await self.handler.on_stream_deck_event(self.press)
+        self.assertEqual(self.handler._browser_manager.send_to_clients.call_count, 2)
+
+    async def test_presses_allowed_after_leave_timeout(self):
+        """
+        Tests that we ask again if we never hear that the leave went through.
+        """
+        self.handler.LEAVE_TIMEOUT_SECS = 0.0
+
+        await self.handler.on_stream_deck_event(self.press)
+        await self.handler.on_stream_deck_event(self.press)
+
+        self.assertEqual(self.handler._browser_manager.send_to_clients.call_count, 2)
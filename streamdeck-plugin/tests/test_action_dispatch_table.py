@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from src.action_dispatch_table import ActionDispatchTable
+
+
+class ActionDispatchTableTests(TestCase):
+
+    def test_exact_match(self):
+        """
+        Test that handlers indexed by action only match that exact action.
+        """
+        table = ActionDispatchTable()
+        table.add_exact("com.test.action", "handler")
+
+        self.assertEqual(table.lookup("com.test.action"), ["handler"])
+        self.assertEqual(table.lookup("com.test.action.suffix"), [])
+        self.assertEqual(table.lookup("com.test"), [])
+
+    def test_prefix_match(self):
+        """
+        Test that handlers indexed by prefix match every action sharing the prefix.
+        """
+        table = ActionDispatchTable()
+        table.add_prefix("com.test.emoji.", "emoji_handler")
+        table.add_exact("com.test.other", "other_handler")
+
+        self.assertEqual(table.lookup("com.test.emoji.thumbsup"), ["emoji_handler"])
+        self.assertEqual(table.lookup("com.test.emoji.partypopper"), ["emoji_handler"])
+        self.assertEqual(table.lookup("com.test.other"), ["other_handler"])
+        self.assertEqual(table.lookup("com.test.emoj"), [])
+
+    def test_catch_all_match(self):
+        """
+        Test that catch-all handlers receive events for every action, including
+        events that have no action at all.
+        """
+        table = ActionDispatchTable()
+        table.add_catch_all("catch_all")
+        table.add_exact("com.test.action", "handler")
+
+        self.assertEqual(table.lookup("com.test.action"), ["catch_all", "handler"])
+        self.assertEqual(table.lookup("com.test.unknown"), ["catch_all"])
+        self.assertEqual(table.lookup(None), ["catch_all"])
+
+    def test_handler_matched_twice_returned_once(self):
+        """
+        Test that a handler matching on both its exact action and its prefix is
+        only returned once.
+        """
+        table = ActionDispatchTable()
+        table.add_exact("com.test.action", "handler")
+        table.add_prefix("com.test.action", "handler")
+
+        self.assertEqual(table.lookup("com.test.action"), ["handler"])
+
+    def test_registration_order_preserved(self):
+        """
+        Test that matches are returned in the order handlers were added.
+        """
+        table = ActionDispatchTable()
+        table.add_prefix("com.test.", "first")
+        table.add_catch_all("second")
+        table.add_exact("com.test.action", "third")
+
+        self.assertEqual(table.lookup("com.test.action"), ["first", "second", "third"])
@@ -0,0 +1,56 @@
+import json
+from unittest import TestCase
+import zlib
+
+from src import browser_protocol
+
+
+class BrowserProtocolTests(TestCase):
+
+    def test_version_negotiation(self):
+        """
+        Test that we pick the newest version both sides support, and that
+        extensions that don't offer any stay on version 1.
+        """
+        self.assertEqual(browser_protocol.negotiate_version({"event": "hello"}), 1)
+        self.assertEqual(browser_protocol.negotiate_version({"protocols": [1]}), 1)
+        self.assertEqual(browser_protocol.negotiate_version({"protocols": [1, 2]}), 2)
+        self.assertEqual(browser_protocol.negotiate_version({"protocols": [2, 3]}), 2)
+        self.assertEqual(browser_protocol.negotiate_version({"protocols": [3]}), 1)
+
+    def test_welcome(self):
+        welcome = json.loads(browser_protocol.make_welcome(2, compress=True))
+
+        self.assertEqual(welcome["event"], "welcome")
+        self.assertEqual(welcome["protocol"], 2)
+        self.assertEqual(welcome["eventCodes"]["heartbeat"], 1)
+        self.assertEqual(welcome["compressionThreshold"], browser_protocol.COMPRESSION_THRESHOLD_BYTES)
+        self.assertNotIn("compressionThreshold", json.loads(browser_protocol.make_welcome(2, compress=False)))
+
+    def test_frames_carry_coded_messages(self):
+        """
+        Test that frames are arrays of our messages, with coded event types
+        replaced by their codes and everything else left as it was.
+        """
+        frame = browser_protocol.encode_frame(
+            ['{"event":"toggleMic"}', '{"event":"emojiReact","emojiChar":"x"}', '{"event":"somethingNew"}'],
+            compress=True)
+
+        self.assertEqual(json.loads(frame), [
+            {"e": browser_protocol.EVENT_CODES["toggleMic"]},
+            {"e": browser_protocol.EVENT_CODES["emojiReact"], "emojiChar": "x"},
+            {"event": "somethingNew"},
+        ])
+
+    def test_large_frames_compressed(self):
+        """
+        Test that only frames over our threshold are compressed, with raw DEFLATE.
+        """
+        messages = ['{"event":"emojiReact","emojiChar":"%d"}' % index for index in range(100)]
+
+        frame = browser_protocol.encode_frame(messages, compress=True)
+
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(zlib.decompress(frame, wbits=-zlib.MAX_WBITS).decode(),
+                         browser_protocol.encode_frame(messages, compress=False))
+        self.assertIsInstance(browser_protocol.encode_frame(messages[:1], compress=True), str)
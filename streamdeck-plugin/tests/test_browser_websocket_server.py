@@ -1,7 +1,26 @@
+import asyncio
+import json
+import time
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import AsyncMock, MagicMock, call
+from unittest.mock import ANY, AsyncMock, MagicMock, call
 
-from src.browser_websocket_server import BrowserWebsocketServer
+from src.browser_client import RoutingPolicy
+from src.browser_websocket_server import HEARTBEAT_MESSAGE, BrowserWebsocketServer, ConnectionCaps
+from src.keyed_task_dispatcher import KeyedTaskDispatcher
+from src.metrics import MetricsRegistry
+
+
+def make_websocket(origin: str | None = None) -> AsyncMock:
+    """
+    A mock browser connection, with the opening handshake request a real one has.
+    """
+    websocket = AsyncMock()
+    websocket.request = MagicMock(headers={"Origin": origin} if origin else {})
+    return websocket
+
+
+async def stuck_send(message):
+    await asyncio.sleep(60)
 
 
 class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
@@ -19,12 +38,59 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
         event_handler.on_browser_event.assert_called_with(
             {"event": "sampleEvent"})
 
+    async def test_events_routed_by_type(self):
+        """
+        Test that handlers declaring browser event types only receive those
+        events, while handlers without a declaration receive everything.
+        """
+        mic_handler = AsyncMock(BROWSER_EVENT_TYPES=("micMutedState",))
+        uninterested_handler = AsyncMock(BROWSER_EVENT_TYPES=())
+        catch_all_handler = AsyncMock(BROWSER_EVENT_TYPES=None)
+        server = BrowserWebsocketServer()
+        server.register_event_handler(mic_handler)
+        server.register_event_handler(uninterested_handler)
+        server.register_event_handler(catch_all_handler)
+
+        await server._process_inbound_message("""{"event":"cameraMutedState"}""")
+
+        mic_handler.on_browser_event.assert_not_called()
+        catch_all_handler.on_browser_event.assert_called_once_with(
+            {"event": "cameraMutedState"})
+
+        await server._process_inbound_message("""{"event":"micMutedState"}""")
+
+        mic_handler.on_browser_event.assert_called_once_with(
+            {"event": "micMutedState"})
+        uninterested_handler.on_browser_event.assert_not_called()
+        self.assertEqual(catch_all_handler.on_browser_event.call_count, 2)
+
+    async def test_state_changes_routed_to_subscribers(self):
+        """
+        Test that handlers subscribed to a state are only told when it changes.
+        """
+        mic_handler = AsyncMock(BROWSER_EVENT_TYPES=(), BROWSER_STATE_KEYS=("micMutedState",))
+        server = BrowserWebsocketServer()
+        server.register_event_handler(mic_handler)
+
+        for message in ["""{"event":"micMutedState","muted":true}""",
+                        """{"event":"micMutedState","muted":true}""",
+                        """{"event":"cameraMutedState","muted":true}""",
+                        """{"event":"micMutedState","muted":false}"""]:
+            await server._process_inbound_message(message)
+
+        self.assertEqual(mic_handler.on_state_changed.call_args_list, [
+            call("micMutedState", {"event": "micMutedState", "muted": True}),
+            call("micMutedState", {"event": "micMutedState", "muted": False}),
+        ])
+        mic_handler.on_browser_event.assert_not_called()
+        self.assertFalse(server.state_store.tracks("cameraMutedState"))
+
     async def test_message_broadcast(self):
         """
         Test that outbound messages get broadcasted to all websockets.
         """
-        mock_websocket_1 = AsyncMock()
-        mock_websocket_2 = AsyncMock()
+        mock_websocket_1 = make_websocket()
+        mock_websocket_2 = make_websocket()
         server = BrowserWebsocketServer()
         server._ws_clients = [mock_websocket_1, mock_websocket_2]
 
@@ -33,12 +99,187 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
         mock_websocket_1.send.assert_called_with("test_message")
         mock_websocket_2.send.assert_called_with("test_message")
 
+    async def test_queued_message_broadcast(self):
+        """
+        Test that queued broadcasts are delivered to all websockets by their
+        writer tasks.
+        """
+        mock_websocket_1 = make_websocket()
+        mock_websocket_2 = make_websocket()
+        server = BrowserWebsocketServer(queue_broadcasts=True)
+        server._register_client(mock_websocket_1)
+        server._register_client(mock_websocket_2)
+
+        await server.send_to_clients("test_message")
+        await asyncio.sleep(0)
+
+        mock_websocket_1.send.assert_called_with("test_message")
+        mock_websocket_2.send.assert_called_with("test_message")
+
+    async def test_protocol_v2_negotiated(self):
+        """
+        Test that clients offering protocol version 2 are welcomed to it and get
+        queued messages batched into frames, while older clients stay on version 1.
+        """
+        legacy_websocket = make_websocket()
+        v2_websocket = make_websocket()
+        server = BrowserWebsocketServer(queue_broadcasts=True)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(legacy_websocket)
+        server._register_client(v2_websocket)
+        await server._process_inbound_message("""{"event": "hello"}""", legacy_websocket)
+        await server._process_inbound_message("""{"event": "hello", "protocols": [1, 2]}""", v2_websocket)
+
+        welcome = json.loads(v2_websocket.send.call_args[0][0])
+        self.assertEqual(welcome["protocol"], 2)
+        legacy_websocket.send.assert_not_called()
+
+        await server.send_to_clients("""{"event":"toggleMic"}""")
+        await server.send_to_clients("""{"event":"toggleHand"}""")
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(json.loads(v2_websocket.send.call_args[0][0]),
+                         [{"e": welcome["eventCodes"]["toggleMic"]}, {"e": welcome["eventCodes"]["toggleHand"]}])
+        self.assertEqual(v2_websocket.send.call_count, 2)
+        legacy_websocket.send.assert_has_calls([call("""{"event":"toggleMic"}"""), call("""{"event":"toggleHand"}""")])
+
+    async def test_frames_compressed_once(self):
+        """
+        Test that we only compress version 2 clients' frames ourselves if their
+        connection didn't negotiate permessage-deflate.
+        """
+        hello = """{"event": "hello", "protocols": [1, 2], "compression": ["deflate-raw"]}"""
+        plain_websocket = make_websocket()
+        plain_websocket.protocol.extensions = []
+        deflate_websocket = make_websocket()
+        deflate_websocket.protocol.extensions = [MagicMock()]
+        deflate_websocket.protocol.extensions[0].name = "permessage-deflate"
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(plain_websocket)
+        server._register_client(deflate_websocket)
+        await server._process_inbound_message(hello, plain_websocket)
+        await server._process_inbound_message(hello, deflate_websocket)
+
+        self.assertIn("compressionThreshold", json.loads(plain_websocket.send.call_args[0][0]))
+        self.assertNotIn("compressionThreshold", json.loads(deflate_websocket.send.call_args[0][0]))
+        self.assertTrue(server._clients[plain_websocket].compress_frames)
+        self.assertFalse(server._clients[deflate_websocket].compress_frames)
+
+    async def test_slow_client_does_not_block_broadcast(self):
+        """
+        Test that a queued broadcast returns without waiting on a client whose
+        sends are stuck, and still reaches our healthy clients.
+        """
+        stuck_websocket = make_websocket()
+        stuck_websocket.send.side_effect = stuck_send
+        healthy_websocket = make_websocket()
+        server = BrowserWebsocketServer(queue_broadcasts=True, send_timeout_secs=0.01)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(stuck_websocket)
+        server._register_client(healthy_websocket)
+
+        await asyncio.wait_for(server.send_to_clients("test_message"), timeout=0.005)
+        await asyncio.sleep(0)
+
+        healthy_websocket.send.assert_called_with("test_message")
+
+    async def test_client_evicted_after_repeated_send_timeouts(self):
+        """
+        Test that a client that keeps missing its send deadline gets unregistered.
+        """
+        stuck_websocket = make_websocket()
+        stuck_websocket.send.side_effect = stuck_send
+        server = BrowserWebsocketServer(
+            send_timeout_secs=0.001, max_consecutive_send_timeouts=2)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(stuck_websocket)
+
+        await server.send_to_clients("m1")
+        self.assertIn(stuck_websocket, server._ws_clients)
+
+        await server.send_to_clients("m2")
+        await asyncio.sleep(0)
+
+        self.assertNotIn(stuck_websocket, server._ws_clients)
+        stuck_websocket.close.assert_called_once()
+
+    async def test_idle_clients_shed_over_caps(self):
+        """
+        Test that once we have too many connections, in total or from one tab, the
+        ones we've gone longest without hearing from are disconnected.
+        """
+        registry = MetricsRegistry()
+        server = BrowserWebsocketServer(
+            connection_caps=ConnectionCaps(max_clients=2, max_clients_per_tab=1), metrics_registry=registry)
+        server._logger = MagicMock()  # Suppress logging
+        idle_websocket = make_websocket()
+        busy_websocket = make_websocket()
+        server._register_client(idle_websocket).last_heard_at = 1.0
+        server._register_client(busy_websocket).last_heard_at = 2.0
+
+        new_websocket = make_websocket()
+        server._register_client(new_websocket).last_heard_at = 0.0
+
+        self.assertEqual(server._ws_clients, {busy_websocket, new_websocket})
+        self.assertEqual(registry.get("browser_shed_connections_total").value("max_clients"), 1)
+
+        # A tab that reconnects replaces its stale connection.
+        await server._process_inbound_message("""{"event": "hello", "tabId": "tab"}""", busy_websocket)
+        await server._process_inbound_message("""{"event": "hello", "tabId": "tab"}""", new_websocket)
+
+        self.assertEqual(server._ws_clients, {new_websocket})
+        self.assertEqual(registry.get("browser_shed_connections_total").value("max_clients_per_tab"), 1)
+        await asyncio.sleep(0)
+        busy_websocket.close.assert_called_once()
+
+    async def test_idle_clients_shed_per_origin(self):
+        """
+        Test that we disconnect the idlest connections from a web origin that has
+        too many, without touching other origins' connections.
+        """
+        registry = MetricsRegistry()
+        server = BrowserWebsocketServer(
+            connection_caps=ConnectionCaps(max_clients_per_origin=1), metrics_registry=registry)
+        server._logger = MagicMock()  # Suppress logging
+        idle_websocket = make_websocket("https://meet.google.com")
+        other_origin_websocket = make_websocket("chrome-extension://other")
+        server._register_client(idle_websocket).last_heard_at = 0.0
+        server._register_client(other_origin_websocket).last_heard_at = 0.0
+
+        new_websocket = make_websocket("https://meet.google.com")
+        server._register_client(new_websocket)
+
+        self.assertEqual(server._ws_clients, {other_origin_websocket, new_websocket})
+        self.assertEqual(registry.get("browser_shed_connections_total").value("max_clients_per_origin"), 1)
+
+    async def test_new_connections_throttled(self):
+        """
+        Test that connections beyond our burst limit are turned away.
+        """
+        registry = MetricsRegistry()
+        server = BrowserWebsocketServer(
+            connection_caps=ConnectionCaps(connection_burst_limit=1, connections_per_sec=0.001),
+            metrics_registry=registry)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client = MagicMock()
+        server._unregister_client = AsyncMock()
+        first_websocket = make_websocket()
+        second_websocket = make_websocket()
+
+        await server._message_receive_loop(first_websocket)
+        await server._message_receive_loop(second_websocket)
+
+        server._register_client.assert_called_once_with(first_websocket)
+        second_websocket.close.assert_called_once_with(code=1013, reason=ANY)
+        self.assertEqual(registry.get("browser_shed_connections_total").value("throttled"), 1)
+
     async def test_socket_registration(self):
         """
         Test that new websocket connections get registered and unregistered.
         """
         server = BrowserWebsocketServer()
-        mock_websocket = AsyncMock()
+        mock_websocket = make_websocket()
         server._register_client = MagicMock()
         server._unregister_client = AsyncMock()
 
@@ -53,7 +294,7 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
         Test that websockets get gracefully closed on the plugin side.
         """
         server = BrowserWebsocketServer()
-        mock_websocket = AsyncMock()
+        mock_websocket = make_websocket()
         server._ws_clients = set([mock_websocket])
 
         await server._message_receive_loop(mock_websocket)
@@ -68,7 +309,7 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
         event_handler = AsyncMock()
         server = BrowserWebsocketServer()
         server.register_event_handler(event_handler)
-        mock_websocket = AsyncMock()
+        mock_websocket = make_websocket()
 
         await server._message_receive_loop(mock_websocket)
 
@@ -81,8 +322,8 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
         """
         event_handler = AsyncMock()
         server = BrowserWebsocketServer()
-        mock_websocket_1 = AsyncMock()
-        mock_websocket_2 = AsyncMock()
+        mock_websocket_1 = make_websocket()
+        mock_websocket_2 = make_websocket()
         server.register_event_handler(event_handler)
         server._register_client(mock_websocket_1)
 
@@ -90,12 +331,40 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
 
         event_handler.on_all_browsers_disconnected.assert_not_called()
 
+    async def test_disconnection_waits_for_queued_events(self):
+        """
+        Test that state updates still queued on our dispatcher when our last
+        browser disconnects are handled before we reset our state, not after.
+        """
+        calls = []
+
+        async def on_state_changed(key, value):
+            await asyncio.sleep(0.01)
+            calls.append(("state", value))
+
+        async def on_all_browsers_disconnected():
+            calls.append(("disconnected",))
+
+        event_handler = AsyncMock(BROWSER_STATE_KEYS=("micMutedState",))
+        event_handler.on_state_changed.side_effect = on_state_changed
+        event_handler.on_all_browsers_disconnected.side_effect = on_all_browsers_disconnected
+        server = BrowserWebsocketServer(dispatcher=KeyedTaskDispatcher())
+        server.register_event_handler(event_handler)
+        mock_websocket = make_websocket()
+        mock_websocket.__aiter__.return_value = ["""{"event": "micMutedState", "muted": true}"""]
+
+        await server._message_receive_loop(mock_websocket)
+
+        self.assertEqual(calls, [("state", {"event": "micMutedState", "muted": True}), ("state", None),
+                                 ("disconnected",)])
+        self.assertIsNone(server.state_store.get("micMutedState"))
+
     async def test_socket_messages_read(self):
         """
         Test that our code reads inbound messages from websockets.
         """
         server = BrowserWebsocketServer()
-        mock_websocket = AsyncMock()
+        mock_websocket = make_websocket()
         mock_websocket.__aiter__.return_value = ["m1", "m2"]
         server._process_inbound_message = AsyncMock()
 
@@ -103,7 +372,7 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
 
         mock_websocket.__aiter__.assert_called_with()
         server._process_inbound_message.assert_has_calls(
-            [call("m1"), call("m2")])
+            [call("m1", mock_websocket), call("m2", mock_websocket)])
 
     async def test_handler_exceptions_get_caught(self):
         """
@@ -118,3 +387,230 @@ class BrowserWebsocketServerTests(IsolatedAsyncioTestCase):
             "test exception")
 
         await server._process_inbound_message("[]")
+
+    async def test_send_metrics_recorded(self):
+        """
+        Test that we record per-client send times, timeouts, and connected clients.
+        """
+        healthy_websocket = make_websocket()
+        stuck_websocket = make_websocket()
+        stuck_websocket.send.side_effect = stuck_send
+        registry = MetricsRegistry()
+        server = BrowserWebsocketServer(send_timeout_secs=0.05, metrics_registry=registry)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(healthy_websocket)
+        server._register_client(stuck_websocket)
+
+        await server.send_to_clients("test_message")
+
+        self.assertEqual(registry.get("browser_client_send_seconds").count(), 2)
+        self.assertEqual(registry.get("browser_broadcast_seconds").count(), 1)
+        self.assertEqual(registry.get("browser_send_timeouts_total").value(), 1)
+        self.assertEqual(registry.get("browser_connected_clients").value(), 2)
+
+    async def test_tab_status_recorded(self):
+        """
+        Test that hello and tabStatus messages update their client's tab status,
+        and still reach interested handlers.
+        """
+        event_handler = AsyncMock()
+        event_handler.BROWSER_EVENT_TYPES = ("tabStatus",)
+        mock_websocket = make_websocket()
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        server.register_event_handler(event_handler)
+        server._register_client(mock_websocket)
+        client = server._clients[mock_websocket]
+
+        await server._process_inbound_message(
+            """{"event": "hello", "tabId": "tab", "inCall": false, "active": false}""", mock_websocket)
+        self.assertTrue(client.reports_tab_status)
+        self.assertEqual(client.tab_id, "tab")
+        self.assertFalse(client.in_call)
+        self.assertEqual(client.last_active_at, 0)
+
+        await server._process_inbound_message(
+            """{"event": "tabStatus", "tabId": "tab", "inCall": true, "active": true}""", mock_websocket)
+        self.assertTrue(client.in_call)
+        self.assertGreater(client.last_active_at, 0)
+        event_handler.on_browser_event.assert_called_once()
+
+    async def test_message_routing_policies(self):
+        """
+        Test that messages only go to the clients their routing policy selects,
+        plus any clients that don't report their tab status.
+        """
+        legacy_websocket = make_websocket()
+        idle_websocket = make_websocket()
+        in_call_websocket = make_websocket()
+        recent_in_call_websocket = make_websocket()
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        for websocket in [legacy_websocket, idle_websocket, in_call_websocket, recent_in_call_websocket]:
+            server._register_client(websocket)
+        server._clients[idle_websocket].update_tab_status({"inCall": False, "active": True})
+        server._clients[in_call_websocket].update_tab_status({"inCall": True, "active": False})
+        server._clients[recent_in_call_websocket].update_tab_status({"inCall": True, "active": True})
+
+        await server.send_to_clients("most_recent", policy=RoutingPolicy.MOST_RECENT)
+        await server.send_to_clients("active_call_only", policy=RoutingPolicy.ACTIVE_CALL_ONLY)
+        await server.send_to_clients("broadcast")
+
+        legacy_websocket.send.assert_has_calls(
+            [call("most_recent"), call("active_call_only"), call("broadcast")])
+        idle_websocket.send.assert_has_calls([call("broadcast")])
+        in_call_websocket.send.assert_has_calls([call("active_call_only"), call("broadcast")])
+        recent_in_call_websocket.send.assert_has_calls(
+            [call("most_recent"), call("active_call_only"), call("broadcast")])
+        self.assertEqual(idle_websocket.send.call_count, 1)
+        self.assertEqual(in_call_websocket.send.call_count, 2)
+
+    async def test_unresponsive_clients_evicted_by_heartbeat(self):
+        """
+        Test that clients that stop answering heartbeats get disconnected, and
+        our handlers are told right away (and only once) that all browsers are gone.
+        """
+        event_handler = AsyncMock()
+        live_websocket = make_websocket()
+        dead_websocket = make_websocket()
+        server = BrowserWebsocketServer(heartbeat_interval_secs=0.01, heartbeat_timeout_secs=0.03)
+        server._logger = MagicMock()  # Suppress logging
+        server.register_event_handler(event_handler)
+        live_client = server._register_client(live_websocket)
+        dead_client = server._register_client(dead_websocket)
+        live_client.sends_heartbeats = True
+        dead_client.sends_heartbeats = True
+
+        heartbeat_task = asyncio.create_task(server._heartbeat_loop())
+        for _ in range(10):
+            live_client.last_heard_at = time.monotonic()
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(server.num_connected_clients(), 1)
+        dead_websocket.close.assert_called_once()
+        live_websocket.send.assert_called_with(HEARTBEAT_MESSAGE)
+        event_handler.on_all_browsers_disconnected.assert_not_called()
+
+        await asyncio.sleep(0.1)
+        heartbeat_task.cancel()
+
+        self.assertEqual(server.num_connected_clients(), 0)
+        await server._notify_if_all_disconnected()
+        event_handler.on_all_browsers_disconnected.assert_called_once_with()
+
+    async def test_all_states_request_answered(self):
+        """
+        Test that concurrent getAllStates requests share one round trip to a
+        capable client, and get its correlated reply.
+        """
+        legacy_websocket = make_websocket()
+        capable_websocket = make_websocket()
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(legacy_websocket)
+        server._register_client(capable_websocket)
+        await server._process_inbound_message(
+            """{"event": "hello", "supportedRequests": ["getAllStates"]}""", capable_websocket)
+        states = {"micMutedState": {"event": "micMutedState", "muted": True}}
+
+        requests = [asyncio.create_task(server.request_all_states()) for _ in range(3)]
+        while not capable_websocket.send.called:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        capable_websocket.send.assert_called_once()
+        request = json.loads(capable_websocket.send.call_args[0][0])
+        self.assertEqual(request["event"], "getAllStates")
+        await server._process_inbound_message(
+            json.dumps({"event": "allStates", "replyTo": request["requestId"], "states": states}),
+            capable_websocket)
+
+        self.assertEqual(await asyncio.gather(*requests), [states] * 3)
+        legacy_websocket.send.assert_not_called()
+
+        # Later answers come from our state store, kept up to date by the browser's updates.
+        self.assertEqual(await server.request_all_states(), states)
+        await server._process_inbound_message("""{"event": "micMutedState", "muted": false}""")
+        self.assertEqual(await server.request_all_states(),
+                         {"micMutedState": {"event": "micMutedState", "muted": False}})
+        capable_websocket.send.assert_called_once()
+
+        # Once every browser is gone, we have to ask again.
+        server._ws_clients.clear()
+        await server._notify_if_all_disconnected()
+        self.assertEqual(server.state_store.get("micMutedState"), None)
+        server._request_timeout_secs = 0.01
+        self.assertIsNone(await server.request_all_states())
+
+    async def test_state_follows_most_recent_tab(self):
+        """
+        Test that with two Meet tabs, our state store only takes the updates of
+        the tab our commands go to, and resyncs from the other tab once that
+        one disconnects.
+        """
+        async def answer_all_states_request(websocket, states):
+            while not websocket.send.called:
+                await asyncio.sleep(0)
+            request = json.loads(websocket.send.call_args[0][0])
+            self.assertEqual(request["event"], "getAllStates")
+            await server._process_inbound_message(
+                json.dumps({"event": "allStates", "replyTo": request["requestId"], "states": states}), websocket)
+
+        event_handler = AsyncMock(BROWSER_STATE_KEYS=("micMutedState",))
+        focused_websocket = make_websocket()
+        background_websocket = make_websocket()
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        server.register_event_handler(event_handler)
+        server._register_client(focused_websocket)
+        server._register_client(background_websocket)
+        await server._process_inbound_message(
+            """{"event": "hello", "supportedRequests": ["getAllStates"], "inCall": true, "active": true}""",
+            focused_websocket)
+        await server._process_inbound_message(
+            """{"event": "hello", "supportedRequests": ["getAllStates"], "inCall": true, "active": false}""",
+            background_websocket)
+        muted = {"event": "micMutedState", "muted": True}
+        unmuted = {"event": "micMutedState", "muted": False}
+
+        await asyncio.gather(
+            server.request_all_states(), answer_all_states_request(focused_websocket, {"micMutedState": muted}))
+        await server._process_inbound_message(json.dumps(unmuted), background_websocket)
+        self.assertEqual(await server.request_all_states(), {"micMutedState": muted})
+        background_websocket.send.assert_not_called()
+
+        # Once the focused tab is gone, the other tab's state is the one we show.
+        await server._unregister_client(focused_websocket)
+        await answer_all_states_request(background_websocket, {"micMutedState": unmuted})
+        self.assertEqual(await server.request_all_states(), {"micMutedState": unmuted})
+        event_handler.on_state_changed.assert_called_with("micMutedState", unmuted)
+        focused_websocket.send.assert_called_once()
+        background_websocket.send.assert_called_once()
+
+    async def test_requests_without_capable_clients(self):
+        """
+        Test that requests nobody can answer return None right away.
+        """
+        legacy_websocket = make_websocket()
+        server = BrowserWebsocketServer()
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(legacy_websocket)
+
+        self.assertIsNone(await server.request_all_states())
+        legacy_websocket.send.assert_not_called()
+
+    async def test_unanswered_requests_time_out(self):
+        """
+        Test that a capable client that doesn't answer in time raises a timeout,
+        rather than looking like no client is there.
+        """
+        slow_websocket = make_websocket()
+        server = BrowserWebsocketServer(request_timeout_secs=0.01)
+        server._logger = MagicMock()  # Suppress logging
+        server._register_client(slow_websocket)
+        await server._process_inbound_message(
+            """{"event": "hello", "supportedRequests": ["getAllStates"]}""", slow_websocket)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await server.request_all_states()
+        slow_websocket.send.assert_called_once()
+        self.assertEqual(server._pending_requests, {})
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from src.context_registry import ContextRegistry
+
+
+class ContextRegistryTests(TestCase):
+
+    def setUp(self):
+        self.registry = ContextRegistry()
+
+    def test_contexts_grouped_by_action(self):
+        """
+        Test that each action's buttons can be found on their own, in the order
+        they appeared.
+        """
+        self.registry.appear("mic1", "com.test.mic")
+        self.registry.appear("camera1", "com.test.camera")
+        self.registry.appear("mic2", "com.test.mic", "device", {"column": 1, "row": 0})
+
+        self.assertEqual([record.context for record in self.registry.contexts_for_action("com.test.mic")],
+                         ["mic1", "mic2"])
+        self.assertEqual([record.context for record in self.registry.contexts_for_action("com.test.camera")],
+                         ["camera1"])
+        self.assertEqual(list(self.registry.contexts_for_action("com.test.unknown")), [])
+
+        record = self.registry.get("mic2")
+        self.assertEqual((record.action, record.device, record.column, record.row),
+                         ("com.test.mic", "device", 1, 0))
+
+    def test_replayed_appearance_deduplicated(self):
+        """
+        Test that a button appearing again keeps its record, updated with
+        anything new we learn about it.
+        """
+        record = self.registry.appear("mic1", "com.test.mic")
+        record.state = "muted"
+
+        self.assertIs(self.registry.appear("mic1", "com.test.mic", "device", {"column": 3, "row": 2}), record)
+        self.assertEqual(len(self.registry), 1)
+        self.assertEqual((record.device, record.column, record.row, record.state), ("device", 3, 2, "muted"))
+
+    def test_context_moved_between_actions(self):
+        """
+        Test that a context reappearing under a different action is only listed
+        under its new one.
+        """
+        self.registry.appear("context", "com.test.mic").state = "muted"
+        record = self.registry.appear("context", "com.test.camera")
+
+        self.assertEqual(list(self.registry.contexts_for_action("com.test.mic")), [])
+        self.assertEqual(list(self.registry.contexts_for_action("com.test.camera")), [record])
+        self.assertIsNone(record.state)
+
+    def test_disappearance(self):
+        """
+        Test that disappearing buttons are forgotten, and unknown ones ignored.
+        """
+        record = self.registry.appear("mic1", "com.test.mic")
+
+        self.assertIs(self.registry.disappear("mic1"), record)
+        self.assertIsNone(self.registry.disappear("mic1"))
+        self.assertNotIn("mic1", self.registry)
+        self.assertEqual(list(self.registry.contexts_for_action("com.test.mic")), [])
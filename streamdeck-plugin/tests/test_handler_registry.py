@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from src.handler_registry import HANDLER_SPECS, HandlerSpec, LazyEventHandler, find_manifest_path, get_handler_specs
+
+
+class HandlerSpecTests(TestCase):
+
+    def test_specs_match_handler_classes(self):
+        """
+        Test that every spec loads a handler for the actions it claims to handle.
+        """
+        for spec in HANDLER_SPECS:
+            with self.subTest(spec.module_name):
+                handler_class = spec.load_class()
+                self.assertEqual(spec.action or "(invalid)", handler_class.STREAM_DECK_ACTION)
+                self.assertEqual(spec.action_prefix, handler_class.STREAM_DECK_ACTION_PREFIX)
+
+    def test_specs_cover_manifest_actions(self):
+        """
+        Test that every action in our real manifest has a handler.
+        """
+        manifest_path = find_manifest_path()
+        self.assertIsNotNone(manifest_path)
+
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            action_uuids = [action["UUID"] for action in json.load(manifest_file)["Actions"]]
+
+        for uuid in action_uuids:
+            with self.subTest(uuid):
+                self.assertTrue(any(spec.matches_any([uuid]) for spec in HANDLER_SPECS))
+
+    def test_specs_filtered_by_manifest(self):
+        """
+        Test that we only pick handlers for actions declared in the manifest.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            manifest_path = os.path.join(directory, "manifest.json")
+            with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+                json.dump({"Actions": [
+                    {"UUID": "com.chrisregado.googlemeet.togglemic"},
+                    {"UUID": "com.chrisregado.googlemeet.emojireact.heart"},
+                ]}, manifest_file)
+
+            specs = get_handler_specs(manifest_path)
+
+        self.assertEqual([spec.module_name for spec in specs],
+                         ["event_handlers.mic_toggle_event_handler", "event_handlers.emoji_react_event_handler"])
+
+    def test_unknown_manifest_actions_reported(self):
+        """
+        Test that we warn about manifest actions that have no handler.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            manifest_path = os.path.join(directory, "manifest.json")
+            with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+                json.dump({"Actions": [
+                    {"UUID": "com.chrisregado.googlemeet.togglemic"},
+                    {"UUID": "com.chrisregado.googlemeet.unknown"},
+                ]}, manifest_file)
+
+            with self.assertLogs(level="WARNING"):
+                specs = get_handler_specs(manifest_path)
+
+        self.assertEqual([spec.module_name for spec in specs], ["event_handlers.mic_toggle_event_handler"])
+
+    def test_specs_fall_back_without_manifest(self):
+        """
+        Test that we use every handler if we can't read a manifest.
+        """
+        self.assertEqual(get_handler_specs(None), list(HANDLER_SPECS))
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(get_handler_specs("/nonexistent/manifest.json"), list(HANDLER_SPECS))
+
+
+class LazyEventHandlerTests(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.handler = AsyncMock()
+        self.handler_class = MagicMock(return_value=self.handler)
+        self.spec = MagicMock(spec=HandlerSpec, module_name="module",
+                              action="com.chrisregado.googlemeet.togglemic", action_prefix=None)
+        self.spec.load_class.return_value = self.handler_class
+        self.stream_deck = AsyncMock()
+        self.browser_manager = MagicMock()
+
+        self.lazy_handler = LazyEventHandler(self.spec, self.stream_deck, self.browser_manager)
+        self.lazy_handler._logger = MagicMock()
+
+    async def test_handler_loaded_on_first_event(self):
+        """
+        Test that the real handler is only created once, on the first event.
+        """
+        self.assertEqual(self.lazy_handler.STREAM_DECK_ACTION, "com.chrisregado.googlemeet.togglemic")
+        self.spec.load_class.assert_not_called()
+
+        first_event = {"event": "willAppear", "context": "context"}
+        second_event = {"event": "keyUp", "context": "context"}
+        await self.lazy_handler.on_stream_deck_event(first_event)
+        await self.lazy_handler.on_stream_deck_event(second_event)
+
+        self.handler_class.assert_called_once_with(self.stream_deck, self.browser_manager, None)
+        self.browser_manager.register_event_handler.assert_called_once_with(self.handler)
+        self.assertEqual(self.handler.on_stream_deck_event.await_count, 2)
+        self.handler.on_stream_deck_event.assert_awaited_with(second_event)
+
+    async def test_reconnection_forwarded_once_loaded(self):
+        """
+        Test that reconnections only reach handlers that have been loaded.
+        """
+        await self.lazy_handler.on_stream_deck_reconnected()
+        self.spec.load_class.assert_not_called()
+
+        await self.lazy_handler.on_stream_deck_event({"event": "willAppear", "context": "context"})
+        await self.lazy_handler.on_stream_deck_reconnected()
+
+        self.handler.on_stream_deck_reconnected.assert_awaited_once()
@@ -0,0 +1,37 @@
+import json
+from unittest import TestCase
+
+from src import json_codec
+
+
+class JsonCodecTests(TestCase):
+
+    def test_round_trip(self):
+        """
+        Test that messages survive an encode/decode round trip, including
+        non-ASCII characters like our emoji reactions.
+        """
+        message = {"event": "emojiReact", "emojiChar": "👍", "payload": {"state": 1}}
+
+        self.assertEqual(json_codec.loads(json_codec.dumps(message)), message)
+
+    def test_encodes_text(self):
+        """
+        Test that messages are encoded as str, since our peers expect text frames.
+        """
+        self.assertIsInstance(json_codec.dumps({"event": "toggleMic"}), str)
+
+    def test_compatible_with_stdlib(self):
+        """
+        Test that our encoding decodes to the same message as the standard library's,
+        and that we can decode the standard library's output.
+        """
+        message = {"event": "setState", "context": "ctx", "payload": {"state": 2}}
+
+        self.assertEqual(json.loads(json_codec.dumps(message)), message)
+        self.assertEqual(json_codec.loads(json.dumps(message)), message)
+        self.assertEqual(json_codec.loads(json.dumps(message).encode()), message)
+
+    def test_invalid_json_raises(self):
+        with self.assertRaises(Exception):
+            json_codec.loads("{not json")
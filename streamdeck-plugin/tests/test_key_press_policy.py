@@ -0,0 +1,86 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from src.key_press_policy import KeyPressCoalescer, TokenBucket
+
+
+class TokenBucketTests(TestCase):
+
+    def test_bursts_limited_then_refilled(self):
+        """
+        Test that a full bucket allows a burst, then only allows events as fast
+        as it refills.
+        """
+        now = [0.0]
+        bucket = TokenBucket(2, 4.0, clock=lambda: now[0])
+
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [True, True, False])
+
+        now[0] += 0.25
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+        # The bucket never holds more than its capacity.
+        now[0] += 60
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [True, True, False])
+
+
+class KeyPressCoalescerTests(IsolatedAsyncioTestCase):
+
+    def _make_coalescer(self, cancel_in_pairs: bool) -> KeyPressCoalescer:
+        self.act = AsyncMock()
+        coalescer = KeyPressCoalescer(0.01, cancel_in_pairs, self.act)
+        coalescer._logger = MagicMock()  # Suppress logging
+        return coalescer
+
+    async def test_presses_merged(self):
+        """
+        Test that presses of one button within the window act once, with the
+        first press, while other buttons act independently.
+        """
+        coalescer = self._make_coalescer(cancel_in_pairs=False)
+
+        coalescer.submit("context", {"press": 1})
+        coalescer.submit("context", {"press": 2})
+        coalescer.submit("other_context", {"press": 3})
+        self.act.assert_not_called()
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.act.call_count, 2)
+        self.act.assert_any_call({"press": 1})
+        self.act.assert_any_call({"press": 3})
+
+    async def test_presses_cancel_in_pairs(self):
+        """
+        Test that an even number of presses cancels out, and an odd number acts once.
+        """
+        coalescer = self._make_coalescer(cancel_in_pairs=True)
+
+        for _ in range(2):
+            coalescer.submit("context", {"press": 1})
+        await asyncio.sleep(0.05)
+        self.act.assert_not_called()
+
+        for _ in range(3):
+            coalescer.submit("context", {"press": 1})
+        await asyncio.sleep(0.05)
+        self.act.assert_called_once_with({"press": 1})
+
+    async def test_cancel(self):
+        """
+        Test that cancelling a context drops its pending presses, but not other
+        contexts', and that it can be pressed again afterwards.
+        """
+        coalescer = self._make_coalescer(cancel_in_pairs=False)
+
+        coalescer.submit("context", {"press": 1})
+        coalescer.submit("other_context", {"press": 2})
+        coalescer.cancel("context")
+        coalescer.cancel("unknown_context")
+        await asyncio.sleep(0.05)
+        self.act.assert_called_once_with({"press": 2})
+
+        coalescer.submit("context", {"press": 3})
+        await asyncio.sleep(0.05)
+        self.act.assert_called_with({"press": 3})
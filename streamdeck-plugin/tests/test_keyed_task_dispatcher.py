@@ -0,0 +1,92 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock
+
+from src.keyed_task_dispatcher import KeyedTaskDispatcher
+
+
+class KeyedTaskDispatcherTests(IsolatedAsyncioTestCase):
+
+    async def test_same_key_runs_in_order(self):
+        """
+        Test that jobs sharing a key run one at a time, in submission order,
+        even when an earlier job is slower than a later one.
+        """
+        dispatcher = KeyedTaskDispatcher()
+        completed = []
+
+        async def slow_job():
+            await asyncio.sleep(0.01)
+            completed.append("slow")
+
+        async def fast_job():
+            completed.append("fast")
+
+        await dispatcher.submit("key", slow_job)
+        await dispatcher.submit("key", fast_job)
+        await dispatcher.join()
+
+        self.assertEqual(completed, ["slow", "fast"])
+
+    async def test_different_keys_run_concurrently(self):
+        """
+        Test that a slow job doesn't hold up jobs submitted with other keys.
+        """
+        dispatcher = KeyedTaskDispatcher()
+        slow_job_release = asyncio.Event()
+        completed = []
+
+        async def slow_job():
+            await slow_job_release.wait()
+            completed.append("slow")
+
+        async def fast_job():
+            completed.append("fast")
+            slow_job_release.set()
+
+        await dispatcher.submit("key_1", slow_job)
+        await dispatcher.submit("key_2", fast_job)
+        await asyncio.wait_for(dispatcher.join(), timeout=1)
+
+        self.assertEqual(completed, ["fast", "slow"])
+
+    async def test_in_flight_jobs_bounded(self):
+        """
+        Test that submissions wait once the maximum number of jobs are in flight.
+        """
+        dispatcher = KeyedTaskDispatcher(max_in_flight=1)
+        release = asyncio.Event()
+
+        await dispatcher.submit("key_1", release.wait)
+        second_submission = asyncio.create_task(
+            dispatcher.submit("key_2", release.wait))
+        await asyncio.sleep(0)
+
+        self.assertFalse(second_submission.done())
+        self.assertEqual(dispatcher.num_in_flight(), 1)
+
+        release.set()
+        await second_submission
+        await dispatcher.join()
+        self.assertEqual(dispatcher.num_in_flight(), 0)
+
+    async def test_job_exceptions_get_caught(self):
+        """
+        Test that a failing job is logged and doesn't stop later jobs for its key.
+        """
+        dispatcher = KeyedTaskDispatcher()
+        dispatcher._logger = MagicMock()  # Suppress logging
+        completed = []
+
+        async def failing_job():
+            raise Exception("test exception")
+
+        async def later_job():
+            completed.append("later")
+
+        await dispatcher.submit("key", failing_job)
+        await dispatcher.submit("key", later_job)
+        await dispatcher.join()
+
+        self.assertEqual(completed, ["later"])
+        dispatcher._logger.exception.assert_called_once()
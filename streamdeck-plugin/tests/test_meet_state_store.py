@@ -0,0 +1,78 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, call
+
+from src.meet_state_store import MeetStateStore
+
+MUTED = {"event": "micMutedState", "muted": True}
+UNMUTED = {"event": "micMutedState", "muted": False}
+
+
+class MeetStateStoreTests(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.store = MeetStateStore()
+        self.subscriber = AsyncMock()
+        self.store.subscribe(["micMutedState"], self.subscriber)
+
+    async def test_subscribers_notified_of_changes(self):
+        """
+        Test that subscribers are only called when a state they care about changes.
+        """
+        self.assertTrue(await self.store.update("micMutedState", MUTED))
+        self.assertFalse(await self.store.update("micMutedState", dict(MUTED)))
+        await self.store.update("cameraMutedState", MUTED)
+        await self.store.update("micMutedState", UNMUTED)
+
+        self.assertEqual(self.subscriber.call_args_list, [
+            call("micMutedState", MUTED),
+            call("micMutedState", UNMUTED),
+        ])
+
+    async def test_snapshots_versioned(self):
+        """
+        Test that snapshots are reused until something changes, and aren't
+        affected by later changes.
+        """
+        await self.store.update("micMutedState", MUTED)
+        snapshot = self.store.snapshot()
+        self.assertIs(self.store.snapshot(), snapshot)
+        self.assertEqual(snapshot.states, {"micMutedState": MUTED})
+
+        await self.store.update("micMutedState", UNMUTED)
+
+        self.assertGreater(self.store.snapshot().version, snapshot.version)
+        self.assertEqual(snapshot.states, {"micMutedState": MUTED})
+        self.assertEqual(self.store.snapshot().states, {"micMutedState": UNMUTED})
+
+    async def test_sync_and_reset(self):
+        """
+        Test that a full report clears states it leaves out, and that resetting
+        forgets every state, in one version each.
+        """
+        await self.store.update("micMutedState", MUTED)
+        version = self.store.version
+
+        await self.store.sync({"cameraMutedState": UNMUTED})
+
+        self.assertEqual(self.store.version, version + 1)
+        self.assertEqual(self.store.snapshot().states, {"micMutedState": None, "cameraMutedState": UNMUTED})
+        self.subscriber.assert_called_with("micMutedState", None)
+
+        await self.store.reset()
+
+        self.assertEqual(self.store.snapshot().states, {"micMutedState": None, "cameraMutedState": None})
+
+    async def test_subscriber_exceptions_contained(self):
+        """
+        Test that one failing subscriber doesn't stop the others being notified.
+        """
+        failing_subscriber = AsyncMock(side_effect=Exception("Subscriber failure"))
+        other_subscriber = AsyncMock()
+        store = MeetStateStore()
+        store.subscribe(["micMutedState"], failing_subscriber)
+        store.subscribe(["micMutedState"], other_subscriber)
+
+        with self.assertLogs(level="ERROR"):
+            await store.update("micMutedState", MUTED)
+
+        other_subscriber.assert_called_once_with("micMutedState", MUTED)
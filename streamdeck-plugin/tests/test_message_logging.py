@@ -0,0 +1,55 @@
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from src.message_logging import MessageLogger, TRACE
+
+
+def make_mocked_logger(level: int) -> MagicMock:
+    logger = MagicMock()
+    logger.isEnabledFor.side_effect = lambda queried_level: queried_level >= level
+    return logger
+
+
+class MessageLoggerTests(TestCase):
+
+    def test_nothing_logged_when_disabled(self):
+        """
+        Test that messages aren't logged (or formatted) when INFO is disabled.
+        """
+        logger = make_mocked_logger(logging.WARNING)
+        message_logger = MessageLogger(logger)
+
+        message_logger.log_message("Test message.", "payload")
+
+        logger.info.assert_not_called()
+        logger.log.assert_not_called()
+
+    def test_info_payload_truncated(self):
+        """
+        Test that long messages are truncated at INFO level.
+        """
+        logger = make_mocked_logger(logging.INFO)
+        message_logger = MessageLogger(logger, max_payload_chars=4)
+
+        message_logger.log_message("Test message.", "123456789")
+
+        logger.info.assert_called_once_with(
+            "%s Message: %s", "Test message.", "1234... (5 more)")
+
+    def test_trace_logs_full_payload_sampled(self):
+        """
+        Test that full messages are logged at TRACE level for every Nth message,
+        and that the others fall back to INFO level.
+        """
+        logger = make_mocked_logger(TRACE)
+        message_logger = MessageLogger(
+            logger, max_payload_chars=4, trace_sample_interval=2)
+
+        message_logger.log_message("Test message.", "123456789")
+        message_logger.log_message("Test message.", "123456789")
+
+        logger.info.assert_called_once_with(
+            "%s Message: %s", "Test message.", "1234... (5 more)")
+        logger.log.assert_called_once_with(
+            TRACE, "%s Message: %s", "Test message.", "123456789")
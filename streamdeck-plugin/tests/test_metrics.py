@@ -0,0 +1,90 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from src.metrics import DISABLED, MetricsRegistry
+
+
+class MetricsRegistryTests(TestCase):
+
+    def test_counters_by_label(self):
+        """
+        Test that counters count separately for each label value.
+        """
+        registry = MetricsRegistry()
+        counter = registry.counter("exceptions_total", "Exceptions.", "action")
+
+        counter.inc(label="mic")
+        counter.inc(label="mic")
+        counter.inc(label="camera")
+
+        self.assertIs(registry.counter("exceptions_total", "Exceptions.", "action"), counter)
+        self.assertEqual(counter.value("mic"), 2)
+        self.assertEqual(counter.value("camera"), 1)
+        self.assertEqual(counter.value("other"), 0)
+
+    def test_histogram_rendering(self):
+        """
+        Test that histograms count observations in cumulative buckets.
+        """
+        registry = MetricsRegistry()
+        histogram = registry.histogram("dispatch_seconds", "Dispatch time.", "action", buckets=(0.01, 0.1))
+
+        histogram.observe(0.005, "mic")
+        histogram.observe(0.05, "mic")
+        histogram.observe(5, "mic")
+
+        self.assertEqual(histogram.count("mic"), 3)
+        text = registry.render_text()
+        self.assertIn("# TYPE dispatch_seconds histogram", text)
+        self.assertIn('dispatch_seconds_bucket{action="mic",le="0.01"} 1', text)
+        self.assertIn('dispatch_seconds_bucket{action="mic",le="0.1"} 2', text)
+        self.assertIn('dispatch_seconds_bucket{action="mic",le="+Inf"} 3', text)
+        self.assertIn('dispatch_seconds_count{action="mic"} 3', text)
+
+    def test_gauge_callbacks_read_on_render(self):
+        """
+        Test that gauges with callbacks are read when they're collected.
+        """
+        registry = MetricsRegistry()
+        queue = [1, 2]
+        registry.gauge("queue_depth", "Queue depth.", lambda: len(queue))
+
+        queue.append(3)
+
+        self.assertIn("queue_depth 3", registry.render_text())
+
+    def test_disabled_registry_records_nothing(self):
+        """
+        Test that metrics from the disabled registry do nothing.
+        """
+        DISABLED.counter("exceptions_total", "Exceptions.").inc()
+        DISABLED.histogram("dispatch_seconds", "Dispatch time.").observe(1)
+        DISABLED.gauge("queue_depth", "Queue depth.", lambda: 1).set(2)
+
+        self.assertFalse(DISABLED.enabled)
+        self.assertIsNone(DISABLED.get("exceptions_total"))
+        self.assertEqual(DISABLED.render_text(), "\n")
+
+
+class MetricsHttpServerTests(IsolatedAsyncioTestCase):
+
+    async def test_metrics_served_over_http(self):
+        """
+        Test that our metrics are served on 127.0.0.1.
+        """
+        registry = MetricsRegistry()
+        registry.counter("reconnects_total", "Reconnects.").inc()
+        server = await registry.start_http_server(0)
+        port = server.sockets[0].getsockname()[1]
+
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode()
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertIn("reconnects_total 1", response)
@@ -0,0 +1,56 @@
+import json
+from unittest import TestCase
+
+from src.outbound_messages import SetStateMessageCache, make_simple_event
+
+
+class OutboundMessagesTests(TestCase):
+
+    def test_simple_event_serialized_once(self):
+        """
+        Test that simple events are serialized correctly and then reused.
+        """
+        message = make_simple_event("toggleMic")
+
+        self.assertEqual(json.loads(message), {"event": "toggleMic"})
+        self.assertIs(make_simple_event("toggleMic"), message)
+
+    def test_set_state_messages_cached(self):
+        """
+        Test that setState messages are serialized correctly and then reused.
+        """
+        cache = SetStateMessageCache()
+
+        message = cache.get("context", 2)
+
+        self.assertEqual(json.loads(message), {
+            "event": "setState",
+            "context": "context",
+            "payload": {"state": 2}
+        })
+        self.assertIs(cache.get("context", 2), message)
+
+    def test_evicted_context_reserialized(self):
+        """
+        Test that evicting a context drops its cached messages.
+        """
+        cache = SetStateMessageCache()
+        message = cache.get("context", 1)
+
+        cache.evict_context("context")
+
+        self.assertIsNot(cache.get("context", 1), message)
+
+    def test_least_recently_used_context_evicted(self):
+        """
+        Test that the cache stays bounded by evicting its least recently used context.
+        """
+        cache = SetStateMessageCache(max_contexts=2)
+        first_message = cache.get("first", 1)
+        second_message = cache.get("second", 1)
+        cache.get("first", 1)
+
+        cache.get("third", 1)
+
+        self.assertIs(cache.get("first", 1), first_message)
+        self.assertIsNot(cache.get("second", 1), second_message)
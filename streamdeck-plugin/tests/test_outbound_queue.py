@@ -0,0 +1,67 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from src.outbound_queue import OUTBOUND_PRIORITY, outbound_priority, OutboundMessage, OutboundPriority, OutboundQueue
+
+
+def make_message(message: str, priority=OutboundPriority.NORMAL, supersede_key=None) -> OutboundMessage:
+    return OutboundMessage(message, priority, supersede_key, 0.0, written=message + " written")
+
+
+class OutboundQueueTests(TestCase):
+
+    def setUp(self):
+        self.queue = OutboundQueue()
+
+    def test_popped_by_priority_then_order(self):
+        self.queue.put(make_message("normal1"))
+        self.queue.put(make_message("press1", OutboundPriority.KEY_PRESS))
+        self.queue.put(make_message("normal2"))
+        self.queue.put(make_message("press2", OutboundPriority.KEY_PRESS))
+
+        self.assertEqual(len(self.queue), 4)
+        self.assertEqual([self.queue.pop().message for _ in range(4)], ["press1", "press2", "normal1", "normal2"])
+        self.assertEqual(len(self.queue), 0)
+        with self.assertRaises(IndexError):
+            self.queue.pop()
+
+    def test_superseded_messages_replaced(self):
+        """
+        Test that a message replaces the queued one with the same key, keeping
+        its future and the more urgent priority.
+        """
+        old = make_message("old", OutboundPriority.KEY_PRESS, "button")
+        self.queue.put(old)
+        self.queue.put(make_message("other"))
+        new = make_message("new", supersede_key="button")
+
+        self.assertIs(self.queue.put(new), old)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(new.written, "old written")
+        self.assertEqual(new.priority, OutboundPriority.KEY_PRESS)
+        self.assertEqual([message.message for message in self.queue.pop_all()], ["new", "other"])
+
+        # Once written, a message can't be superseded.
+        self.queue.put(make_message("first", supersede_key="button"))
+        self.queue.pop()
+        self.assertIsNone(self.queue.put(make_message("second", supersede_key="button")))
+        self.assertEqual(self.queue.pop().message, "second")
+
+
+class OutboundPriorityTests(IsolatedAsyncioTestCase):
+
+    async def test_priority_raised_within_block(self):
+        """
+        Test that outbound_priority applies to everything sent within its block,
+        including from tasks started there, and is restored afterwards.
+        """
+        self.assertEqual(OUTBOUND_PRIORITY.get(), OutboundPriority.NORMAL)
+        async def get_priority():
+            return OUTBOUND_PRIORITY.get()
+
+        self.assertEqual(OUTBOUND_PRIORITY.get(), OutboundPriority.NORMAL)
+        with outbound_priority(OutboundPriority.KEY_PRESS):
+            self.assertEqual(OUTBOUND_PRIORITY.get(), OutboundPriority.KEY_PRESS)
+            task = asyncio.create_task(get_priority())
+        self.assertEqual(OUTBOUND_PRIORITY.get(), OutboundPriority.NORMAL)
+        self.assertEqual(await task, OutboundPriority.KEY_PRESS)
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase
+
+from src.startup_timing import StartupTimer
+
+
+class StartupTimerTests(TestCase):
+
+    def setUp(self):
+        self.timer = StartupTimer()
+
+    def tearDown(self):
+        self.timer.uninstall_import_hook()
+
+    def test_milestones_recorded_once(self):
+        """
+        Test that only the first time we reach a milestone is recorded.
+        """
+        self.assertTrue(self.timer.mark("registered"))
+        first_time = self.timer.milestones["registered"]
+        self.assertFalse(self.timer.mark("registered"))
+
+        self.assertEqual(self.timer.milestones["registered"], first_time)
+        self.assertIn("registered:", self.timer.format_report())
+
+    def test_nested_imports_timed(self):
+        """
+        Test that imports are timed with their nesting, like `-X importtime`.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "timing_outer.py"), "w") as module_file:
+                module_file.write("import timing_inner\n")
+            with open(os.path.join(directory, "timing_inner.py"), "w") as module_file:
+                module_file.write("VALUE = 1\n")
+
+            sys.path.insert(0, directory)
+            self.timer.install_import_hook()
+            try:
+                import timing_outer
+            finally:
+                self.timer.uninstall_import_hook()
+                sys.path.remove(directory)
+                sys.modules.pop("timing_outer", None)
+                sys.modules.pop("timing_inner", None)
+
+        self.assertEqual([(timing.module_name, timing.depth) for timing in self.timer.imports],
+                         [("timing_inner", 1), ("timing_outer", 0)])
+        inner, outer = self.timer.imports
+        self.assertGreaterEqual(outer.cumulative_secs, inner.cumulative_secs)
+        self.assertAlmostEqual(outer.self_secs, outer.cumulative_secs - inner.cumulative_secs)
+
+        # The module shouldn't be able to tell it was timed.
+        self.assertNotIn("Timing", type(timing_outer.__loader__).__name__)
+        self.assertIn("timing_outer", self.timer.format_report())
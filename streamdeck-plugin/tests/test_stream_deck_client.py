@@ -1,7 +1,11 @@
+import asyncio
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import AsyncMock, MagicMock, call, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, call, patch
 import websockets
 
+from src.keyed_task_dispatcher import KeyedTaskDispatcher
+from src.metrics import MetricsRegistry
+from src.outbound_queue import OutboundPriority
 from src.stream_deck_client import StreamDeckWebsocketClient
 
 
@@ -15,16 +19,80 @@ class StreamDeckWebsocketClientTests(IsolatedAsyncioTestCase):
         """
         sd_client = StreamDeckWebsocketClient()
         sd_client._logger = MagicMock()  # Suppress logging
-        sd_client.send_outbound_message = AsyncMock()
+        mock_websocket = websocket_connect_mock.return_value
 
         await sd_client.start(1111, "registerEvent", "test_uuid")
 
         websocket_connect_mock.assert_called_with("ws://127.0.0.1:1111")
-        sd_client.send_outbound_message.assert_called_once()
-        outbound_call = sd_client.send_outbound_message.call_args[0][0]
+        mock_websocket.send.assert_called_once()
+        outbound_call = mock_websocket.send.call_args[0][0]
         self.assertIn("registerEvent", outbound_call)
         self.assertIn("test_uuid", outbound_call)
 
+    @patch("websockets.connect", new_callable=AsyncMock)
+    async def test_reconnects_after_disconnection(self, websocket_connect_mock):
+        """
+        Tests that we reconnect and re-register after our connection drops, and
+        notify our handlers once we're reconnected.
+        """
+        event_handler = AsyncMock()
+        mock_websockets = [AsyncMock(), AsyncMock()]
+        websocket_connect_mock.side_effect = mock_websockets + [OSError(), OSError()]
+        sd_client = StreamDeckWebsocketClient(
+            max_reconnect_attempts=2, reconnect_base_delay_secs=0)
+        sd_client._logger = MagicMock()  # Suppress logging
+        sd_client.register_event_handler(event_handler)
+
+        await sd_client.start(1111, "registerEvent", "test_uuid")
+
+        self.assertEqual(websocket_connect_mock.call_count, 4)
+        for mock_websocket in mock_websockets:
+            mock_websocket.send.assert_called_once()
+        event_handler.on_stream_deck_reconnected.assert_called_once_with()
+
+    async def test_messages_buffered_while_disconnected(self):
+        """
+        Tests that outbound messages sent while we're reconnecting are delivered,
+        in order, once we've re-registered, and that the oldest are dropped once
+        our buffer is full.
+        """
+        sd_client = StreamDeckWebsocketClient(
+            max_reconnect_attempts=1, max_buffered_messages=2)
+        sd_client._logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+
+        await sd_client.send_outbound_message("m1")
+        await sd_client.send_outbound_message("m2")
+        await sd_client.send_outbound_message("m3")
+        await sd_client._run_connection(mock_websocket, "registration")
+
+        mock_websocket.send.assert_has_calls(
+            [call("registration"), call("m2"), call("m3")])
+        self.assertEqual(mock_websocket.send.call_count, 3)
+
+    async def test_registration_written_before_anything_else(self):
+        """
+        Tests that nothing sent while we register, however urgent, is written
+        before our registration or the messages we buffered while disconnected.
+        """
+        sd_client = StreamDeckWebsocketClient(max_reconnect_attempts=1, batch_window_secs=0)
+        sd_client._logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+
+        async def slow_send(message):
+            await asyncio.sleep(0)
+
+        mock_websocket.send.side_effect = slow_send
+        await sd_client.send_outbound_message("buffered")
+
+        connection = asyncio.create_task(sd_client._run_connection(mock_websocket, "registration"))
+        await asyncio.sleep(0)
+        await sd_client.send_outbound_message("pressed", priority=OutboundPriority.KEY_PRESS)
+        await connection
+
+        self.assertEqual(mock_websocket.send.call_args_list,
+                         [call("registration"), call("buffered"), call("pressed")])
+
     async def test_handler_registration(self):
         """
         Test that registered EventHandlers receive callbacks on new events.
@@ -38,6 +106,77 @@ class StreamDeckWebsocketClientTests(IsolatedAsyncioTestCase):
         event_handler.on_stream_deck_event.assert_called_with(
             {"event": "sampleEvent"})
 
+    async def test_events_only_dispatched_to_matching_handlers(self):
+        """
+        Test that handlers declaring an action only receive events for that
+        action, while handlers without an action receive everything.
+        """
+        mic_handler = AsyncMock(
+            STREAM_DECK_ACTION="com.test.mic", STREAM_DECK_ACTION_PREFIX=None)
+        emoji_handler = AsyncMock(
+            STREAM_DECK_ACTION="(invalid)", STREAM_DECK_ACTION_PREFIX="com.test.emoji.")
+        catch_all_handler = AsyncMock()
+        sd_client = StreamDeckWebsocketClient()
+        sd_client.register_event_handler(mic_handler)
+        sd_client.register_event_handler(emoji_handler)
+        sd_client.register_event_handler(catch_all_handler)
+
+        await sd_client._process_inbound_message(
+            """{"event":"keyUp","action":"com.test.emoji.thumbsup","context":"ctx"}""")
+
+        expected_event = {"event": "keyUp", "action": "com.test.emoji.thumbsup", "context": "ctx"}
+        mic_handler.on_stream_deck_event.assert_not_called()
+        emoji_handler.on_stream_deck_event.assert_called_once_with(expected_event)
+        catch_all_handler.on_stream_deck_event.assert_called_once_with(expected_event)
+
+    async def test_concurrent_dispatch(self):
+        """
+        Test that events are handed to the dispatcher, keyed by their action and
+        context, when one is configured.
+        """
+        event_handler = AsyncMock()
+        dispatcher = KeyedTaskDispatcher()
+        sd_client = StreamDeckWebsocketClient(dispatcher=dispatcher)
+        sd_client.register_event_handler(event_handler)
+
+        await sd_client._process_inbound_message(
+            """{"event":"keyUp","action":"com.test.action","context":"ctx"}""")
+        await dispatcher.join()
+
+        event_handler.on_stream_deck_event.assert_called_once_with(
+            {"event": "keyUp", "action": "com.test.action", "context": "ctx"})
+
+    async def test_action_events_decoded_to_typed_events(self):
+        """
+        Test that the events our handlers act on are validated and decoded into
+        StreamDeckActionEvents.
+        """
+        event_handler = AsyncMock()
+        sd_client = StreamDeckWebsocketClient()
+        sd_client.register_event_handler(event_handler)
+
+        await sd_client._process_inbound_message(
+            """{"event":"willAppear","action":"com.test.action","context":"ctx","device":"dev"}""")
+
+        received_event = event_handler.on_stream_deck_event.call_args[0][0]
+        self.assertNotIsInstance(received_event, dict)
+        self.assertEqual(received_event.context, "ctx")
+        self.assertEqual(received_event.get("device"), "dev")
+
+    async def test_malformed_action_events_dropped(self):
+        """
+        Test that action events failing validation are logged and not dispatched.
+        """
+        event_handler = AsyncMock()
+        sd_client = StreamDeckWebsocketClient()
+        sd_client._logger = MagicMock()  # Suppress logging
+        sd_client.register_event_handler(event_handler)
+
+        await sd_client._process_inbound_message(
+            """{"event":"keyUp","action":"com.test.action"}""")
+
+        event_handler.on_stream_deck_event.assert_not_called()
+
     async def test_outbound_message(self):
         """
         Test that outbound messages get sent over the Stream Deck websocket.
@@ -78,3 +217,105 @@ class StreamDeckWebsocketClientTests(IsolatedAsyncioTestCase):
             "test exception")
 
         await sd_client._process_inbound_message("[]")
+
+    async def test_dispatch_metrics_recorded(self):
+        """
+        Test that we record dispatch times and handler exceptions by action.
+        """
+        event_handler = AsyncMock()
+        event_handler.STREAM_DECK_ACTION = "action"
+        event_handler.on_stream_deck_event.side_effect = Exception("test exception")
+        registry = MetricsRegistry()
+        sd_client = StreamDeckWebsocketClient(metrics_registry=registry)
+        sd_client._logger = MagicMock()  # Suppress logging
+        sd_client.register_event_handler(event_handler)
+
+        await sd_client._process_inbound_message(
+            '{"event": "keyUp", "action": "action", "context": "context"}')
+
+        self.assertEqual(registry.get("streamdeck_dispatch_seconds").count("action"), 1)
+        self.assertEqual(registry.get("streamdeck_handler_exceptions_total").value("action"), 1)
+
+    async def test_outbound_messages_batched(self):
+        """
+        Test that messages sent together are written in order, in one flush of
+        our writer task, and that senders wait until their messages are written.
+        """
+        registry = MetricsRegistry()
+        sd_client = StreamDeckWebsocketClient(batch_window_secs=0, metrics_registry=registry)
+        sd_client._message_logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+        sd_client._websocket = mock_websocket
+
+        await asyncio.gather(*[sd_client.send_outbound_message(message) for message in ["m1", "m2", "m3"]])
+
+        self.assertEqual(mock_websocket.send.call_args_list, [call("m1"), call("m2"), call("m3")])
+        sd_client._message_logger.log_messages.assert_called_once_with(ANY, ["m1", "m2", "m3"])
+        self.assertEqual(registry.get("streamdeck_outbound_batch_size").count(), 1)
+
+    async def test_queued_messages_prioritized_and_superseded(self):
+        """
+        Test that key press feedback is written ahead of other queued messages, and
+        that a queued message is replaced by a newer one with the same supersede key.
+        """
+        sd_client = StreamDeckWebsocketClient(batch_window_secs=0)
+        sd_client._message_logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+        sd_client._websocket = mock_websocket
+
+        await asyncio.gather(
+            sd_client.send_outbound_message("old state", supersede_key="button"),
+            sd_client.send_outbound_message("other"),
+            sd_client.send_outbound_message("feedback", priority=OutboundPriority.KEY_PRESS),
+            sd_client.send_outbound_message("new state", supersede_key="button"))
+
+        self.assertEqual(mock_websocket.send.call_args_list, [call("feedback"), call("other"), call("new state")])
+
+    async def test_outbound_batch_buffered_on_disconnection(self):
+        """
+        Test that a batch whose connection drops before it's written is buffered
+        for our next connection.
+        """
+        sd_client = StreamDeckWebsocketClient(max_reconnect_attempts=1, batch_window_secs=60)
+        sd_client._logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+        sd_client._websocket = mock_websocket
+
+        send_task = asyncio.create_task(sd_client.send_outbound_message("m1"))
+        await asyncio.sleep(0)
+        sd_client._websocket = None
+        sd_client._abandon_outbound_queue()
+        await send_task
+
+        mock_websocket.send.assert_not_called()
+        self.assertEqual(list(sd_client._buffered_messages), ["m1"])
+
+    async def test_partly_written_batch_buffered_on_disconnection(self):
+        """
+        Test that when our connection drops partway through writing a batch, only
+        what wasn't written is buffered, ahead of anything queued behind it.
+        """
+        sd_client = StreamDeckWebsocketClient(max_reconnect_attempts=1, batch_window_secs=0)
+        sd_client._logger = MagicMock()  # Suppress logging
+        mock_websocket = AsyncMock()
+        sd_client._websocket = mock_websocket
+        disconnected = asyncio.Event()
+
+        async def send(message):
+            if message == "m2":
+                await disconnected.wait()
+                raise websockets.ConnectionClosed(None, None)
+
+        mock_websocket.send.side_effect = send
+        batch = asyncio.gather(*[sd_client.send_outbound_message(message) for message in ["m1", "m2", "m3"]])
+        while mock_websocket.send.call_count < 2:
+            await asyncio.sleep(0)
+        queued = asyncio.create_task(sd_client.send_outbound_message("m4"))
+        await asyncio.sleep(0)
+        sd_client._websocket = None
+        sd_client._abandon_outbound_queue()
+        disconnected.set()
+        await asyncio.gather(batch, queued)
+
+        self.assertEqual(mock_websocket.send.call_args_list, [call("m1"), call("m2")])
+        self.assertEqual(list(sd_client._buffered_messages), ["m2", "m3", "m4"])
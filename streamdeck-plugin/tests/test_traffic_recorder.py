@@ -0,0 +1,90 @@
+import os
+import tempfile
+import zlib
+from unittest import TestCase
+
+from src.traffic_recorder import INBOUND, OUTBOUND, SESSION, TrafficRecord, TrafficRecorder, read_records
+
+
+class TrafficRecorderTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "traffic.ndjson")
+        self.now = 100.0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _make_recorder(self, **kwargs) -> TrafficRecorder:
+        recorder = TrafficRecorder(self.path, clock=lambda: self.now, **kwargs)
+        self.addCleanup(recorder.close)
+        return recorder
+
+    def test_frames_recorded(self):
+        """
+        Test that frames are recorded with their timing and connection, after a
+        session marker.
+        """
+        recorder = self._make_recorder()
+        self.now += 0.5
+        recorder.record("streamdeck", INBOUND, 1, '{"event":"keyUp"}')
+        self.now += 0.25
+        recorder.record("browser", OUTBOUND, 2, '{"event":"toggleMic"}')
+        recorder.close()
+
+        self.assertEqual(list(read_records(self.path)), [
+            TrafficRecord(0.0, "", SESSION, 0, None),
+            TrafficRecord(0.5, "streamdeck", INBOUND, 1, '{"event":"keyUp"}'),
+            TrafficRecord(0.75, "browser", OUTBOUND, 2, '{"event":"toggleMic"}'),
+        ])
+
+    def test_binary_frames_recorded_exactly(self):
+        """
+        Test that binary frames, e.g. compressed ones, are read back byte for byte.
+        """
+        frame = zlib.compress(b'[{"e":3}]' * 100)[2:-4]
+        recorder = self._make_recorder()
+        recorder.record("browser", OUTBOUND, 1, frame)
+        recorder.close()
+
+        self.assertEqual(list(read_records(self.path))[-1], TrafficRecord(0.0, "browser", OUTBOUND, 1, frame))
+
+    def test_records_flushed_periodically(self):
+        """
+        Test that records are buffered, and flushed once our flush interval passes.
+        """
+        recorder = self._make_recorder(flush_interval_secs=1.0)
+        recorder.record("browser", INBOUND, 1, '{"event":"first"}')
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+        self.now += 1.0
+        recorder.record("browser", INBOUND, 1, '{"event":"second"}')
+        self.assertEqual([record.message for record in read_records(self.path)],
+                         [None, '{"event":"first"}', '{"event":"second"}'])
+
+    def test_log_rotated(self):
+        """
+        Test that the log is rotated once it's full, keeping a bounded number of
+        old files, which are read back oldest first.
+        """
+        recorder = self._make_recorder(max_bytes=200, backup_count=2)
+        for index in range(20):
+            recorder.record("browser", INBOUND, 1, f'{{"event":"message{index}"}}')
+        recorder.close()
+
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        for file_path in [self.path, self.path + ".1", self.path + ".2"]:
+            self.assertLessEqual(os.path.getsize(file_path), 200)
+
+        indices = [int(record.message[len('{"event":"message'):-2])
+                   for record in read_records(self.path) if record.kind == INBOUND]
+        self.assertEqual(indices, list(range(20 - len(indices), 20)))
+
+    def test_backups_required(self):
+        """
+        Test that we refuse to rotate without a backup, which would just truncate the log.
+        """
+        with self.assertRaises(ValueError):
+            TrafficRecorder(self.path, backup_count=0)